@@ -1,8 +1,11 @@
 from django.contrib import admin
+from django.utils import timezone
 from .models import (
     Cruce, Sensor, Telemetria, BarrierEvent, Alerta,
     UserProfile, UserNotificationSettings,
-    MantenimientoPreventivo, HistorialMantenimiento, MetricasDesempeno
+    MantenimientoPreventivo, HistorialMantenimiento, MetricasDesempeno,
+    TareaAsincrona, CruceEstadoActual, TrabajoExportacion, AcumuladoDiario,
+    TelemetriaMinuto, TelemetriaHora, ArchivoTelemetria
 )
 
 
@@ -49,6 +52,15 @@ class BarrierEventAdmin(admin.ModelAdmin):
     readonly_fields = ('event_time',)
 
 
+@admin.register(CruceEstadoActual)
+class CruceEstadoActualAdmin(admin.ModelAdmin):
+    """Admin para el último estado de cada cruce (solo lectura, lo mantiene la ingesta)"""
+    list_display = ('cruce', 'timestamp', 'barrier_status', 'battery_voltage', 'alertas_activas', 'ultimo_evento')
+    list_filter = ('barrier_status',)
+    search_fields = ('cruce__nombre',)
+    readonly_fields = ('updated_at',)
+
+
 @admin.register(Alerta)
 class AlertaAdmin(admin.ModelAdmin):
     """Admin para alertas"""
@@ -162,3 +174,57 @@ class MetricasDesempenoAdmin(admin.ModelAdmin):
             'fields': ('created_at', 'updated_at')
         }),
     )
+
+
+@admin.register(AcumuladoDiario)
+class AcumuladoDiarioAdmin(admin.ModelAdmin):
+    """Admin para los acumulados de métricas del día en curso"""
+    list_display = ('cruce', 'fecha', 'total_telemetrias', 'voltaje_minimo', 'total_eventos_barrera', 'updated_at')
+    list_filter = ('fecha',)
+    search_fields = ('cruce__nombre',)
+    readonly_fields = ('updated_at',)
+
+
+@admin.register(TelemetriaMinuto, TelemetriaHora)
+class ResumenTelemetriaAdmin(admin.ModelAdmin):
+    """Admin (solo lectura) para los resúmenes de telemetría"""
+    list_display = ('cruce', 'inicio', 'lecturas', 'battery_voltage_min', 'barrier_voltage_avg', 'lecturas_barrera_abajo')
+    list_filter = ('cruce',)
+    date_hierarchy = 'inicio'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ArchivoTelemetria)
+class ArchivoTelemetriaAdmin(admin.ModelAdmin):
+    """Admin para los archivos de telemetría cruda"""
+    list_display = ('cruce', 'mes', 'filas', 'tamano_bytes', 'desde', 'hasta', 'updated_at')
+    list_filter = ('mes',)
+    search_fields = ('cruce__nombre',)
+    readonly_fields = ('archivo', 'filas', 'ultimo_id', 'tamano_bytes', 'desde', 'hasta', 'created_at', 'updated_at')
+
+
+@admin.register(TareaAsincrona)
+class TareaAsincronaAdmin(admin.ModelAdmin):
+    """Admin para la cola de tareas asíncronas"""
+    list_display = ('id', 'tipo', 'estado', 'intentos', 'disponible_en', 'created_at')
+    list_filter = ('estado', 'tipo')
+    readonly_fields = ('created_at', 'updated_at')
+    actions = ['reintentar']
+
+    @admin.action(description='Reintentar tareas seleccionadas')
+    def reintentar(self, request, queryset):
+        total = queryset.update(estado='PENDIENTE', intentos=0, disponible_en=timezone.now())
+        self.message_user(request, f'{total} tareas reencoladas')
+
+
+@admin.register(TrabajoExportacion)
+class TrabajoExportacionAdmin(admin.ModelAdmin):
+    """Admin para exportaciones en segundo plano"""
+    list_display = ('id', 'tipo', 'formato', 'estado', 'usuario', 'filas', 'tamano_bytes', 'created_at')
+    list_filter = ('estado', 'tipo', 'formato')
+    readonly_fields = ('archivo', 'filas', 'tamano_bytes', 'error', 'completado_at', 'created_at', 'updated_at')
@@ -0,0 +1,220 @@
+"""
+Archivo de la telemetría cruda antigua.
+
+El comando archivar_telemetria mueve las lecturas de meses completos más
+antiguos que TELEMETRIA_RETENCION_DIAS a un CSV comprimido con gzip por cruce
+y mes (ARCHIVO_TELEMETRIA_DIR/<cruce_id>/<YYYY-MM>.csv.gz) y las elimina de la
+tabla en lotes. Solo se archivan lecturas ya incluidas en los resúmenes por
+minuto/hora (resumir_telemetria), que siguen sirviendo los gráficos.
+
+Si llegan lecturas atrasadas de un mes ya archivado, la siguiente corrida las
+agrega al mismo archivo como un nuevo miembro gzip. ArchivoTelemetria.ultimo_id
+marca hasta dónde se archivó: si una corrida se interrumpe después de
+registrar el archivo, la siguiente solo elimina esas filas, sin archivarlas
+dos veces.
+
+Las exportaciones de telemetría incluyen las filas archivadas del rango pedido
+(ver filas_archivadas).
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Min
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from datetime import datetime, timedelta
+import csv
+import gzip
+import logging
+import os
+
+from .models import Telemetria, ArchivoTelemetria, ProgresoResumen
+
+logger = logging.getLogger(__name__)
+
+# Columnas del archivo: todos los campos de Telemetria (attname)
+CAMPOS = [campo.attname for campo in Telemetria._meta.concrete_fields]
+
+
+class ResumenesPendientes(Exception):
+	"""Hay lecturas a archivar que todavía no están en los resúmenes"""
+
+
+def _directorio():
+	return getattr(settings, 'ARCHIVO_TELEMETRIA_DIR', os.path.join(settings.BASE_DIR, 'archivo_telemetria'))
+
+
+def ruta_archivo(cruce_id, mes):
+	return os.path.join(_directorio(), str(cruce_id), f'{mes:%Y-%m}.csv.gz')
+
+
+def limite_retencion(dias=None, ahora=None):
+	"""Inicio del mes (hora local) de la fecha límite: se archiva lo anterior"""
+	if dias is None:
+		dias = getattr(settings, 'TELEMETRIA_RETENCION_DIAS', 90)
+	fecha = timezone.localdate((ahora or timezone.now()) - timedelta(days=dias))
+	return timezone.make_aware(datetime(fecha.year, fecha.month, 1))
+
+
+def pendientes(limite, cruce_id=None):
+	"""
+	(cruce, mes) con lecturas anteriores a `limite`.
+
+	Returns:
+		list: dicts con cruce_id, mes, filas y maximo_id
+	"""
+	telemetrias = Telemetria.objects.filter(timestamp__lt=limite)
+	if cruce_id:
+		telemetrias = telemetrias.filter(cruce_id=cruce_id)
+	return list(
+		telemetrias.annotate(mes=TruncMonth('timestamp'))
+		.values('cruce_id', 'mes').annotate(filas=Count('id'), maximo_id=Max('id'))
+		.order_by('cruce_id', 'mes')
+	)
+
+
+def verificar_resumenes(unidades):
+	"""
+	Raises:
+		ResumenesPendientes: si alguna lectura a archivar no fue resumida
+	"""
+	progreso = ProgresoResumen.objects.filter(nombre='telemetria').values_list('ultimo_id', flat=True).first() or 0
+	maximo = max((unidad['maximo_id'] for unidad in unidades), default=0)
+	if maximo > progreso:
+		raise ResumenesPendientes(
+			f'Hay lecturas sin resumir (id {maximo} > {progreso}): ejecute resumir_telemetria antes de archivar'
+		)
+
+
+def _valor(valor):
+	if valor is None:
+		return ''
+	if isinstance(valor, datetime):
+		return valor.isoformat()
+	return valor
+
+
+def _escribir_miembro(ruta, filas, con_encabezado):
+	"""Escribir `filas` como un miembro gzip en `ruta` (nuevo archivo)"""
+	contador = 0
+	with gzip.open(ruta, 'wt', encoding='utf-8', newline='') as archivo:
+		writer = csv.writer(archivo)
+		if con_encabezado:
+			writer.writerow(CAMPOS)
+		for fila in filas:
+			writer.writerow([_valor(valor) for valor in fila])
+			contador += 1
+	return contador
+
+
+def archivar(cruce_id, mes, limite, lote=5000):
+	"""
+	Archivar las lecturas de (cruce, mes) anteriores a `limite` y eliminarlas
+	de la tabla en lotes de `lote` filas.
+
+	Returns:
+		tuple: (filas archivadas, filas eliminadas)
+	"""
+	inicio_mes = timezone.localtime(mes)
+	registro, _ = ArchivoTelemetria.objects.get_or_create(
+		cruce_id=cruce_id, mes=inicio_mes.date(),
+		defaults={'archivo': ruta_archivo(cruce_id, inicio_mes)}
+	)
+	siguiente = (inicio_mes + timedelta(days=32)).replace(day=1)
+	telemetrias = Telemetria.objects.filter(
+		cruce_id=cruce_id, timestamp__gte=inicio_mes, timestamp__lt=min(siguiente, limite)
+	)
+
+	# Lecturas nuevas del mes (id mayor al último archivado): un miembro gzip más
+	nuevas = telemetrias.filter(id__gt=registro.ultimo_id)
+	resumen = nuevas.aggregate(maximo_id=Max('id'))
+	archivadas = 0
+	if resumen['maximo_id'] is not None:
+		nuevas = nuevas.filter(id__lte=resumen['maximo_id']).order_by('timestamp', 'id')
+		os.makedirs(os.path.dirname(registro.archivo), exist_ok=True)
+		temporal = f'{registro.archivo}.tmp'
+		existe = os.path.exists(registro.archivo)
+		try:
+			archivadas = _escribir_miembro(
+				temporal, nuevas.values_list(*CAMPOS).iterator(chunk_size=lote), con_encabezado=not existe
+			)
+			if existe:
+				# gzip admite miembros concatenados: se agrega al final
+				with open(registro.archivo, 'rb') as anterior, open(f'{temporal}.completo', 'wb') as completo:
+					for bloque in iter(lambda: anterior.read(1024 * 1024), b''):
+						completo.write(bloque)
+					with open(temporal, 'rb') as miembro:
+						for bloque in iter(lambda: miembro.read(1024 * 1024), b''):
+							completo.write(bloque)
+				os.replace(f'{temporal}.completo', registro.archivo)
+				os.remove(temporal)
+			else:
+				os.replace(temporal, registro.archivo)
+		except BaseException:
+			for ruta in (temporal, f'{temporal}.completo'):
+				if os.path.exists(ruta):
+					os.remove(ruta)
+			raise
+
+		rango = nuevas.aggregate(desde=Min('timestamp'), hasta=Max('timestamp'))
+		registro.filas += archivadas
+		registro.ultimo_id = resumen['maximo_id']
+		registro.tamano_bytes = os.path.getsize(registro.archivo)
+		registro.desde = min(filter(None, (registro.desde, rango['desde'])))
+		registro.hasta = max(filter(None, (registro.hasta, rango['hasta'])))
+		registro.save()
+
+	# Eliminar lo ya archivado, en lotes
+	eliminadas = 0
+	archivadas_en_tabla = telemetrias.filter(id__lte=registro.ultimo_id)
+	while True:
+		ids = list(archivadas_en_tabla.order_by().values_list('id', flat=True)[:lote])
+		if not ids:
+			break
+		with transaction.atomic():
+			Telemetria.objects.filter(id__in=ids).delete()
+		eliminadas += len(ids)
+
+	logger.info(f"📦 Telemetría archivada cruce {cruce_id} {inicio_mes:%Y-%m}: {archivadas} filas, {eliminadas} eliminadas")
+	return archivadas, eliminadas
+
+
+def _leer(registro):
+	"""Filas (dict campo -> valor tipado) de un archivo"""
+	conversores = {campo.attname: campo.to_python for campo in Telemetria._meta.concrete_fields}
+	with gzip.open(registro.archivo, 'rt', encoding='utf-8', newline='') as archivo:
+		encabezado = None
+		for fila in csv.reader(archivo):
+			if encabezado is None:
+				encabezado = fila
+				continue
+			yield {
+				campo: conversores[campo](valor) if valor != '' else None
+				for campo, valor in zip(encabezado, fila)
+			}
+
+
+def filas_archivadas(columnas, cruce_id=None, desde=None, hasta=None):
+	"""
+	Tuplas de `columnas` (como exportacion.filas) de la telemetría archivada
+	del rango, por cruce y mes en orden cronológico.
+	"""
+	registros = ArchivoTelemetria.objects.select_related('cruce').order_by('cruce_id', 'mes')
+	if cruce_id:
+		registros = registros.filter(cruce_id=cruce_id)
+	if desde:
+		registros = registros.filter(hasta__gte=desde)
+	if hasta:
+		registros = registros.filter(desde__lte=hasta)
+
+	for registro in registros:
+		if not os.path.exists(registro.archivo):
+			logger.error(f"❌ Falta el archivo de telemetría {registro.archivo}")
+			continue
+		relacionados = {'cruce__nombre': registro.cruce.nombre}
+		for fila in _leer(registro):
+			if desde and fila['timestamp'] < desde:
+				continue
+			if hasta and fila['timestamp'] > hasta:
+				continue
+			fila.update(relacionados)
+			yield tuple(fila[columna.campo] for columna in columnas)
@@ -0,0 +1,221 @@
+"""
+Dashboard en vivo por Socket.IO.
+
+Al suscribirse a 'dashboard' el cliente recibe 'dashboard_snapshot' con el mismo
+contenido que GET /api/cruces/dashboard/. Después solo recibe 'dashboard_delta'
+con los campos de un cruce que cambiaron:
+
+	{
+		'type': 'dashboard_delta',
+		'cruce_id': 3,
+		'cambios': {'telemetria_actual': {'barrier_voltage': 0.4, 'barrier_status': 'UP', ...},
+		            'alertas_activas': 2},
+		'timestamp': '...'
+	}
+
+Los cambios traen valores absolutos (no incrementos), así que aplicar un
+delta dos veces o sobre un snapshot más nuevo es inocuo: el cliente hace un
+merge del objeto del cruce. El último estado enviado de cada cruce se guarda
+en la cache compartida (CACHES, Redis por defecto) para no emitir
+campos que no cambiaron; todos los procesos comparan con el mismo estado. Si
+la entrada no está (expiró, se purgó o se limpió la cache) se envían los
+valores completos del cruce en vez de suponer que no cambiaron.
+
+Los lotes de ingesta (publicar_lote) emiten un solo delta por cruce, con la
+última lectura, el último evento y el total de alertas, y leen y guardan el
+estado de todos sus cruces con un get_many/set_many.
+"""
+from django.core.cache import cache
+from django.utils import timezone
+import logging
+
+logger = logging.getLogger(__name__)
+
+SALA_DASHBOARD = 'dashboard'
+CLAVE_ESTADO = 'dashboard_estado_cruce_{}'
+TTL_ESTADO = 24 * 3600
+
+# Campos de telemetria_actual del dashboard (sin timestamp: no dispara deltas)
+CAMPOS_TELEMETRIA = ('barrier_voltage', 'battery_voltage', 'barrier_status', 'sensor_1', 'sensor_2')
+
+
+def construir_dashboard():
+	"""
+	Resumen de todos los cruces con su telemetría actual y alertas activas.
+
+	Lo usan GET /api/cruces/dashboard/ y el snapshot del canal 'dashboard'.
+	"""
+	from .models import Cruce
+
+	# Telemetría, último evento y alertas activas vienen de CruceEstadoActual
+	cruces = Cruce.objects.select_related('estado_actual')
+
+	dashboard_data = []
+
+	for cruce in cruces:
+		estado = getattr(cruce, 'estado_actual', None)
+
+		cruce_data = {
+			'id': cruce.id,
+			'nombre': cruce.nombre,
+			'ubicacion': cruce.ubicacion,
+			'estado': cruce.estado,
+			'telemetria_actual': None,
+			'alertas_activas': estado.alertas_activas if estado else 0,
+			'ultimo_evento': estado.ultimo_evento.isoformat() if estado and estado.ultimo_evento else None
+		}
+
+		# Agregar telemetría actual si existe
+		if estado and estado.tiene_telemetria:
+			cruce_data['telemetria_actual'] = _telemetria_dashboard(estado)
+
+		dashboard_data.append(cruce_data)
+
+	return {
+		'cruces': dashboard_data,
+		'total_cruces': len(dashboard_data),
+		'cruces_activos': len([c for c in dashboard_data if c['estado'] == 'ACTIVO']),
+		'total_alertas_activas': sum(c['alertas_activas'] for c in dashboard_data)
+	}
+
+
+def _telemetria_dashboard(telemetria):
+	datos = {campo: getattr(telemetria, campo) for campo in CAMPOS_TELEMETRIA}
+	datos['timestamp'] = telemetria.timestamp.isoformat()
+	return datos
+
+
+def _aplicar_cambios(estado, cambios, momento=None):
+	"""
+	Comparar `cambios` con el último estado enviado del cruce y actualizarlo.
+
+	Si se indica `momento`, una telemetria_actual más antigua que la última
+	aplicada se ignora (lecturas de lotes que llegan desordenadas). Sin estado
+	guardado (None) el delta trae todos los valores de `cambios`.
+
+	Returns:
+		tuple: (delta, nuevo estado)
+	"""
+	if estado is None:
+		estado = {'momento': momento} if momento is not None else {}
+		delta = {campo: dict(valor) if isinstance(valor, dict) else valor for campo, valor in cambios.items()}
+		return delta, {**estado, **cambios}
+
+	if momento is not None and 'telemetria_actual' in cambios:
+		if estado.get('momento') and momento < estado['momento']:
+			cambios = {campo: valor for campo, valor in cambios.items() if campo != 'telemetria_actual'}
+		else:
+			estado['momento'] = momento
+
+	delta = {}
+	for campo, valor in cambios.items():
+		if isinstance(valor, dict):
+			anterior = estado.get(campo) or {}
+			diferencias = {k: v for k, v in valor.items() if anterior.get(k) != v}
+			if diferencias:
+				delta[campo] = diferencias
+				estado[campo] = {**anterior, **valor}
+		elif estado.get(campo) != valor:
+			delta[campo] = valor
+			estado[campo] = valor
+	return delta, estado
+
+
+def _calcular_delta(cruce_id, cambios, momento=None):
+	"""Delta de un cruce contra el último estado enviado (y guardar el nuevo)"""
+	clave = CLAVE_ESTADO.format(cruce_id)
+	delta, estado = _aplicar_cambios(cache.get(clave), cambios, momento)
+	cache.set(clave, estado, timeout=TTL_ESTADO)
+	return delta
+
+
+def _emitir_delta(cruce_id, delta):
+	from .socketio_utils import emisor
+
+	emisor.encolar([('dashboard_delta', {
+		'type': 'dashboard_delta',
+		'cruce_id': cruce_id,
+		'cambios': delta,
+		'timestamp': timezone.now().isoformat(),
+	}, SALA_DASHBOARD)])
+
+
+def publicar_telemetria(telemetria):
+	"""Delta de telemetria_actual (voltajes, estado de barrera, sensores)"""
+	datos = {campo: getattr(telemetria, campo) for campo in CAMPOS_TELEMETRIA}
+	delta = _calcular_delta(telemetria.cruce_id, {'telemetria_actual': datos}, momento=telemetria.timestamp)
+	if delta:
+		delta['telemetria_actual']['timestamp'] = telemetria.timestamp.isoformat()
+		_emitir_delta(telemetria.cruce_id, delta)
+	return delta
+
+
+def publicar_evento_barrera(barrier_event):
+	"""Delta de ultimo_evento"""
+	delta = _calcular_delta(barrier_event.cruce_id, {'ultimo_evento': barrier_event.event_time.isoformat()})
+	if delta:
+		_emitir_delta(barrier_event.cruce_id, delta)
+	return delta
+
+
+def publicar_alertas_activas(cruce_id, total=None):
+	"""Delta de alertas_activas (si no se indica el total, una query de conteo)"""
+	from .models import Alerta
+
+	if total is None:
+		total = Alerta.objects.filter(cruce_id=cruce_id, resolved=False).count()
+	delta = _calcular_delta(cruce_id, {'alertas_activas': total})
+	if delta:
+		_emitir_delta(cruce_id, delta)
+	return delta
+
+
+def publicar_lote(telemetrias, eventos=(), alertas=()):
+	"""
+	Un delta por cruce para un lote de ingesta: telemetria_actual de la última
+	lectura, ultimo_evento del último evento y alertas_activas con el total
+	recontado (ver estado_actual.registrar_alertas).
+
+	Las instancias quedan marcadas para que los receivers de post_save no
+	publiquen un delta por cada una (ver views._notificar_creados).
+
+	Returns:
+		dict: {cruce_id: delta emitido}
+	"""
+	cambios = {}
+	momentos = {}
+	for telemetria in telemetrias:
+		telemetria._dashboard_publicado = True
+		if telemetria.cruce_id not in momentos or telemetria.timestamp >= momentos[telemetria.cruce_id]:
+			momentos[telemetria.cruce_id] = telemetria.timestamp
+			cambios.setdefault(telemetria.cruce_id, {})['telemetria_actual'] = {
+				campo: getattr(telemetria, campo) for campo in CAMPOS_TELEMETRIA
+			}
+	ultimos_eventos = {}
+	for evento in eventos:
+		evento._dashboard_publicado = True
+		if evento.cruce_id not in ultimos_eventos or evento.event_time >= ultimos_eventos[evento.cruce_id]:
+			ultimos_eventos[evento.cruce_id] = evento.event_time
+			cambios.setdefault(evento.cruce_id, {})['ultimo_evento'] = evento.event_time.isoformat()
+	for alerta in alertas:
+		if hasattr(alerta, '_alertas_activas'):
+			alerta._dashboard_publicado = True
+			cambios.setdefault(alerta.cruce_id, {})['alertas_activas'] = alerta._alertas_activas
+	if not cambios:
+		return {}
+
+	claves = {cruce_id: CLAVE_ESTADO.format(cruce_id) for cruce_id in cambios}
+	guardados = cache.get_many(claves.values())
+	nuevos = {}
+	deltas = {}
+	for cruce_id, cambios_cruce in cambios.items():
+		delta, nuevos[claves[cruce_id]] = _aplicar_cambios(
+			guardados.get(claves[cruce_id]), cambios_cruce, momentos.get(cruce_id)
+		)
+		if delta:
+			if 'telemetria_actual' in delta:
+				delta['telemetria_actual']['timestamp'] = momentos[cruce_id].isoformat()
+			_emitir_delta(cruce_id, delta)
+			deltas[cruce_id] = delta
+	cache.set_many(nuevos, timeout=TTL_ESTADO)
+	return deltas
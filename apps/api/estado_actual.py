@@ -0,0 +1,129 @@
+"""
+Mantenimiento de la tabla CruceEstadoActual (último estado por cruce).
+
+Las escrituras son UPDATE condicionales: una lectura o evento más antiguo que
+el ya registrado (p. ej. lotes de gateways que llegan tarde) no pisa el estado.
+Si la fila del cruce no existe todavía se crea en el momento.
+"""
+from django.db.models import Count, Q
+from django.utils import timezone
+import logging
+
+from .models import CruceEstadoActual, Alerta, BarrierEvent
+
+logger = logging.getLogger(__name__)
+
+
+def obtener(cruce):
+	"""Estado actual del cruce, o None si aún no tiene fila"""
+	try:
+		return cruce.estado_actual
+	except CruceEstadoActual.DoesNotExist:
+		return None
+
+
+def _actualizar(cruce_id, condicion, campos, crear=True):
+	campos['updated_at'] = timezone.now()
+	actualizadas = CruceEstadoActual.objects.filter(cruce_id=cruce_id).filter(condicion).update(**campos)
+	if not actualizadas and crear:
+		# Sin fila (o con un estado más reciente, en cuyo caso no se toca)
+		CruceEstadoActual.objects.get_or_create(cruce_id=cruce_id, defaults=campos)
+
+
+def registrar_telemetrias(telemetrias):
+	"""
+	Registrar la telemetría más reciente de cada cruce de la lista.
+
+	Hace un UPDATE por cruce, no por lectura.
+	"""
+	ultimas = {}
+	for telemetria in telemetrias:
+		actual = ultimas.get(telemetria.cruce_id)
+		if actual is None or telemetria.timestamp >= actual.timestamp:
+			ultimas[telemetria.cruce_id] = telemetria
+
+	for cruce_id, telemetria in ultimas.items():
+		campos = {campo: getattr(telemetria, campo) for campo in CruceEstadoActual.CAMPOS_TELEMETRIA}
+		campos['telemetria_id'] = telemetria.id
+		campos['timestamp'] = telemetria.timestamp
+		_actualizar(
+			cruce_id,
+			Q(timestamp__isnull=True) | Q(timestamp__lte=telemetria.timestamp),
+			campos
+		)
+
+
+def registrar_evento(barrier_event):
+	"""Registrar un evento de barrera si es el más reciente del cruce"""
+	_actualizar(
+		barrier_event.cruce_id,
+		Q(ultimo_evento__isnull=True) | Q(ultimo_evento__lte=barrier_event.event_time),
+		{'ultimo_evento': barrier_event.event_time, 'ultimo_evento_estado': barrier_event.state}
+	)
+
+
+def recalcular_evento(cruce_id):
+	"""Volver a leer el último evento de barrera del cruce (tras eliminar uno)"""
+	ultimo = BarrierEvent.objects.filter(cruce_id=cruce_id).order_by('-event_time').values('event_time', 'state').first()
+	_actualizar(cruce_id, Q(), {
+		'ultimo_evento': ultimo['event_time'] if ultimo else None,
+		'ultimo_evento_estado': ultimo['state'] if ultimo else None,
+	}, crear=False)
+
+
+def recalcular_alertas(cruce_id, crear=True):
+	"""
+	Recontar las alertas activas del cruce por severidad.
+
+	Con crear=False solo se actualiza una fila existente (borrados: si el cruce
+	se está eliminando en cascada no hay que volver a crear su fila).
+
+	Returns:
+		dict: Conteos guardados
+	"""
+	conteos = Alerta.objects.filter(cruce_id=cruce_id, resolved=False).aggregate(
+		alertas_activas=Count('id'),
+		alertas_criticas=Count('id', filter=Q(severity='CRITICAL')),
+		alertas_warning=Count('id', filter=Q(severity='WARNING')),
+		alertas_info=Count('id', filter=Q(severity='INFO')),
+	)
+	_actualizar(cruce_id, Q(), dict(conteos), crear=crear)
+	return conteos
+
+
+def registrar_alertas(alertas):
+	"""
+	Recontar las alertas activas de los cruces de un lote de alertas recién
+	creadas (un recuento por cruce, no por alerta).
+
+	Las alertas quedan marcadas con el total de su cruce para que el receiver
+	de post_save no repita el recuento al notificarlas
+	(ver views._notificar_creados).
+
+	Returns:
+		dict: {cruce_id: conteos}
+	"""
+	conteos = {cruce_id: recalcular_alertas(cruce_id) for cruce_id in {alerta.cruce_id for alerta in alertas}}
+	for alerta in alertas:
+		alerta._estado_actual_registrado = True
+		alerta._alertas_activas = conteos[alerta.cruce_id]['alertas_activas']
+	return conteos
+
+
+def metricas_actuales(cruce):
+	"""
+	Métricas de la última telemetría del cruce (metricas_antes/metricas_despues
+	de HistorialMantenimiento).
+	"""
+	estado = obtener(cruce)
+	if estado is None or not estado.tiene_telemetria:
+		return {}
+
+	return {
+		'battery_voltage': estado.battery_voltage,
+		'barrier_voltage': estado.barrier_voltage,
+		'barrier_status': estado.barrier_status,
+		'signal_strength': estado.signal_strength,
+		'temperature': estado.temperature,
+		'timestamp': estado.timestamp.isoformat(),
+	}
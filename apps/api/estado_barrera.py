@@ -0,0 +1,81 @@
+"""
+Estado de barrera por cruce para la detección de eventos.
+
+El último evento de cada cruce (estado y hora) se lee de CruceEstadoActual,
+la fila que la ingesta ya actualiza con cada lectura. Si la fila viene cargada
+con la telemetría (select_related('cruce__estado_actual')) no hace ninguna
+query; si no, una sola para todo el lote.
+
+Solo se escribe cuando se crea un evento, y dentro de la misma transacción:
+las tareas siguientes de un lote (y los demás workers, al confirmarse) leen el
+estado actualizado, y un rollback lo descarta junto con los eventos.
+"""
+from .models import Cruce, CruceEstadoActual
+from . import estado_actual
+
+
+def _estado(fila):
+	if fila is None:
+		return {'ultimo_estado': None, 'ultimo_evento': None}
+	return {'ultimo_estado': fila.ultimo_evento_estado, 'ultimo_evento': fila.ultimo_evento}
+
+
+def obtener_estados(cruces):
+	"""
+	Obtener el estado de barrera de varios cruces.
+
+	Args:
+		cruces: Iterable de Cruce (se usa su estado_actual si ya está cargado)
+
+	Returns:
+		dict: {cruce_id: {'ultimo_estado': 'UP'/'DOWN'/None, 'ultimo_evento': datetime/None}}
+	"""
+	estados = {}
+	faltantes = set()
+	for cruce in cruces:
+		if Cruce.estado_actual.is_cached(cruce):
+			estados[cruce.id] = _estado(estado_actual.obtener(cruce))
+		else:
+			faltantes.add(cruce.id)
+
+	if faltantes:
+		filas = {
+			fila.cruce_id: fila
+			for fila in CruceEstadoActual.objects.filter(cruce_id__in=faltantes).only(
+				'cruce_id', 'ultimo_evento', 'ultimo_evento_estado'
+			)
+		}
+		for cruce_id in faltantes:
+			estados[cruce_id] = _estado(filas.get(cruce_id))
+
+	return estados
+
+
+def obtener_estado(cruce):
+	"""Obtener el estado de barrera de un cruce"""
+	return obtener_estados([cruce])[cruce.id]
+
+
+def registrar_eventos(eventos):
+	"""
+	Registrar en CruceEstadoActual el último de los eventos de cada cruce
+	(un UPDATE por cruce, no por evento).
+
+	Los eventos quedan marcados para que el receiver de post_save no repita
+	el UPDATE al notificarlos (ver views._notificar_creados).
+	"""
+	ultimos = {}
+	for evento in eventos:
+		actual = ultimos.get(evento.cruce_id)
+		if actual is None or evento.event_time >= actual.event_time:
+			ultimos[evento.cruce_id] = evento
+		evento._estado_actual_registrado = True
+
+	for evento in ultimos.values():
+		estado_actual.registrar_evento(evento)
+		# Mantener al día la fila ya cargada en el cruce, si la hay
+		if Cruce.estado_actual.is_cached(evento.cruce):
+			fila = estado_actual.obtener(evento.cruce)
+			if fila is not None and (fila.ultimo_evento is None or evento.event_time >= fila.ultimo_evento):
+				fila.ultimo_evento = evento.event_time
+				fila.ultimo_evento_estado = evento.state
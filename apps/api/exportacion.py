@@ -0,0 +1,539 @@
+"""
+Exportaciones de datos en streaming.
+
+Las filas se leen con un cursor del servidor (.iterator) y se escriben a la
+respuesta a medida que llegan, sin límite de filas y sin armar el archivo en
+memoria: una exportación de un año completo de un cruce usa la misma memoria
+que una de un día.
+
+Formatos:
+- csv: el de siempre (encabezados en español, valores de choices legibles).
+- parquet / arrow (Arrow IPC stream): columnas tipadas para análisis con
+  pandas/pyarrow. Se escriben por bloques de EXPORTACION_CHUNK_SIZE filas
+  (un row group / record batch por bloque). Requieren pyarrow
+  (requirements.txt).
+
+El formato se elige con ?format=csv|parquet|arrow (negociación de DRF, ver
+RENDERERS_EXPORTACION). Los clientes que piden JSON (Accept:
+application/json) reciben el CSV, como antes de existir los otros formatos.
+
+Las exportaciones grandes se generan en segundo plano (TrabajoExportacion):
+el worker escribe el archivo comprimido con gzip en EXPORTACIONES_DIR y el
+cliente lo descarga con soporte de HTTP Range (descargas reanudables).
+
+La telemetría archivada (archivar_telemetria) se agrega al final con
+`archivadas` (ver archivo_telemetria.filas_archivadas).
+
+Todas las respuestas usan RespuestaStreaming: bajo ASGI (uvicorn) el iterador
+se consume bloque a bloque y no entero en memoria.
+"""
+from asgiref.sync import sync_to_async
+from collections import namedtuple
+from itertools import chain, islice
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+import csv
+import gzip
+import json
+import logging
+import os
+import re
+
+from .models import Alerta
+
+logger = logging.getLogger(__name__)
+
+
+# campo: lookup para values_list; encabezado: columna del CSV;
+# tipo: 'int', 'float', 'str', 'bool', 'datetime' o 'date' (esquema Arrow);
+# vacio_si_falso: en CSV, 0/'' se exportan vacíos (compatibilidad);
+# opciones: en CSV, valor -> texto legible (en parquet/arrow va el valor)
+Columna = namedtuple(
+	'Columna', ['campo', 'encabezado', 'tipo', 'vacio_si_falso', 'opciones'],
+	defaults=(False, None)
+)
+
+COLUMNAS_TELEMETRIA = (
+	Columna('id', 'ID', 'int'),
+	Columna('cruce__nombre', 'Cruce', 'str'),
+	Columna('timestamp', 'Fecha', 'datetime'),
+	Columna('barrier_voltage', 'Voltaje Barrera (V)', 'float'),
+	Columna('battery_voltage', 'Voltaje Batería (V)', 'float'),
+	Columna('sensor_1', 'Sensor 1', 'int', True),
+	Columna('sensor_2', 'Sensor 2', 'int', True),
+	Columna('sensor_3', 'Sensor 3', 'int', True),
+	Columna('sensor_4', 'Sensor 4', 'int', True),
+	Columna('barrier_status', 'Estado Barrera', 'str', True),
+	Columna('signal_strength', 'Señal WiFi (dBm)', 'int', True),
+	Columna('temperature', 'Temperatura (°C)', 'float', True),
+)
+
+COLUMNAS_METRICAS = (
+	Columna('id', 'ID', 'int'),
+	Columna('cruce_id', 'Cruce ID', 'int'),
+	Columna('cruce__nombre', 'Cruce', 'str'),
+	Columna('fecha', 'Fecha', 'date'),
+	Columna('tiempo_activo', 'Tiempo Activo (h)', 'float'),
+	Columna('tiempo_inactivo', 'Tiempo Inactivo (h)', 'float'),
+	Columna('disponibilidad_porcentaje', 'Disponibilidad (%)', 'float'),
+	Columna('voltaje_promedio', 'Voltaje Promedio (V)', 'float'),
+	Columna('voltaje_minimo', 'Voltaje Mínimo (V)', 'float'),
+	Columna('voltaje_maximo', 'Voltaje Máximo (V)', 'float'),
+	Columna('horas_bateria_baja', 'Horas Batería Baja', 'float'),
+	Columna('total_eventos_barrera', 'Eventos de Barrera', 'int'),
+	Columna('total_alertas', 'Total Alertas', 'int'),
+	Columna('alertas_criticas', 'Alertas Críticas', 'int'),
+	Columna('alertas_resueltas', 'Alertas Resueltas', 'int'),
+	Columna('total_telemetrias', 'Telemetrías Recibidas', 'int'),
+	Columna('tiempo_sin_comunicacion', 'Tiempo Sin Comunicación (h)', 'float'),
+	Columna('mantenimientos_realizados', 'Mantenimientos Realizados', 'int'),
+	Columna('mantenimientos_preventivos', 'Mantenimientos Preventivos', 'int'),
+	Columna('mantenimientos_correctivos', 'Mantenimientos Correctivos', 'int'),
+)
+
+COLUMNAS_ALERTAS = (
+	Columna('id', 'ID', 'int'),
+	Columna('type', 'Tipo', 'str', opciones=dict(Alerta.ALERT_TYPES)),
+	Columna('severity', 'Severidad', 'str', opciones=dict(Alerta.SEVERITY_CHOICES)),
+	Columna('cruce__nombre', 'Cruce', 'str'),
+	Columna('description', 'Descripción', 'str'),
+	Columna('resolved', 'Resuelta', 'bool', opciones={True: 'Sí', False: 'No'}),
+	Columna('created_at', 'Fecha Creación', 'datetime'),
+	Columna('resolved_at', 'Fecha Resolución', 'datetime'),
+)
+
+CONTENT_TYPES = {
+	'csv': 'text/csv; charset=utf-8',
+	'parquet': 'application/vnd.apache.parquet',
+	'arrow': 'application/vnd.apache.arrow.stream',
+}
+
+
+class FormatoNoDisponible(Exception):
+	"""El formato pedido necesita una dependencia que no está instalada"""
+
+
+class _RendererExportacion(BaseRenderer):
+	"""
+	Renderer para que DRF acepte ?format=csv|parquet|arrow.
+
+	Las exportaciones devuelven RespuestaStreaming (no pasan por aquí);
+	solo las respuestas de error se renderizan, como JSON.
+	"""
+	charset = None
+
+	def render(self, data, accepted_media_type=None, renderer_context=None):
+		if isinstance(data, bytes):
+			return data
+		return json.dumps(data).encode('utf-8')
+
+
+class CSVRenderer(_RendererExportacion):
+	media_type = 'text/csv'
+	format = 'csv'
+
+
+class ParquetRenderer(_RendererExportacion):
+	media_type = 'application/vnd.apache.parquet'
+	format = 'parquet'
+
+
+class ArrowRenderer(_RendererExportacion):
+	media_type = 'application/vnd.apache.arrow.stream'
+	format = 'arrow'
+
+
+# CSV primero: es el formato por defecto. JSONRenderer para no responder 406
+# a los clientes que envían Accept: application/json (reciben el CSV)
+RENDERERS_EXPORTACION = [CSVRenderer, ParquetRenderer, ArrowRenderer, JSONRenderer]
+
+
+def _chunk_size():
+	return getattr(settings, 'EXPORTACION_CHUNK_SIZE', 2000)
+
+
+_FIN = object()
+
+
+class RespuestaStreaming(StreamingHttpResponse):
+	"""
+	StreamingHttpResponse que bajo ASGI pide el iterador síncrono de a un bloque.
+
+	Django sirve un iterador síncrono en ASGI con sync_to_async(list), es
+	decir, armando toda la exportación en memoria. Aquí cada bloque se pide
+	con sync_to_async(next) en el hilo de la petición (el mismo que abrió el
+	cursor del servidor). Bajo WSGI se itera como siempre.
+	"""
+
+	async def __aiter__(self):
+		if self.is_async:
+			async for parte in super().__aiter__():
+				yield parte
+			return
+
+		partes = self.streaming_content
+		siguiente = sync_to_async(next, thread_sensitive=True)
+		while True:
+			# next() con valor por defecto: StopIteration no cruza el Future
+			parte = await siguiente(partes, _FIN)
+			if parte is _FIN:
+				return
+			yield parte
+
+
+def filas(queryset, columnas):
+	"""
+	Tuplas de valores de `columnas` leídas con un cursor del servidor.
+
+	Los campos relacionados (cruce__nombre) se resuelven con un JOIN, sin
+	query por fila.
+	"""
+	campos = [columna.campo for columna in columnas]
+	return queryset.values_list(*campos).iterator(chunk_size=_chunk_size())
+
+
+def _filas_csv(valores_filas, columnas):
+	for valores in valores_filas:
+		yield [
+			_valor_csv(valor, columna)
+			for valor, columna in zip(valores, columnas)
+		]
+
+
+def _valor_csv(valor, columna):
+	if columna.vacio_si_falso and not valor:
+		return ''
+	if columna.opciones is not None:
+		return columna.opciones.get(valor, valor)
+	if columna.tipo in ('datetime', 'date') and valor is not None:
+		return valor.isoformat()
+	return valor
+
+
+class _Eco:
+	"""Pseudo-archivo para csv.writer: write() devuelve la línea en vez de guardarla"""
+
+	def write(self, valor):
+		return valor
+
+
+def lineas_csv(encabezado, filas_csv):
+	"""Generar el CSV línea a línea"""
+	writer = csv.writer(_Eco())
+	yield writer.writerow(encabezado)
+	for fila in filas_csv:
+		yield writer.writerow(fila)
+
+
+def _bloques_csv(lineas):
+	"""Agrupar las líneas de a EXPORTACION_CHUNK_SIZE (un envío por bloque)"""
+	tamano = _chunk_size()
+	while True:
+		bloque = ''.join(islice(lineas, tamano))
+		if not bloque:
+			return
+		yield bloque
+
+
+def respuesta_csv(nombre_archivo, encabezado, filas_csv):
+	"""Respuesta streaming con el CSV de `filas_csv` como adjunto"""
+	response = RespuestaStreaming(
+		_bloques_csv(lineas_csv(encabezado, filas_csv)),
+		content_type=CONTENT_TYPES['csv']
+	)
+	response['Content-Disposition'] = f'attachment; filename="{nombre_archivo}"'
+	return response
+
+
+# ============================================================================
+# FORMATOS COLUMNARES (pyarrow)
+# ============================================================================
+
+def _importar_pyarrow(formato):
+	try:
+		import pyarrow
+		return pyarrow
+	except ImportError:
+		raise FormatoNoDisponible(f'El formato {formato} requiere pyarrow (pip install pyarrow)')
+
+
+def esquema_arrow(pa, columnas):
+	"""Esquema Arrow de `columnas` (cruce__nombre -> cruce_nombre)"""
+	tipos = {
+		'int': pa.int64(),
+		'float': pa.float64(),
+		'str': pa.string(),
+		'bool': pa.bool_(),
+		'datetime': pa.timestamp('us', tz='UTC'),
+		'date': pa.date32(),
+	}
+	return pa.schema([
+		pa.field(columna.campo.replace('__', '_'), tipos[columna.tipo])
+		for columna in columnas
+	])
+
+
+def _lotes(valores_filas):
+	"""Bloques de EXPORTACION_CHUNK_SIZE filas, transpuestos a columnas"""
+	tamano = _chunk_size()
+	bloque = []
+	for valores in valores_filas:
+		bloque.append(valores)
+		if len(bloque) >= tamano:
+			yield list(zip(*bloque))
+			bloque = []
+	if bloque:
+		yield list(zip(*bloque))
+
+
+class _Sumidero:
+	"""
+	Archivo de solo escritura que acumula lo escrito hasta que se drena.
+
+	pyarrow escribe aquí cada row group / record batch; el generador de la
+	respuesta lo drena después de cada bloque.
+	"""
+	closed = False
+
+	def __init__(self):
+		self._partes = []
+		self._posicion = 0
+
+	def write(self, datos):
+		datos = bytes(datos)
+		self._partes.append(datos)
+		self._posicion += len(datos)
+		return len(datos)
+
+	def tell(self):
+		return self._posicion
+
+	def flush(self):
+		pass
+
+	def close(self):
+		self.closed = True
+
+	def drenar(self):
+		datos = b''.join(self._partes)
+		self._partes = []
+		return datos
+
+
+def _generar_columnar(pa, formato, valores_filas, columnas):
+	esquema = esquema_arrow(pa, columnas)
+	sumidero = _Sumidero()
+
+	if formato == 'parquet':
+		import pyarrow.parquet as pq
+		writer = pq.ParquetWriter(sumidero, esquema)
+	else:
+		writer = pa.ipc.new_stream(sumidero, esquema)
+
+	try:
+		for columnas_bloque in _lotes(valores_filas):
+			tabla = pa.Table.from_arrays(
+				[pa.array(valores, type=campo.type) for valores, campo in zip(columnas_bloque, esquema)],
+				schema=esquema
+			)
+			writer.write_table(tabla)
+			datos = sumidero.drenar()
+			if datos:
+				yield datos
+	finally:
+		writer.close()
+	yield sumidero.drenar()
+
+
+def respuesta_exportacion(formato, nombre_base, queryset, columnas, archivadas=()):
+	"""
+	Respuesta streaming de `queryset` (seguido de las filas `archivadas`) en
+	el formato pedido.
+
+	Raises:
+		FormatoNoDisponible: parquet/arrow sin pyarrow instalado
+	"""
+	valores_filas = chain(filas(queryset, columnas), archivadas)
+	if formato not in ('parquet', 'arrow'):
+		encabezado = [columna.encabezado for columna in columnas]
+		return respuesta_csv(f'{nombre_base}.csv', encabezado, _filas_csv(valores_filas, columnas))
+
+	pa = _importar_pyarrow(formato)
+	response = RespuestaStreaming(
+		_generar_columnar(pa, formato, valores_filas, columnas),
+		content_type=CONTENT_TYPES[formato]
+	)
+	response['Content-Disposition'] = f'attachment; filename="{nombre_base}.{formato}"'
+	return response
+
+
+# ============================================================================
+# EXPORTACIONES EN SEGUNDO PLANO
+# ============================================================================
+
+def _directorio():
+	directorio = getattr(settings, 'EXPORTACIONES_DIR', os.path.join(settings.BASE_DIR, 'exportaciones'))
+	os.makedirs(directorio, exist_ok=True)
+	return directorio
+
+
+def _contar(valores_filas, contador):
+	for valores in valores_filas:
+		contador[0] += 1
+		yield valores
+
+
+def _contenido(formato, valores_filas, columnas):
+	"""Bytes del archivo en el formato pedido, por bloques"""
+	if formato in ('parquet', 'arrow'):
+		yield from _generar_columnar(_importar_pyarrow(formato), formato, valores_filas, columnas)
+		return
+	encabezado = [columna.encabezado for columna in columnas]
+	for linea in lineas_csv(encabezado, _filas_csv(valores_filas, columnas)):
+		yield linea.encode('utf-8')
+
+
+def generar_archivo(trabajo, queryset, columnas, archivadas=()):
+	"""
+	Escribir la exportación de `trabajo` en EXPORTACIONES_DIR.
+
+	CSV y Arrow se comprimen con gzip; Parquet no (sus páginas ya van
+	comprimidas). Se escribe a un temporal y se renombra al terminar, así que
+	nunca se sirve un archivo a medias.
+
+	Returns:
+		tuple: (ruta, filas)
+	"""
+	nombre = f'{trabajo.tipo}_{trabajo.id}.{trabajo.formato}'
+	comprimir = trabajo.formato != 'parquet'
+	if comprimir:
+		nombre += '.gz'
+	ruta = os.path.join(_directorio(), nombre)
+	temporal = f'{ruta}.tmp'
+
+	contador = [0]
+	valores_filas = _contar(chain(filas(queryset, columnas), archivadas), contador)
+	abrir = gzip.open if comprimir else open
+	try:
+		with abrir(temporal, 'wb') as archivo:
+			for bloque in _contenido(trabajo.formato, valores_filas, columnas):
+				archivo.write(bloque)
+		os.replace(temporal, ruta)
+	except BaseException:
+		if os.path.exists(temporal):
+			os.remove(temporal)
+		raise
+
+	return ruta, contador[0]
+
+
+def procesar_trabajo(trabajo, queryset, columnas, archivadas=()):
+	"""Generar el archivo y dejar el trabajo COMPLETADO o FALLIDO"""
+	inicio = timezone.now()
+	try:
+		ruta, total = generar_archivo(trabajo, queryset, columnas, archivadas)
+	except Exception as e:
+		trabajo.estado = 'FALLIDO'
+		trabajo.error = f'{type(e).__name__}: {e}'
+		trabajo.save(update_fields=['estado', 'error', 'updated_at'])
+		logger.error(f"❌ Exportación {trabajo.id} fallida: {trabajo.error}")
+		return
+
+	trabajo.estado = 'COMPLETADO'
+	trabajo.archivo = ruta
+	trabajo.filas = total
+	trabajo.tamano_bytes = os.path.getsize(ruta)
+	trabajo.completado_at = timezone.now()
+	trabajo.save(update_fields=['estado', 'archivo', 'filas', 'tamano_bytes', 'completado_at', 'updated_at'])
+	logger.info(
+		f"✅ Exportación {trabajo.id} completada: {total} filas, {trabajo.tamano_bytes} bytes "
+		f"en {(trabajo.completado_at - inicio).total_seconds():.1f}s"
+	)
+
+
+# ============================================================================
+# DESCARGA CON HTTP RANGE
+# ============================================================================
+
+class RangoInvalido(Exception):
+	"""Range fuera del archivo (416)"""
+
+
+_PATRON_RANGO = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parsear_rango(cabecera, tamano):
+	"""
+	Interpretar una cabecera Range de un solo rango.
+
+	Returns:
+		tuple: (inicio, fin) inclusivos, o None si no hay rango utilizable
+		(cabecera ausente, mal formada o con varios rangos: se envía todo)
+
+	Raises:
+		RangoInvalido: el rango no se puede satisfacer
+	"""
+	coincidencia = _PATRON_RANGO.match((cabecera or '').strip())
+	if not coincidencia or coincidencia.groups() == ('', ''):
+		return None
+
+	inicio, fin = coincidencia.groups()
+	if inicio == '':
+		# Sufijo: los últimos N bytes
+		largo = int(fin)
+		if largo == 0 or tamano == 0:
+			raise RangoInvalido()
+		return max(tamano - largo, 0), tamano - 1
+
+	inicio = int(inicio)
+	fin = min(int(fin), tamano - 1) if fin else tamano - 1
+	if inicio >= tamano or fin < inicio:
+		raise RangoInvalido()
+	return inicio, fin
+
+
+def _leer(ruta, inicio, largo, bloque=64 * 1024):
+	with open(ruta, 'rb') as archivo:
+		archivo.seek(inicio)
+		while largo > 0:
+			datos = archivo.read(min(bloque, largo))
+			if not datos:
+				break
+			largo -= len(datos)
+			yield datos
+
+
+def respuesta_archivo(request, ruta, nombre_archivo, content_type, etag):
+	"""
+	Servir un archivo con soporte de Range / If-Range (200, 206 o 416)
+	"""
+	tamano = os.path.getsize(ruta)
+	cabecera = request.META.get('HTTP_RANGE')
+	if_range = request.META.get('HTTP_IF_RANGE')
+	if if_range and if_range != etag:
+		# El archivo cambió desde la descarga parcial: se envía completo
+		cabecera = None
+
+	try:
+		rango = parsear_rango(cabecera, tamano)
+	except RangoInvalido:
+		response = HttpResponse(status=416)
+		response['Content-Range'] = f'bytes */{tamano}'
+		return response
+
+	inicio, fin = rango or (0, tamano - 1)
+	largo = fin - inicio + 1 if tamano else 0
+	response = RespuestaStreaming(
+		_leer(ruta, inicio, largo),
+		status=206 if rango else 200,
+		content_type=content_type
+	)
+	if rango:
+		response['Content-Range'] = f'bytes {inicio}-{fin}/{tamano}'
+	response['Content-Length'] = str(largo)
+	response['Accept-Ranges'] = 'bytes'
+	response['ETag'] = etag
+	response['Content-Disposition'] = f'attachment; filename="{nombre_archivo}"'
+	return response
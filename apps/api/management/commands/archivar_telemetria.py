@@ -0,0 +1,77 @@
+"""
+Comando para archivar la telemetría cruda antigua (ver
+apps/api/archivo_telemetria.py). Ejecutar periódicamente vía cron, después de
+resumir_telemetria.
+"""
+from django.core.management.base import BaseCommand
+import time
+from apps.api.archivo_telemetria import (
+	ResumenesPendientes, limite_retencion, pendientes, verificar_resumenes, archivar
+)
+
+
+class Command(BaseCommand):
+	help = 'Archivar en disco la telemetría cruda más antigua que la retención y eliminarla de la tabla'
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'--dias',
+			type=int,
+			default=None,
+			help='Antigüedad mínima en días (default: TELEMETRIA_RETENCION_DIAS); se archivan meses completos',
+		)
+		parser.add_argument(
+			'--cruce',
+			type=int,
+			help='ID del cruce específico (opcional)',
+		)
+		parser.add_argument(
+			'--lote',
+			type=int,
+			default=5000,
+			help='Filas eliminadas por transacción (default: 5000)',
+		)
+		parser.add_argument(
+			'--simular',
+			action='store_true',
+			help='Mostrar qué se archivaría sin modificar nada',
+		)
+
+	def handle(self, *args, **options):
+		limite = limite_retencion(options['dias'])
+		unidades = pendientes(limite, options['cruce'])
+		self.stdout.write(f'Archivando telemetría anterior a {limite:%Y-%m-%d}: {len(unidades)} cruce(s)/mes(es)')
+
+		if options['simular']:
+			for unidad in unidades:
+				self.stdout.write(f'  Cruce {unidad["cruce_id"]} {unidad["mes"]:%Y-%m}: {unidad["filas"]} filas')
+			return
+
+		try:
+			verificar_resumenes(unidades)
+		except ResumenesPendientes as e:
+			self.stdout.write(self.style.ERROR(f'❌ {e}'))
+			return
+
+		inicio = time.monotonic()
+		total_archivadas = 0
+		total_eliminadas = 0
+		for unidad in unidades:
+			try:
+				archivadas, eliminadas = archivar(unidad['cruce_id'], unidad['mes'], limite, options['lote'])
+			except Exception as e:
+				self.stdout.write(self.style.ERROR(
+					f'❌ Error al archivar cruce {unidad["cruce_id"]} {unidad["mes"]:%Y-%m}: {str(e)}'
+				))
+				continue
+			total_archivadas += archivadas
+			total_eliminadas += eliminadas
+			if options['verbosity'] >= 2:
+				self.stdout.write(f'  Cruce {unidad["cruce_id"]} {unidad["mes"]:%Y-%m}: {archivadas} filas archivadas')
+
+		self.stdout.write(
+			self.style.SUCCESS(
+				f'✅ Proceso completado. Filas archivadas: {total_archivadas}, eliminadas: {total_eliminadas} '
+				f'en {time.monotonic() - inicio:.1f}s'
+			)
+		)
@@ -0,0 +1,28 @@
+"""
+Comando para evaluar las reglas de mantenimiento con fechas (estacionales o
+por período) sobre todos los cruces. Ejecutar periódicamente vía cron
+(p. ej. cada hora); ver apps/api/mantenimiento_lote.py.
+"""
+from django.core.management.base import BaseCommand
+import time
+from apps.api.mantenimiento_engine import motor_mantenimiento
+
+
+class Command(BaseCommand):
+	help = 'Evaluar las reglas de mantenimiento programadas sobre todos los cruces'
+
+	def handle(self, *args, **options):
+		inicio = time.monotonic()
+
+		try:
+			mantenimientos = motor_mantenimiento.evaluar_mantenimientos_programados()
+		except Exception as e:
+			self.stdout.write(self.style.ERROR(f'❌ Error al evaluar mantenimientos programados: {str(e)}'))
+			return
+
+		self.stdout.write(
+			self.style.SUCCESS(
+				f'✅ Mantenimientos programados: {len(mantenimientos)} creados '
+				f'en {time.monotonic() - inicio:.1f}s'
+			)
+		)
@@ -0,0 +1,67 @@
+"""
+Comando para mantener las particiones mensuales de telemetría y eventos de
+barrera (PostgreSQL, ver apps/api/particiones.py).
+Ejecutar mensualmente vía cron job.
+"""
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from datetime import timezone as dt_timezone
+from apps.api.particiones import (
+	TABLAS, ParticionesNoDisponibles, planificar, particiones,
+	crear_particion, desacoplar_particion
+)
+
+
+class Command(BaseCommand):
+	help = 'Crear las particiones de los próximos meses y desacoplar las antiguas'
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'--meses-adelante',
+			type=int,
+			default=3,
+			help='Meses futuros con partición creada además del actual (default: 3)',
+		)
+		parser.add_argument(
+			'--retener-meses',
+			type=int,
+			default=None,
+			help='Meses completos anteriores al actual que se conservan; los más antiguos se desacoplan (default: no desacoplar)',
+		)
+		parser.add_argument(
+			'--eliminar',
+			action='store_true',
+			help='Eliminar las particiones desacopladas en lugar de conservarlas como tablas sueltas',
+		)
+		parser.add_argument(
+			'--simular',
+			action='store_true',
+			help='Mostrar qué se haría sin modificar la base de datos',
+		)
+
+	def handle(self, *args, **options):
+		hoy = timezone.now().astimezone(dt_timezone.utc).date()
+
+		for tabla in TABLAS:
+			try:
+				existentes = particiones(tabla)
+			except ParticionesNoDisponibles as e:
+				self.stdout.write(self.style.ERROR(f'❌ {e}'))
+				return
+
+			crear, desacoplar = planificar(existentes, hoy, options['meses_adelante'], options['retener_meses'])
+			self.stdout.write(f'{tabla}: {len(existentes)} particiones mensuales')
+
+			for mes in crear:
+				if not options['simular']:
+					crear_particion(tabla, mes)
+				self.stdout.write(self.style.SUCCESS(f'✅ Creada partición {mes:%Y-%m}'))
+
+			for mes in desacoplar:
+				if not options['simular']:
+					desacoplar_particion(tabla, mes, eliminar=options['eliminar'])
+				accion = 'Eliminada' if options['eliminar'] else 'Desacoplada'
+				self.stdout.write(self.style.WARNING(f'⚠️ {accion} partición {mes:%Y-%m}'))
+
+		if options['simular']:
+			self.stdout.write('Simulación: no se modificó la base de datos')
@@ -0,0 +1,84 @@
+"""
+Worker de la cola de tareas asíncronas (detección de eventos, alertas,
+notificaciones). Ejecutar junto al servidor; se pueden lanzar varias instancias.
+"""
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+import time
+
+from apps.api.tareas import procesar_lote, reintentar_fallidas
+from apps.api import metricas_vivas
+
+
+class Command(BaseCommand):
+	help = 'Procesar la cola de tareas asíncronas de ingesta'
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'--lote',
+			type=int,
+			default=20,
+			help='Tareas a reservar por transacción (default: 20)',
+		)
+		parser.add_argument(
+			'--intervalo',
+			type=float,
+			default=0.5,
+			help='Segundos de espera cuando la cola está vacía (default: 0.5)',
+		)
+		parser.add_argument(
+			'--tipos',
+			default='',
+			help='Procesar solo estos tipos de tarea (separados por coma)',
+		)
+		parser.add_argument(
+			'--excluir-tipos',
+			default='',
+			help='No procesar estos tipos de tarea (separados por coma)',
+		)
+		parser.add_argument(
+			'--una-vez',
+			action='store_true',
+			help='Vaciar la cola una vez y terminar',
+		)
+		parser.add_argument(
+			'--reintentar-fallidas',
+			action='store_true',
+			help='Volver a encolar las tareas fallidas antes de empezar',
+		)
+
+	def handle(self, *args, **options):
+		if options['reintentar_fallidas']:
+			total = reintentar_fallidas()
+			self.stdout.write(self.style.SUCCESS(f'✅ {total} tareas fallidas reencoladas'))
+
+		tipos = [tipo.strip() for tipo in options['tipos'].split(',') if tipo.strip()]
+		excluir_tipos = [tipo.strip() for tipo in options['excluir_tipos'].split(',') if tipo.strip()]
+
+		self.stdout.write('Procesando cola de tareas...')
+		total_procesadas = 0
+		total_fallidas = 0
+
+		try:
+			while True:
+				close_old_connections()
+				procesadas, fallidas = procesar_lote(options['lote'], tipos, excluir_tipos)
+				total_procesadas += procesadas
+				total_fallidas += fallidas
+
+				# Las métricas del día también se vuelcan con la cola vacía
+				metricas_vivas.volcar_si_corresponde()
+
+				if procesadas or fallidas:
+					continue
+				if options['una_vez']:
+					break
+				time.sleep(options['intervalo'])
+		except KeyboardInterrupt:
+			self.stdout.write('Worker detenido')
+		finally:
+			metricas_vivas.volcar()
+
+		self.stdout.write(
+			self.style.SUCCESS(f'✅ Tareas procesadas: {total_procesadas}, con error: {total_fallidas}')
+		)
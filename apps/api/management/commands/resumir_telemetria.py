@@ -0,0 +1,43 @@
+"""
+Comando para actualizar los resúmenes de telemetría por minuto y por hora.
+Ejecutar periódicamente vía cron (p. ej. cada minuto); solo procesa la
+telemetría nueva desde la última corrida (ver apps/api/resumenes.py).
+"""
+from django.core.management.base import BaseCommand
+import time
+from apps.api.resumenes import resumir_pendiente
+
+
+class Command(BaseCommand):
+	help = 'Actualizar los resúmenes de telemetría por minuto y por hora'
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'--lote',
+			type=int,
+			default=50000,
+			help='Ids de telemetría por transacción (default: 50000)',
+		)
+		parser.add_argument(
+			'--solape',
+			type=int,
+			default=None,
+			help='Ids anteriores a la marca que se vuelven a revisar (default: RESUMEN_SOLAPE_IDS)',
+		)
+
+	def handle(self, *args, **options):
+		inicio = time.monotonic()
+
+		try:
+			totales = resumir_pendiente(options['lote'], options['solape'])
+		except Exception as e:
+			self.stdout.write(self.style.ERROR(f'❌ Error al resumir telemetría: {str(e)}'))
+			return
+
+		self.stdout.write(
+			self.style.SUCCESS(
+				f'✅ Resumen actualizado: {totales["lecturas"]} lecturas, '
+				f'{totales["minuto"]} intervalos de minuto, {totales["hora"]} de hora '
+				f'en {time.monotonic() - inicio:.1f}s'
+			)
+		)
@@ -1,7 +1,44 @@
 """
 Motor de Decisión para Mantenimiento Preventivo
 Sistema configurable y fácil de modificar para reglas de mantenimiento
+
+Las reglas activas se compilan una vez en un índice en memoria por cruce (las
+reglas globales se comparten): cada regla queda como una lista de predicados
+(campo, comparador, umbral) sobre la telemetría más las condiciones que
+necesitan consultas (horas sin comunicación, horas con batería baja, días
+desde el último mantenimiento). Evaluar una regla que solo usa campos de la
+telemetría no hace queries.
+
+El índice se recompila cuando cambia la versión de reglas en la cache
+compartida (signals de MantenimientoPreventivo). La versión se consulta como
+mucho cada REGLAS_MANTENIMIENTO_VERIFICACION segundos, para que evaluar una
+lectura no consulte la cache; el proceso que guarda la regla invalida su
+índice en el momento.
+
+Las condiciones con consultas se resuelven con un ContextoEvaluacion por
+cruce, compartido en memoria por todas las reglas de una pasada: N reglas
+cuestan una consulta por agregado, no N. No se guarda entre pasadas: con el
+enfriamiento de la ingesta (MANTENIMIENTO_ENFRIAMIENTO) un cruce se evalúa
+como mucho una vez por período, así que no habría qué reutilizar.
+
+La evaluación de cada regla corta en la primera condición que falla, de la
+más barata a la más cara: fechas y mes, campos de la lectura, y por último
+las condiciones con consultas (primero las ya calculadas en el contexto).
+EstadisticasReglas lleva por regla evaluaciones, cumplimientos, evaluaciones
+que llegaron a las consultas y tiempo total, sumados entre procesos en la
+cache (GET /api/mantenimiento-preventivo/estadisticas/).
+
+La ingesta evalúa las reglas con evaluar_ingesta(): al confirmarse la
+transacción, solo la lectura más reciente de cada cruce, como mucho una vez
+cada MANTENIMIENTO_ENFRIAMIENTO segundos por cruce y cortando la evaluación
+al agotar MANTENIMIENTO_PRESUPUESTO_MS por lectura. Las reglas que se cumplen
+no se aplican en la petición: se encola una tarea 'aplicar_mantenimiento'
+(tareas.py) que crea el mantenimiento, la alerta y envía el email.
 """
+from collections import namedtuple
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
 from django.utils import timezone
 from datetime import datetime, timedelta
 from django.db.models import Q, Avg, Min, Max, Count
@@ -9,10 +46,294 @@ from .models import (
 	MantenimientoPreventivo, HistorialMantenimiento, Alerta, 
 	Telemetria, Cruce, MetricasDesempeno
 )
+from .tareas import encolar as encolar_tarea
+import atexit
 import logging
+import operator
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 
+CLAVE_VERSION_REGLAS = 'mantenimiento_reglas_version'
+
+
+def _entre(valor, rango):
+	return rango[0] <= valor <= rango[1] if isinstance(rango, list) and len(rango) == 2 else False
+
+
+OPERADORES = {
+	'lt': operator.lt,   # Less than
+	'le': operator.le,   # Less or equal
+	'gt': operator.gt,   # Greater than
+	'ge': operator.ge,   # Greater or equal
+	'eq': operator.eq,   # Equal
+	'ne': operator.ne,   # Not equal
+	'between': _entre,
+}
+
+
+def _porcentaje_bateria(telemetria):
+	# Porcentaje basado en voltaje (12V = 100%, 10V = 0%), limitado a 0-100
+	porcentaje = ((telemetria.battery_voltage - 10.0) / 2.0) * 100
+	return max(0, min(100, porcentaje))
+
+
+def _campo(nombre):
+	return operator.attrgetter(nombre)
+
+
+# Condiciones sobre la telemetría: nombre -> (obtener valor, omitir si es None)
+CAMPOS_TELEMETRIA = {
+	'battery_voltage': (_campo('battery_voltage'), False),
+	'barrier_voltage': (_campo('barrier_voltage'), False),
+	'battery_percentage': (_porcentaje_bateria, False),
+	'sensor_1': (_campo('sensor_1'), True),
+	'sensor_2': (_campo('sensor_2'), True),
+	'sensor_3': (_campo('sensor_3'), True),
+	'sensor_4': (_campo('sensor_4'), True),
+	'signal_strength': (_campo('signal_strength'), True),
+	'temperature': (_campo('temperature'), True),
+}
+
+# Condiciones que requieren consultas a la BD, de la más barata a la más cara
+# (última lectura y último mantenimiento son búsquedas por índice; las horas
+# con batería baja cuentan las lecturas de 24 horas)
+CONDICIONES_CONTEXTO = ('communication_lost_hours', 'days_since_maintenance', 'hours_low_battery')
+
+# campo: condición original; obtener: telemetria -> valor; comparar(valor, umbral)
+Predicado = namedtuple('Predicado', ['campo', 'obtener', 'comparar', 'umbral', 'omitir_nulo'])
+ReglaCompilada = namedtuple('ReglaCompilada', ['regla', 'predicados', 'contexto', 'meses'])
+
+
+def _comparador(condicion):
+	"""(comparar, umbral) de una condición; comparar es None si nunca se cumple"""
+	if not isinstance(condicion, dict):
+		# Si es un número simple, asumir menor que
+		return operator.lt, condicion
+	umbral = condicion.get('value')
+	comparar = OPERADORES.get(condicion.get('operator', 'lt'))
+	if umbral is None:
+		return None, None
+	return comparar, umbral
+
+
+def evaluar_operador(valor, condicion):
+	"""
+	Evaluar operador de comparación
+
+	Args:
+		valor: Valor a comparar
+		condicion: Dict con operador y valor, ej: {'operator': 'lt', 'value': 11.0}
+
+	Returns:
+		bool: Resultado de la comparación
+	"""
+	comparar, umbral = _comparador(condicion)
+	return comparar is not None and comparar(valor, umbral)
+
+
+def compilar_regla(regla):
+	"""
+	Compilar las condiciones JSON de una regla.
+
+	Returns:
+		ReglaCompilada, o None si la regla no tiene condiciones
+	"""
+	condiciones = regla.condiciones
+	if not condiciones:
+		return None
+
+	predicados = []
+	for campo, (obtener, omitir_nulo) in CAMPOS_TELEMETRIA.items():
+		if campo in condiciones:
+			comparar, umbral = _comparador(condiciones[campo])
+			predicados.append(Predicado(campo, obtener, comparar, umbral, omitir_nulo))
+
+	contexto = tuple((campo, condiciones[campo]) for campo in CONDICIONES_CONTEXTO if campo in condiciones)
+
+	meses = condiciones.get('month')
+	if meses is not None and not isinstance(meses, list):
+		meses = [meses]
+
+	return ReglaCompilada(regla, tuple(predicados), contexto, meses)
+
+
+def cumple_predicados(compilada, objeto):
+	"""
+	Condiciones en memoria de una regla compilada (campos de telemetría y mes)
+	sobre una lectura o cualquier objeto con los mismos atributos
+	"""
+	# Condición: mes del año (para mantenimiento estacional)
+	if compilada.meses is not None and timezone.now().month not in compilada.meses:
+		return False
+	
+	for predicado in compilada.predicados:
+		valor = predicado.obtener(objeto)
+		if valor is None and predicado.omitir_nulo:
+			continue
+		if predicado.comparar is None or not predicado.comparar(valor, predicado.umbral):
+			return False
+	return True
+
+
+def invalidar_reglas():
+	"""Forzar la recompilación del índice de reglas en todos los procesos"""
+	try:
+		cache.incr(CLAVE_VERSION_REGLAS)
+	except ValueError:
+		cache.set(CLAVE_VERSION_REGLAS, 1, timeout=None)
+
+
+class ContextoEvaluacion:
+	"""
+	Agregados de un cruce para las condiciones con consultas, calculados al
+	primer uso y compartidos por todas las reglas de una pasada (solo en
+	memoria).
+
+	Se guardan los datos crudos (última lectura, último mantenimiento,
+	lecturas con batería baja) y las horas/días se derivan al evaluar.
+	"""
+	
+	# Condición -> (dato crudo, método)
+	CONDICIONES = {
+		'communication_lost_hours': ('ultima_telemetria', 'horas_sin_comunicacion'),
+		'hours_low_battery': ('lecturas_bateria_baja', 'horas_bateria_baja'),
+		'days_since_maintenance': ('ultimo_mantenimiento', 'dias_desde_mantenimiento'),
+	}
+	
+	def __init__(self, cruce_id):
+		self.cruce_id = cruce_id
+		self._datos = {}
+	
+	def calculado(self, condicion):
+		"""True si el dato de la condición ya está calculado (no requiere consultas)"""
+		return self.CONDICIONES[condicion][0] in self._datos
+	
+	def valor(self, condicion):
+		"""Valor de una condición con consultas (None si no aplica)"""
+		return getattr(self, self.CONDICIONES[condicion][1])()
+	
+	def _dato(self, nombre, calcular):
+		if nombre not in self._datos:
+			self._datos[nombre] = calcular()
+		return self._datos[nombre]
+	
+	def horas_sin_comunicacion(self):
+		"""Horas desde la última telemetría (None si no hay lecturas)"""
+		ultima = self._dato('ultima_telemetria', lambda: Telemetria.objects.filter(
+			cruce_id=self.cruce_id
+		).order_by('-timestamp').values_list('timestamp', flat=True).first())
+		if ultima is None:
+			return None
+		return (timezone.now() - ultima).total_seconds() / 3600
+	
+	def horas_bateria_baja(self):
+		"""
+		Horas acumuladas con batería baja en las últimas 24 horas
+		
+		Se asume telemetría cada 5 minutos: cada lectura = 5/60 horas
+		"""
+		lecturas = self._dato('lecturas_bateria_baja', lambda: Telemetria.objects.filter(
+			cruce_id=self.cruce_id,
+			timestamp__gte=timezone.now() - timedelta(hours=24),
+			battery_voltage__lt=11.5
+		).count())
+		return lecturas * (5 / 60)
+	
+	def dias_desde_mantenimiento(self):
+		"""Días desde el último mantenimiento completado (999 si nunca)"""
+		fecha_fin = self._dato('ultimo_mantenimiento', lambda: HistorialMantenimiento.objects.filter(
+			cruce_id=self.cruce_id,
+			estado='COMPLETADO'
+		).order_by('-fecha_fin').values_list('fecha_fin', flat=True).first())
+		if fecha_fin is None:
+			return 999  # Nunca se ha hecho mantenimiento
+		return (timezone.now() - fecha_fin).days
+
+
+class EstadisticasReglas:
+	"""
+	Contadores por regla de la evaluación: evaluaciones, cumplidas,
+	evaluaciones que llegaron a las condiciones con consultas y tiempo total.
+	
+	Cada proceso acumula en memoria y suma a la cache cada
+	MANTENIMIENTO_ESTADISTICAS_INTERVALO segundos con cache.add/cache.incr.
+	Con Redis (CACHES por defecto) son SET NX e INCRBY, atómicos: varios
+	procesos suman sobre los mismos contadores sin perder incrementos. Con
+	otros backends incr es un get seguido de un set y dos volcados simultáneos
+	pueden pisarse: los contadores son entonces aproximados (con LocMemCache,
+	además, cada proceso ve solo los suyos).
+	"""
+	CAMPOS = ('evaluaciones', 'cumplidas', 'con_consultas', 'microsegundos')
+	
+	def __init__(self):
+		self._pendientes = {}
+		self._lock = threading.Lock()
+		self._ultimo_volcado = time.monotonic()
+	
+	@staticmethod
+	def _clave(regla_id, campo):
+		return f'mantenimiento_estadisticas_{regla_id}_{campo}'
+	
+	def registrar(self, regla_id, cumplida, con_consultas, segundos):
+		with self._lock:
+			contadores = self._pendientes.setdefault(regla_id, [0, 0, 0, 0])
+			contadores[0] += 1
+			contadores[1] += int(cumplida)
+			contadores[2] += int(con_consultas)
+			contadores[3] += int(segundos * 1_000_000)
+	
+	def volcar_si_corresponde(self):
+		intervalo = getattr(settings, 'MANTENIMIENTO_ESTADISTICAS_INTERVALO', 30)
+		if time.monotonic() - self._ultimo_volcado >= intervalo:
+			self.volcar()
+	
+	def volcar(self):
+		"""Sumar los contadores de este proceso a la cache"""
+		with self._lock:
+			pendientes, self._pendientes = self._pendientes, {}
+			self._ultimo_volcado = time.monotonic()
+		
+		for regla_id, contadores in pendientes.items():
+			for campo, valor in zip(self.CAMPOS, contadores):
+				if not valor:
+					continue
+				clave = self._clave(regla_id, campo)
+				if cache.add(clave, valor, timeout=None):
+					continue
+				try:
+					cache.incr(clave, valor)
+				except ValueError:
+					# Expulsada de la cache entre add e incr: se vuelve a crear
+					# sin pisar la que haya creado otro proceso mientras tanto
+					if not cache.add(clave, valor, timeout=None):
+						cache.incr(clave, valor)
+	
+	def obtener(self, regla_ids):
+		"""
+		Contadores de las reglas (incluye lo pendiente de este proceso).
+		
+		Returns:
+			dict: {regla_id: {campo: valor}}
+		"""
+		self.volcar()
+		claves = [self._clave(regla_id, campo) for regla_id in regla_ids for campo in self.CAMPOS]
+		valores = cache.get_many(claves)
+		return {
+			regla_id: {campo: valores.get(self._clave(regla_id, campo), 0) for campo in self.CAMPOS}
+			for regla_id in regla_ids
+		}
+	
+	def reiniciar(self, regla_ids):
+		with self._lock:
+			for regla_id in regla_ids:
+				self._pendientes.pop(regla_id, None)
+		cache.delete_many([self._clave(regla_id, campo) for regla_id in regla_ids for campo in self.CAMPOS])
+
+
+estadisticas_reglas = EstadisticasReglas()
+
 
 class MotorMantenimiento:
 	"""
@@ -21,196 +342,175 @@ class MotorMantenimiento:
 	"""
 	
 	def __init__(self):
-		self.reglas_activas = None
-		self._cargar_reglas()
+		# Sin consultas al crear la instancia: el índice se compila en la primera evaluación
+		self._indice = None
+		self._globales = ()
+		self._compiladas = {}
+		self._version = None
+		self._verificado_en = 0.0
+	
+	@property
+	def reglas_activas(self):
+		"""Reglas activas de mantenimiento"""
+		return MantenimientoPreventivo.objects.filter(activo=True)
+	
+	def _compilar_indice(self, version):
+		"""Compilar las reglas activas en el índice por cruce (una query)"""
+		globales = []
+		por_cruce = {}
+		compiladas = {}
+		for regla in self.reglas_activas.all():
+			compilada = compilar_regla(regla)
+			if compilada is None:
+				continue
+			compiladas[regla.id] = compilada
+			if regla.cruce_id is None:
+				globales.append(compilada)
+			else:
+				por_cruce.setdefault(regla.cruce_id, []).append(compilada)
+		
+		# Por cruce: sus reglas y las globales, en el orden de las reglas
+		orden = {regla_id: i for i, regla_id in enumerate(compiladas)}
+		self._indice = {
+			cruce_id: tuple(sorted(reglas + globales, key=lambda c: orden[c.regla.id]))
+			for cruce_id, reglas in por_cruce.items()
+		}
+		self._globales = tuple(globales)
+		self._compiladas = compiladas
+		self._version = version
+		logger.info(f"Índice de reglas de mantenimiento compilado: {len(compiladas)} reglas")
+	
+	def invalidar(self):
+		"""Recompilar el índice en la próxima evaluación"""
+		self._indice = None
+	
+	def reglas_para(self, cruce_id):
+		"""Reglas compiladas aplicables a un cruce (específicas y globales)"""
+		ahora = time.monotonic()
+		verificacion = getattr(settings, 'REGLAS_MANTENIMIENTO_VERIFICACION', 5)
+		if self._indice is None or ahora - self._verificado_en >= verificacion:
+			version = cache.get(CLAVE_VERSION_REGLAS, 0)
+			self._verificado_en = ahora
+			if self._indice is None or version != self._version:
+				self._compilar_indice(version)
+		return self._indice.get(cruce_id, self._globales)
 	
-	def _cargar_reglas(self):
-		"""Cargar reglas activas de mantenimiento"""
-		self.reglas_activas = MantenimientoPreventivo.objects.filter(activo=True)
-		logger.info(f"Cargadas {self.reglas_activas.count()} reglas de mantenimiento activas")
+	def reglas_compiladas(self):
+		"""Todas las reglas activas compiladas, en orden"""
+		self.reglas_para(None)
+		return tuple(self._compiladas.values())
 	
-	def evaluar_telemetria(self, telemetria_instance):
+	def evaluar_telemetria(self, telemetria_instance, presupuesto=None, encolar=False):
 		"""
 		Evaluar telemetría y aplicar reglas de mantenimiento preventivo
 		
 		Args:
 			telemetria_instance: Instancia de Telemetria
+			presupuesto: Segundos máximos de evaluación (None = sin límite);
+				al agotarse no se evalúan las reglas restantes (siempre se evalúa la primera)
+			encolar: Encolar la aplicación de cada regla cumplida
+				('aplicar_mantenimiento') en lugar de aplicarla aquí
+		
+		Returns:
+			list: HistorialMantenimiento creados (o TareaAsincrona encoladas)
 		"""
-		if not self.reglas_activas.exists():
+		reglas_aplicables = self.reglas_para(telemetria_instance.cruce_id)
+		if not reglas_aplicables:
 			return []
+		inicio = time.monotonic()
 		
 		mantenimientos_generados = []
-		
-		# Filtrar reglas aplicables a este cruce
-		reglas_aplicables = self.reglas_activas.filter(
-			Q(cruce=telemetria_instance.cruce) | Q(cruce__isnull=True)
-		)
-		
-		for regla in reglas_aplicables:
+		contexto = ContextoEvaluacion(telemetria_instance.cruce_id)
+		
+		for posicion, compilada in enumerate(reglas_aplicables):
+			if posicion and presupuesto is not None and time.monotonic() - inicio > presupuesto:
+				logger.warning(
+					f"⏱️ Presupuesto de mantenimiento agotado para cruce {telemetria_instance.cruce_id}: "
+					f"{len(reglas_aplicables) - posicion} reglas sin evaluar"
+				)
+				break
 			try:
-				if self._evaluar_condiciones(regla, telemetria_instance):
-					mantenimiento = self._aplicar_regla(regla, telemetria_instance)
+				if self._evaluar_compilada(compilada, telemetria_instance, contexto):
+					if encolar:
+						mantenimientos_generados.append(encolar_tarea('aplicar_mantenimiento', {
+							'regla_id': compilada.regla.id,
+							'telemetria_id': telemetria_instance.id,
+						}))
+						continue
+					mantenimiento = self._aplicar_regla(compilada.regla, telemetria_instance)
 					if mantenimiento:
 						mantenimientos_generados.append(mantenimiento)
 			except Exception as e:
-				logger.error(f"Error al evaluar regla {regla.nombre}: {str(e)}")
+				logger.error(f"Error al evaluar regla {compilada.regla.nombre}: {str(e)}")
 		
+		estadisticas_reglas.volcar_si_corresponde()
 		return mantenimientos_generados
 	
-	def _evaluar_condiciones(self, regla, telemetria_instance):
+	def _evaluar_condiciones(self, regla, telemetria_instance, contexto=None):
 		"""
 		Evaluar si las condiciones de una regla se cumplen
 		
 		Args:
 			regla: Instancia de MantenimientoPreventivo
 			telemetria_instance: Instancia de Telemetria
+			contexto: ContextoEvaluacion del cruce (se crea si no se indica)
 		
 		Returns:
 			bool: True si las condiciones se cumplen
 		"""
-		condiciones = regla.condiciones
-		if not condiciones:
-			return False
-		
-		# Verificar condiciones de fecha
-		if not self._verificar_fechas(regla):
+		compilada = self._compiladas.get(regla.id)
+		if compilada is None or compilada.regla.updated_at != regla.updated_at:
+			compilada = compilar_regla(regla)
+		if compilada is None:
 			return False
-		
-		# Evaluar condiciones de telemetría
-		resultado = True
-		
-		# Condición: batería baja
-		if 'battery_voltage' in condiciones:
-			cond = condiciones['battery_voltage']
-			valor = telemetria_instance.battery_voltage
-			if not self._evaluar_operador(valor, cond):
-				resultado = False
-		
-		# Condición: voltaje de barrera
-		if 'barrier_voltage' in condiciones:
-			cond = condiciones['barrier_voltage']
-			valor = telemetria_instance.barrier_voltage
-			if not self._evaluar_operador(valor, cond):
-				resultado = False
-		
-		# Condición: porcentaje de batería (calculado)
-		if 'battery_percentage' in condiciones:
-			# Calcular porcentaje basado en voltaje (12V = 100%, 10V = 0%)
-			porcentaje = ((telemetria_instance.battery_voltage - 10.0) / 2.0) * 100
-			porcentaje = max(0, min(100, porcentaje))  # Limitar entre 0 y 100
-			cond = condiciones['battery_percentage']
-			if not self._evaluar_operador(porcentaje, cond):
-				resultado = False
-		
-		# Condición: sensor específico
-		for sensor_num in [1, 2, 3, 4]:
-			sensor_key = f'sensor_{sensor_num}'
-			if sensor_key in condiciones:
-				valor = getattr(telemetria_instance, sensor_key)
-				if valor is not None:
-					cond = condiciones[sensor_key]
-					if not self._evaluar_operador(valor, cond):
-						resultado = False
-		
-		# Condición: señal WiFi
-		if 'signal_strength' in condiciones:
-			valor = telemetria_instance.signal_strength
-			if valor is not None:
-				cond = condiciones['signal_strength']
-				if not self._evaluar_operador(valor, cond):
-					resultado = False
-		
-		# Condición: temperatura
-		if 'temperature' in condiciones:
-			valor = telemetria_instance.temperature
-			if valor is not None:
-				cond = condiciones['temperature']
-				if not self._evaluar_operador(valor, cond):
-					resultado = False
-		
-		# Condición: tiempo sin comunicación (basado en última telemetría)
-		if 'communication_lost_hours' in condiciones:
-			ultima_telemetria = Telemetria.objects.filter(
-				cruce=telemetria_instance.cruce
-			).order_by('-timestamp').first()
-			
-			if ultima_telemetria:
-				tiempo_sin_comunicacion = (timezone.now() - ultima_telemetria.timestamp).total_seconds() / 3600
-				cond = condiciones['communication_lost_hours']
-				if not self._evaluar_operador(tiempo_sin_comunicacion, cond):
-					resultado = False
-		
-		# Condición: horas acumuladas con batería baja
-		if 'hours_low_battery' in condiciones:
-			horas_baja = self._calcular_horas_bateria_baja(telemetria_instance.cruce)
-			cond = condiciones['hours_low_battery']
-			if not self._evaluar_operador(horas_baja, cond):
-				resultado = False
-		
-		# Condición: días desde último mantenimiento
-		if 'days_since_maintenance' in condiciones:
-			ultimo_mantenimiento = HistorialMantenimiento.objects.filter(
-				cruce=telemetria_instance.cruce,
-				estado='COMPLETADO'
-			).order_by('-fecha_fin').first()
+		return self._evaluar_compilada(
+			compilada, telemetria_instance, contexto or ContextoEvaluacion(telemetria_instance.cruce_id)
+		)
+	
+	def _evaluar_compilada(self, compilada, telemetria_instance, contexto):
+		"""
+		Evaluar una regla compilada: fechas, mes y telemetría en memoria, y por
+		último las condiciones con consultas. Corta en la primera que falla.
+		"""
+		inicio = time.perf_counter()
+		cumplida = con_consultas = False
+		try:
+			# Verificar condiciones de fecha
+			if not self._verificar_fechas(compilada.regla):
+				return False
 			
-			if ultimo_mantenimiento and ultimo_mantenimiento.fecha_fin:
-				dias = (timezone.now() - ultimo_mantenimiento.fecha_fin).days
-			else:
-				dias = 999  # Nunca se ha hecho mantenimiento
+			# Condiciones de mes y telemetría (en memoria)
+			if not cumple_predicados(compilada, telemetria_instance):
+				return False
 			
-			cond = condiciones['days_since_maintenance']
-			if not self._evaluar_operador(dias, cond):
-				resultado = False
-		
-		# Condición: mes del año (para mantenimiento estacional)
-		if 'month' in condiciones:
-			mes_actual = timezone.now().month
-			meses = condiciones['month']
-			if isinstance(meses, list):
-				if mes_actual not in meses:
-					resultado = False
-			elif mes_actual != meses:
-				resultado = False
-		
-		return resultado
+			con_consultas = bool(compilada.contexto)
+			cumplida = self._evaluar_contexto(compilada.contexto, contexto)
+			return cumplida
+		finally:
+			estadisticas_reglas.registrar(
+				compilada.regla.id, cumplida, con_consultas, time.perf_counter() - inicio
+			)
 	
-	def _evaluar_operador(self, valor, condicion):
+	def _evaluar_contexto(self, condiciones, contexto):
 		"""
-		Evaluar operador de comparación
+		Condiciones que requieren consultas a la BD (agregados de `contexto`).
 		
-		Args:
-			valor: Valor a comparar
-			condicion: Dict con operador y valor, ej: {'operator': 'lt', 'value': 11.0}
-		
-		Returns:
-			bool: Resultado de la comparación
+		Primero las que el contexto ya tiene calculadas, después en orden de
+		costo; corta en la primera que no se cumple.
 		"""
-		if not isinstance(condicion, dict):
-			# Si es un número simple, asumir menor que
-			return valor < condicion
-		
-		operador = condicion.get('operator', 'lt')
-		valor_condicion = condicion.get('value')
-		
-		if valor_condicion is None:
-			return False
-		
-		operadores = {
-			'lt': lambda v, c: v < c,   # Less than
-			'le': lambda v, c: v <= c,  # Less or equal
-			'gt': lambda v, c: v > c,   # Greater than
-			'ge': lambda v, c: v >= c,  # Greater or equal
-			'eq': lambda v, c: v == c,  # Equal
-			'ne': lambda v, c: v != c,  # Not equal
-			'between': lambda v, c: c[0] <= v <= c[1] if isinstance(c, list) and len(c) == 2 else False,
-		}
-		
-		func = operadores.get(operador)
-		if func:
-			return func(valor, valor_condicion)
-		
-		return False
+		pendientes = sorted(condiciones, key=lambda condicion: not contexto.calculado(condicion[0]))
+		for campo, condicion in pendientes:
+			valor = contexto.valor(campo)
+			# Sin telemetría no se evalúa el tiempo sin comunicación
+			if valor is None:
+				continue
+			if not evaluar_operador(valor, condicion):
+				return False
+		return True
+	
+	def _evaluar_operador(self, valor, condicion):
+		"""Evaluar operador de comparación (ver evaluar_operador)"""
+		return evaluar_operador(valor, condicion)
 	
 	def _verificar_fechas(self, regla):
 		"""Verificar si la regla está dentro del rango de fechas válido"""
@@ -297,115 +597,80 @@ class MotorMantenimiento:
 				resolved=False
 			)
 			
-			# Enviar email de mantenimiento programado
-			try:
-				from .email_service import enviar_email_mantenimiento
-				enviar_email_mantenimiento(mantenimiento)
-			except Exception as e:
-				logger.warning(f"Error al enviar email de mantenimiento: {str(e)}")
+			# Enviar email de mantenimiento programado (confirmado el mantenimiento)
+			def enviar_email():
+				try:
+					from .email_service import enviar_email_mantenimiento
+					enviar_email_mantenimiento(mantenimiento)
+				except Exception as e:
+					logger.warning(f"Error al enviar email de mantenimiento: {str(e)}")
+			
+			transaction.on_commit(enviar_email)
 		
 		logger.info(f"Mantenimiento preventivo creado: {mantenimiento.id} para cruce {telemetria_instance.cruce.nombre}")
 		
 		return mantenimiento
 	
 	def _obtener_metricas_actuales(self, cruce):
-		"""Obtener métricas actuales del cruce"""
-		ultima_telemetria = Telemetria.objects.filter(
-			cruce=cruce
-		).order_by('-timestamp').first()
-		
-		if not ultima_telemetria:
-			return {}
-		
-		return {
-			'battery_voltage': ultima_telemetria.battery_voltage,
-			'barrier_voltage': ultima_telemetria.barrier_voltage,
-			'barrier_status': ultima_telemetria.barrier_status,
-			'signal_strength': ultima_telemetria.signal_strength,
-			'temperature': ultima_telemetria.temperature,
-			'timestamp': ultima_telemetria.timestamp.isoformat(),
-		}
-	
-	def _calcular_horas_bateria_baja(self, cruce, horas_retroceso=24):
-		"""
-		Calcular horas acumuladas con batería baja en las últimas X horas
-		
-		Args:
-			cruce: Instancia de Cruce
-			horas_retroceso: Horas hacia atrás para calcular
-		
-		Returns:
-			float: Horas con batería baja
-		"""
-		fecha_desde = timezone.now() - timedelta(hours=horas_retroceso)
-		
-		telemetrias = Telemetria.objects.filter(
-			cruce=cruce,
-			timestamp__gte=fecha_desde,
-			battery_voltage__lt=11.5
-		).order_by('timestamp')
-		
-		if not telemetrias.exists():
-			return 0.0
-		
-		# Calcular tiempo total con batería baja
-		# Asumiendo que cada telemetría representa un intervalo
-		# Si hay telemetría cada 5 minutos, cada registro = 5/60 horas
-		intervalo_horas = 5 / 60  # 5 minutos = 0.083 horas
-		horas_baja = telemetrias.count() * intervalo_horas
-		
-		return horas_baja
+		"""Obtener métricas actuales del cruce (tabla CruceEstadoActual)"""
+		from .estado_actual import metricas_actuales
+		return metricas_actuales(cruce)
 	
 	def evaluar_mantenimientos_programados(self):
 		"""
 		Evaluar y actualizar mantenimientos programados basados en fechas
 		Útil para mantenimientos estacionales o por fecha específica
-		"""
-		mantenimientos_generados = []
-		
-		# Obtener reglas con fechas específicas
-		reglas_fecha = self.reglas_activas.filter(
-			fecha_inicio__isnull=False
-		)
-		
-		for regla in reglas_fecha:
-			if not self._verificar_fechas(regla):
-				continue
-			
-			# Obtener cruces aplicables
-			if regla.cruce:
-				cruces = [regla.cruce]
-			else:
-				cruces = Cruce.objects.filter(estado='ACTIVO')
-			
-			for cruce in cruces:
-				# Verificar si ya existe mantenimiento para esta regla
-				mantenimiento_existente = HistorialMantenimiento.objects.filter(
-					cruce=cruce,
-					regla=regla,
-					fecha_programada__date=timezone.now().date()
-				).first()
-				
-				if mantenimiento_existente:
-					continue
-				
-				# Obtener última telemetría
-				ultima_telemetria = Telemetria.objects.filter(
-					cruce=cruce
-				).order_by('-timestamp').first()
-				
-				if not ultima_telemetria:
-					continue
-				
-				# Evaluar condiciones
-				if self._evaluar_condiciones(regla, ultima_telemetria):
-					mantenimiento = self._aplicar_regla(regla, ultima_telemetria)
-					if mantenimiento:
-						mantenimientos_generados.append(mantenimiento)
 		
-		return mantenimientos_generados
+		Evalúa todas las reglas sobre todos los cruces por lotes
+		(ver mantenimiento_lote.evaluar_programados)
+		"""
+		from .mantenimiento_lote import evaluar_programados
+		return evaluar_programados(self)
 
 
 # Instancia global del motor
 motor_mantenimiento = MotorMantenimiento()
 
+
+def evaluar_ingesta(telemetrias):
+	"""
+	Evaluar las reglas de mantenimiento para lecturas recién insertadas.
+
+	Se ejecuta al confirmarse la transacción, con la lectura más reciente de
+	cada cruce. Un cruce evaluado hace menos de MANTENIMIENTO_ENFRIAMIENTO
+	segundos se omite. Las reglas cumplidas se encolan (aplicar_mantenimiento):
+	la ingesta no crea mantenimientos ni envía emails. Los errores se
+	registran sin afectar la ingesta.
+	"""
+	ultimas = {}
+	for telemetria in telemetrias:
+		actual = ultimas.get(telemetria.cruce_id)
+		if actual is None or telemetria.timestamp >= actual.timestamp:
+			ultimas[telemetria.cruce_id] = telemetria
+	if not ultimas:
+		return
+
+	def evaluar():
+		enfriamiento = getattr(settings, 'MANTENIMIENTO_ENFRIAMIENTO', 60)
+		presupuesto = getattr(settings, 'MANTENIMIENTO_PRESUPUESTO_MS', 50) / 1000
+		for cruce_id, telemetria in ultimas.items():
+			# cache.add es atómico en la cache compartida (CACHES, Redis
+			# por defecto): un solo proceso evalúa el cruce por período
+			if enfriamiento and not cache.add(f'mantenimiento_evaluado_{cruce_id}', 1, timeout=enfriamiento):
+				continue
+			try:
+				motor_mantenimiento.evaluar_telemetria(telemetria, presupuesto=presupuesto, encolar=True)
+			except Exception as e:
+				logger.error(f"Error al evaluar mantenimiento del cruce {cruce_id}: {str(e)}")
+
+	transaction.on_commit(evaluar)
+
+
+def _volcar_estadisticas_al_salir():
+	try:
+		estadisticas_reglas.volcar()
+	except Exception:
+		pass
+
+
+atexit.register(_volcar_estadisticas_al_salir)
@@ -0,0 +1,185 @@
+"""
+Evaluación por lotes de las reglas de mantenimiento con fechas (programadas).
+
+evaluar_programados() carga el último estado de todos los cruces
+(CruceEstadoActual) en una consulta y evalúa cada regla compilada como una
+máscara sobre todos los cruces a la vez con NumPy (requirements.txt); si
+no está instalado, fila por fila con los mismos predicados. Los
+(cruce, regla) que ya tienen un mantenimiento pendiente o programado hoy se
+descartan con una sola consulta IN; solo los candidatos que quedan resuelven
+las condiciones con consultas (ContextoEvaluacion) y se aplican.
+"""
+from collections import namedtuple
+from django.db.models import Q
+from django.utils import timezone
+import logging
+
+from .models import CruceEstadoActual, HistorialMantenimiento, Telemetria
+from .mantenimiento_engine import ContextoEvaluacion, cumple_predicados, _entre
+
+logger = logging.getLogger(__name__)
+
+# Campos numéricos del estado actual que usan las condiciones
+CAMPOS = tuple(campo for campo in CruceEstadoActual.CAMPOS_TELEMETRIA if campo != 'barrier_status')
+
+Fila = namedtuple('Fila', ('cruce_id', 'telemetria_id', 'activo') + CAMPOS)
+
+
+def _importar_numpy():
+	try:
+		import numpy
+		return numpy
+	except ImportError:
+		return None
+
+
+def cargar_estados(cruce_ids=()):
+	"""
+	Último estado de los cruces activos (y de `cruce_ids` aunque no lo estén)
+	con telemetría, en una consulta.
+	"""
+	estados = CruceEstadoActual.objects.filter(
+		Q(cruce__estado='ACTIVO') | Q(cruce_id__in=cruce_ids), telemetria__isnull=False
+	).order_by('cruce_id')
+	return [
+		Fila(cruce_id, telemetria_id, estado == 'ACTIVO', *valores)
+		for cruce_id, telemetria_id, estado, *valores
+		in estados.values_list('cruce_id', 'telemetria_id', 'cruce__estado', *CAMPOS)
+	]
+
+
+def _columnas(np, filas):
+	"""Columnas float (None -> NaN) del estado de los cruces"""
+	columnas = {campo: np.array([getattr(fila, campo) for fila in filas], dtype=float) for campo in CAMPOS}
+	columnas['battery_percentage'] = np.clip((columnas['battery_voltage'] - 10.0) / 2.0 * 100, 0, 100)
+	columnas['cruce_id'] = np.array([fila.cruce_id for fila in filas], dtype=np.int64)
+	columnas['activo'] = np.array([fila.activo for fila in filas], dtype=bool)
+	return columnas
+
+
+def _mascara_predicado(np, predicado, valores):
+	if predicado.comparar is None:
+		return np.zeros(valores.shape, dtype=bool)
+	if predicado.comparar is _entre:
+		rango = predicado.umbral
+		if not (isinstance(rango, list) and len(rango) == 2):
+			return np.zeros(valores.shape, dtype=bool)
+		cumple = (valores >= rango[0]) & (valores <= rango[1])
+	else:
+		cumple = np.asarray(predicado.comparar(valores, predicado.umbral), dtype=bool)
+	if predicado.omitir_nulo:
+		cumple = cumple | np.isnan(valores)
+	return cumple
+
+
+def _candidatos_numpy(np, reglas, filas):
+	columnas = _columnas(np, filas)
+	mes = timezone.now().month
+	candidatos = []
+	for compilada in reglas:
+		if compilada.meses is not None and mes not in compilada.meses:
+			continue
+		regla = compilada.regla
+		if regla.cruce_id:
+			mascara = columnas['cruce_id'] == regla.cruce_id
+		else:
+			mascara = columnas['activo'].copy()
+		try:
+			with np.errstate(invalid='ignore'):
+				for predicado in compilada.predicados:
+					if not mascara.any():
+						break
+					mascara &= _mascara_predicado(np, predicado, columnas[predicado.campo])
+		except Exception as e:
+			logger.error(f"Error al evaluar regla {regla.nombre}: {str(e)}")
+			continue
+		candidatos.extend((compilada, filas[i]) for i in np.flatnonzero(mascara))
+	return candidatos
+
+
+def _candidatos_filas(reglas, filas):
+	candidatos = []
+	for compilada in reglas:
+		regla = compilada.regla
+		for fila in filas:
+			aplica = fila.cruce_id == regla.cruce_id if regla.cruce_id else fila.activo
+			try:
+				if aplica and cumple_predicados(compilada, fila):
+					candidatos.append((compilada, fila))
+			except Exception as e:
+				logger.error(f"Error al evaluar regla {regla.nombre}: {str(e)}")
+				break
+	return candidatos
+
+
+def candidatos(reglas, filas):
+	"""(regla compilada, fila) que cumplen las condiciones en memoria"""
+	if not reglas or not filas:
+		return []
+	np = _importar_numpy()
+	if np is None:
+		return _candidatos_filas(reglas, filas)
+	return _candidatos_numpy(np, reglas, filas)
+
+
+def evaluar_programados(motor):
+	"""
+	Evaluar las reglas activas con fecha de inicio sobre todos los cruces y
+	crear los mantenimientos que correspondan.
+
+	Returns:
+		list: HistorialMantenimiento creados
+	"""
+	reglas = [
+		compilada for compilada in motor.reglas_compiladas()
+		if compilada.regla.fecha_inicio is not None and motor._verificar_fechas(compilada.regla)
+	]
+	if not reglas:
+		return []
+
+	filas = cargar_estados({c.regla.cruce_id for c in reglas if c.regla.cruce_id})
+	posibles = candidatos(reglas, filas)
+	if not posibles:
+		return []
+
+	# Una consulta: (cruce, regla) con mantenimiento pendiente o programado hoy
+	existentes = set(HistorialMantenimiento.objects.filter(
+		Q(estado__in=['PENDIENTE', 'EN_PROCESO']) | Q(fecha_programada__date=timezone.localdate()),
+		regla_id__in={compilada.regla.id for compilada, _ in posibles},
+		cruce_id__in={fila.cruce_id for _, fila in posibles},
+	).values_list('cruce_id', 'regla_id'))
+	posibles = [
+		(compilada, fila) for compilada, fila in posibles
+		if (fila.cruce_id, compilada.regla.id) not in existentes
+	]
+
+	contextos = {}
+	cumplen = []
+	for compilada, fila in posibles:
+		contexto = contextos.setdefault(fila.cruce_id, ContextoEvaluacion(fila.cruce_id))
+		try:
+			if motor._evaluar_contexto(compilada.contexto, contexto):
+				cumplen.append((compilada, fila))
+		except Exception as e:
+			logger.error(f"Error al evaluar regla {compilada.regla.nombre}: {str(e)}")
+	if not cumplen:
+		return []
+
+	telemetrias = Telemetria.objects.select_related('cruce').in_bulk({fila.telemetria_id for _, fila in cumplen})
+	mantenimientos_generados = []
+	for compilada, fila in cumplen:
+		telemetria = telemetrias.get(fila.telemetria_id)
+		if telemetria is None:
+			continue
+		try:
+			mantenimiento = motor._aplicar_regla(compilada.regla, telemetria)
+			if mantenimiento:
+				mantenimientos_generados.append(mantenimiento)
+		except Exception as e:
+			logger.error(f"Error al aplicar regla {compilada.regla.nombre}: {str(e)}")
+
+	logger.info(
+		f"Mantenimiento programado: {len(reglas)} reglas sobre {len(filas)} cruces, "
+		f"{len(mantenimientos_generados)} mantenimientos creados"
+	)
+	return mantenimientos_generados
@@ -0,0 +1,278 @@
+"""
+Cálculo de MetricasDesempeno diarias por conjuntos.
+
+Para una fecha se calculan las métricas de todos los cruces con una consulta
+agrupada por tabla (telemetría, eventos, alertas, mantenimientos) y una
+consulta con LAG() para los huecos entre lecturas; el resultado se guarda con
+un único bulk_create(update_conflicts=True). El costo ya no crece con una
+query por cruce ni recorriendo cada lectura en Python.
+
+Disponibilidad (misma regla de siempre): se miden los huecos entre lecturas
+consecutivas del día, incluyendo desde el inicio del día hasta la primera y
+desde la última hasta el fin del día. Cada hueco aporta hasta 1 hora de
+tiempo activo; lo que excede la hora es tiempo inactivo.
+
+Para recalcular rangos largos (backfill) el trabajo se divide en unidades
+(fecha, bloque de cruces) que se reparten en un pool de procesos, cada uno
+con su propia conexión a la BD (ver recalcular_rango y metricas_worker).
+"""
+from django.db import connection
+from django.db.models import (
+	Avg, Count, DurationField, ExpressionWrapper, F, Max, Min, Q, Value, Window
+)
+from django.db.models.functions import Coalesce, Lag
+from django.utils import timezone
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+import multiprocessing
+
+from .models import (
+	Cruce, Telemetria, Alerta, BarrierEvent, HistorialMantenimiento, MetricasDesempeno
+)
+from .metricas_worker import inicializar, procesar_unidad
+
+UMBRAL_BATERIA_BAJA = 11.5
+# Se asume telemetría cada 5 minutos para estimar horas con batería baja
+INTERVALO_HORAS = 5 / 60
+HUECO_ACTIVO = timedelta(hours=1)
+
+CAMPOS_CALCULADOS = [
+	'tiempo_activo', 'tiempo_inactivo', 'disponibilidad_porcentaje',
+	'voltaje_promedio', 'voltaje_minimo', 'voltaje_maximo', 'horas_bateria_baja',
+	'total_eventos_barrera', 'total_alertas', 'alertas_criticas', 'alertas_resueltas',
+	'total_telemetrias', 'tiempo_sin_comunicacion',
+	'mantenimientos_realizados', 'mantenimientos_preventivos', 'mantenimientos_correctivos',
+	'updated_at',
+]
+
+
+def rango_dia(fecha):
+	"""Inicio y fin (inclusive) del día en la zona horaria del proyecto"""
+	inicio = timezone.make_aware(datetime.combine(fecha, datetime.min.time()))
+	fin = timezone.make_aware(datetime.combine(fecha, datetime.max.time()))
+	return inicio, fin
+
+
+def _por_cruce(queryset, **agregados):
+	"""Agregados agrupados por cruce: {cruce_id: {nombre: valor}}"""
+	filas = queryset.values('cruce_id').annotate(**agregados).order_by()
+	return {fila.pop('cruce_id'): fila for fila in filas}
+
+
+def _horas(valor):
+	"""Duración devuelta por la BD a horas"""
+	if valor is None:
+		return 0.0
+	if isinstance(valor, timedelta):
+		return valor.total_seconds() / 3600
+	# Backends sin tipo intervalo (SQLite) devuelven microsegundos
+	return valor / 3_600_000_000
+
+
+def _huecos(telemetrias, inicio):
+	"""
+	Tiempo activo/inactivo de los huecos entre lecturas (sin el último hueco
+	hasta el fin del día), con LAG() sobre las lecturas de cada cruce.
+
+	Returns:
+		dict: {cruce_id: (horas_activo, horas_inactivo)}
+	"""
+	lecturas = telemetrias.annotate(
+		anterior=Window(Lag('timestamp'), partition_by=[F('cruce_id')], order_by=F('timestamp').asc())
+	).annotate(
+		hueco=ExpressionWrapper(F('timestamp') - Coalesce(F('anterior'), Value(inicio)), output_field=DurationField())
+	).values('cruce_id', 'hueco').order_by()
+
+	# Las funciones de ventana no se pueden agregar directamente: se agrupa
+	# sobre la consulta con LAG como subconsulta
+	sql_lecturas, parametros = lecturas.query.sql_with_params()
+	duracion = DurationField()
+	hora = duracion.get_db_prep_value(HUECO_ACTIVO, connection)
+	cero = duracion.get_db_prep_value(timedelta(0), connection)
+	sql = (
+		'SELECT t.cruce_id, '
+		'SUM(CASE WHEN t.hueco <= %s THEN t.hueco ELSE %s END), '
+		'SUM(CASE WHEN t.hueco > %s THEN t.hueco - %s ELSE %s END) '
+		f'FROM ({sql_lecturas}) t GROUP BY t.cruce_id'
+	)
+	with connection.cursor() as cursor:
+		cursor.execute(sql, (hora, hora, hora, hora, cero) + tuple(parametros))
+		return {
+			cruce_id: (_horas(activo), _horas(inactivo))
+			for cruce_id, activo, inactivo in cursor.fetchall()
+		}
+
+
+def calcular_dia(fecha, cruce_ids=None):
+	"""
+	Calcular las métricas de `fecha` para todos los cruces (o los indicados).
+
+	Returns:
+		list: Instancias de MetricasDesempeno sin guardar, una por cruce
+	"""
+	inicio, fin = rango_dia(fecha)
+
+	cruces = Cruce.objects.all()
+	if cruce_ids is not None:
+		cruces = cruces.filter(id__in=cruce_ids)
+	cruce_ids = list(cruces.values_list('id', flat=True))
+	if not cruce_ids:
+		return []
+
+	telemetrias = Telemetria.objects.filter(cruce_id__in=cruce_ids, timestamp__gte=inicio, timestamp__lte=fin)
+	lecturas = _por_cruce(
+		telemetrias,
+		total=Count('id'),
+		voltaje_promedio=Avg('battery_voltage'),
+		voltaje_minimo=Min('battery_voltage'),
+		voltaje_maximo=Max('battery_voltage'),
+		bateria_baja=Count('id', filter=Q(battery_voltage__lt=UMBRAL_BATERIA_BAJA)),
+		ultima=Max('timestamp'),
+	)
+	huecos = _huecos(telemetrias, inicio)
+
+	eventos = _por_cruce(
+		BarrierEvent.objects.filter(cruce_id__in=cruce_ids, event_time__gte=inicio, event_time__lte=fin),
+		total=Count('id'),
+	)
+	alertas = _por_cruce(
+		Alerta.objects.filter(cruce_id__in=cruce_ids, created_at__gte=inicio, created_at__lte=fin),
+		total=Count('id'),
+		criticas=Count('id', filter=Q(severity='CRITICAL')),
+		resueltas=Count('id', filter=Q(resolved=True)),
+	)
+	mantenimientos = _por_cruce(
+		HistorialMantenimiento.objects.filter(
+			cruce_id__in=cruce_ids, fecha_programada__gte=inicio, fecha_programada__lte=fin, estado='COMPLETADO'
+		),
+		realizados=Count('id'),
+		preventivos=Count('id', filter=Q(regla__isnull=False)),
+		correctivos=Count('id', filter=Q(regla__isnull=True)),
+	)
+
+	resultado = []
+	for cruce_id in cruce_ids:
+		metricas = MetricasDesempeno(cruce_id=cruce_id, fecha=fecha)
+		lectura = lecturas.get(cruce_id)
+
+		if lectura:
+			metricas.total_telemetrias = lectura['total']
+			metricas.voltaje_promedio = lectura['voltaje_promedio']
+			metricas.voltaje_minimo = lectura['voltaje_minimo']
+			metricas.voltaje_maximo = lectura['voltaje_maximo']
+			metricas.horas_bateria_baja = lectura['bateria_baja'] * INTERVALO_HORAS
+
+			# Huecos entre lecturas + hueco final hasta el fin del día
+			activo, inactivo = huecos.get(cruce_id, (0.0, 0.0))
+			hasta_fin = (fin - lectura['ultima']).total_seconds() / 3600
+			activo += min(hasta_fin, 1.0)
+			inactivo += max(hasta_fin - 1.0, 0.0)
+			metricas.tiempo_activo = activo
+			metricas.tiempo_inactivo = inactivo
+		else:
+			# Sin telemetría = todo el día inactivo y sin comunicación
+			metricas.tiempo_activo = 0
+			metricas.tiempo_inactivo = 24.0
+			metricas.tiempo_sin_comunicacion = 24.0
+
+		total_horas = metricas.tiempo_activo + metricas.tiempo_inactivo
+		metricas.disponibilidad_porcentaje = (metricas.tiempo_activo / total_horas) * 100 if total_horas > 0 else 0
+
+		metricas.total_eventos_barrera = eventos.get(cruce_id, {}).get('total', 0)
+
+		alerta = alertas.get(cruce_id, {})
+		metricas.total_alertas = alerta.get('total', 0)
+		metricas.alertas_criticas = alerta.get('criticas', 0)
+		metricas.alertas_resueltas = alerta.get('resueltas', 0)
+
+		mantenimiento = mantenimientos.get(cruce_id, {})
+		metricas.mantenimientos_realizados = mantenimiento.get('realizados', 0)
+		metricas.mantenimientos_preventivos = mantenimiento.get('preventivos', 0)
+		metricas.mantenimientos_correctivos = mantenimiento.get('correctivos', 0)
+
+		resultado.append(metricas)
+
+	return resultado
+
+
+def guardar(metricas):
+	"""Insertar o actualizar (cruce, fecha) en una sola sentencia"""
+	return MetricasDesempeno.objects.bulk_create(
+		metricas,
+		update_conflicts=True,
+		unique_fields=['cruce', 'fecha'],
+		update_fields=CAMPOS_CALCULADOS,
+	)
+
+
+def calcular_metricas(fecha, cruce_ids=None):
+	"""Calcular y guardar las métricas de `fecha`"""
+	metricas = calcular_dia(fecha, cruce_ids)
+	if metricas:
+		guardar(metricas)
+	return metricas
+
+
+# ============================================================================
+# BACKFILL POR RANGO DE FECHAS
+# ============================================================================
+
+def unidades(desde, hasta, cruce_ids=None, cruces_por_unidad=200):
+	"""
+	Unidades de trabajo (fecha, [cruce_ids]) para recalcular [desde, hasta].
+
+	Cada unidad se calcula por conjuntos; los bloques de cruces permiten
+	repartir también un rango corto entre varios procesos.
+	"""
+	if cruce_ids is None:
+		cruce_ids = list(Cruce.objects.order_by('id').values_list('id', flat=True))
+	bloques = [cruce_ids[i:i + cruces_por_unidad] for i in range(0, len(cruce_ids), cruces_por_unidad)]
+
+	resultado = []
+	fecha = desde
+	while fecha <= hasta:
+		resultado.extend((fecha, bloque) for bloque in bloques)
+		fecha += timedelta(days=1)
+	return resultado
+
+
+def recalcular_rango(desde, hasta, cruce_ids=None, workers=1, cruces_por_unidad=200, al_avanzar=None):
+	"""
+	Recalcular las métricas de [desde, hasta].
+
+	Args:
+		workers: Procesos del pool (1 = en este proceso)
+		al_avanzar: callback(hechas, total, fecha, cruces) tras cada unidad
+
+	Returns:
+		int: Filas de MetricasDesempeno calculadas
+	"""
+	from django.db import connections
+
+	trabajo = unidades(desde, hasta, cruce_ids, cruces_por_unidad)
+	total_filas = 0
+
+	if workers <= 1:
+		for hechas, unidad in enumerate(trabajo, 1):
+			fecha, cruces = procesar_unidad(unidad)
+			total_filas += cruces
+			if al_avanzar:
+				al_avanzar(hechas, len(trabajo), fecha, cruces)
+		return total_filas
+
+	# Los hijos no deben heredar las conexiones abiertas de este proceso;
+	# usan las mismas BD que éste (ver metricas_worker)
+	connections.close_all()
+	bases_de_datos = {conexion.alias: conexion.settings_dict for conexion in connections.all()}
+	contexto = multiprocessing.get_context('spawn')
+	with ProcessPoolExecutor(
+		max_workers=workers, mp_context=contexto,
+		initializer=inicializar, initargs=(bases_de_datos,)
+	) as pool:
+		futuros = [pool.submit(procesar_unidad, unidad) for unidad in trabajo]
+		for hechas, futuro in enumerate(as_completed(futuros), 1):
+			fecha, cruces = futuro.result()
+			total_filas += cruces
+			if al_avanzar:
+				al_avanzar(hechas, len(trabajo), fecha, cruces)
+	return total_filas
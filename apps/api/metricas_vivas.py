@@ -0,0 +1,332 @@
+"""
+Métricas del día en curso actualizadas durante la ingesta.
+
+Cada proceso (servidor o worker) acumula en memoria, por (cruce, fecha), las
+lecturas que confirma: cantidad, suma/mínimo/máximo de voltaje de batería,
+lecturas con batería baja, primera y última lectura (huecos) y eventos de
+barrera. Cada METRICAS_VIVAS_INTERVALO segundos los acumuladores se vuelcan
+sobre AcumuladoDiario con la fila bloqueada, así varios procesos pueden
+volcar sobre el mismo cruce.
+
+Los huecos usan la misma regla que calcular_metricas (hasta 1 hora por hueco
+es tiempo activo). Una lectura más antigua que la última ya registrada suma
+a los contadores pero no a los huecos. Si dos procesos vuelcan tramos que se
+solapan (lecturas intercaladas del mismo cruce), del tramo que llega después
+solo cuenta lo que se extiende más allá de la última lectura ya volcada, así
+activo + inactivo nunca supera el tiempo transcurrido. El cálculo nocturno
+corrige cualquier diferencia.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from datetime import timedelta
+import atexit
+import logging
+import threading
+import time
+
+from .models import AcumuladoDiario, Cruce, MetricasDesempeno
+from .metricas import UMBRAL_BATERIA_BAJA, INTERVALO_HORAS, HUECO_ACTIVO, rango_dia
+
+logger = logging.getLogger(__name__)
+
+_pendientes = {}
+_lock = threading.Lock()
+_ultimo_volcado = time.monotonic()
+
+
+class _Acumulado:
+	"""Acumulador en memoria de un (cruce, fecha)"""
+	__slots__ = (
+		'total', 'suma', 'minimo', 'maximo', 'bateria_baja',
+		'primera', 'ultima', 'activo', 'inactivo', 'eventos'
+	)
+
+	def __init__(self):
+		self.total = 0
+		self.suma = 0.0
+		self.minimo = None
+		self.maximo = None
+		self.bateria_baja = 0
+		self.primera = None
+		self.ultima = None
+		self.activo = 0.0
+		self.inactivo = 0.0
+		self.eventos = 0
+
+	def agregar(self, timestamp, voltaje):
+		self.total += 1
+		self.suma += voltaje
+		self.minimo = voltaje if self.minimo is None else min(self.minimo, voltaje)
+		self.maximo = voltaje if self.maximo is None else max(self.maximo, voltaje)
+		if voltaje < UMBRAL_BATERIA_BAJA:
+			self.bateria_baja += 1
+
+		if self.ultima is None:
+			self.primera = self.ultima = timestamp
+		elif timestamp >= self.ultima:
+			activo, inactivo = _partir_hueco(timestamp - self.ultima)
+			self.activo += activo
+			self.inactivo += inactivo
+			self.ultima = timestamp
+		else:
+			self.primera = min(self.primera, timestamp)
+
+
+def _partir_hueco(hueco):
+	"""Segundos (activo, inactivo) de un hueco entre lecturas"""
+	segundos = max(hueco.total_seconds(), 0.0)
+	limite = HUECO_ACTIVO.total_seconds()
+	return min(segundos, limite), max(segundos - limite, 0.0)
+
+
+def _acumulado(cruce_id, momento):
+	clave = (cruce_id, timezone.localdate(momento))
+	acumulado = _pendientes.get(clave)
+	if acumulado is None:
+		acumulado = _pendientes[clave] = _Acumulado()
+	return acumulado
+
+
+def registrar_telemetrias(telemetrias):
+	"""
+	Acumular lecturas insertadas. Se aplican al confirmarse la transacción
+	para no contar lecturas de una transacción revertida.
+	"""
+	lecturas = sorted(
+		((t.cruce_id, t.timestamp, t.battery_voltage) for t in telemetrias),
+		key=lambda lectura: lectura[1]
+	)
+
+	def acumular():
+		with _lock:
+			for cruce_id, timestamp, voltaje in lecturas:
+				_acumulado(cruce_id, timestamp).agregar(timestamp, voltaje)
+		volcar_si_corresponde()
+
+	transaction.on_commit(acumular)
+
+
+def registrar_evento(barrier_event):
+	"""Acumular un evento de barrera"""
+	def acumular():
+		with _lock:
+			_acumulado(barrier_event.cruce_id, barrier_event.event_time).eventos += 1
+		volcar_si_corresponde()
+
+	transaction.on_commit(acumular)
+
+
+def volcar_si_corresponde():
+	"""Volcar si pasó METRICAS_VIVAS_INTERVALO desde el último volcado"""
+	intervalo = getattr(settings, 'METRICAS_VIVAS_INTERVALO', 30)
+	if time.monotonic() - _ultimo_volcado >= intervalo:
+		volcar()
+
+
+def volcar():
+	"""
+	Sumar los acumuladores de este proceso a AcumuladoDiario.
+
+	Returns:
+		int: Filas (cruce, fecha) actualizadas
+	"""
+	global _pendientes, _ultimo_volcado
+
+	with _lock:
+		pendientes, _pendientes = _pendientes, {}
+		_ultimo_volcado = time.monotonic()
+	if not pendientes:
+		return 0
+
+	try:
+		_volcar(pendientes)
+	except Exception as e:
+		# Reponer lo no volcado para el próximo intento
+		with _lock:
+			for clave, acumulado in pendientes.items():
+				_reponer(clave, acumulado)
+		logger.error(f"❌ Error al volcar métricas del día: {str(e)}")
+		return 0
+	return len(pendientes)
+
+
+def _reponer(clave, acumulado):
+	# Lo acumulado mientras tanto va después de lo que no se pudo volcar
+	posterior = _pendientes.get(clave)
+	if posterior is not None:
+		_combinar(acumulado, posterior)
+	_pendientes[clave] = acumulado
+
+
+def _combinar(destino, origen):
+	"""Sumar `origen` a `destino`, siendo `destino` el tramo anterior"""
+	destino.total += origen.total
+	destino.suma += origen.suma
+	destino.bateria_baja += origen.bateria_baja
+	destino.eventos += origen.eventos
+	if origen.minimo is not None:
+		destino.minimo = origen.minimo if destino.minimo is None else min(destino.minimo, origen.minimo)
+		destino.maximo = origen.maximo if destino.maximo is None else max(destino.maximo, origen.maximo)
+	if origen.ultima is None:
+		return
+
+	if destino.ultima is None:
+		destino.primera, destino.ultima = origen.primera, origen.ultima
+		destino.activo += origen.activo
+		destino.inactivo += origen.inactivo
+		return
+	if origen.primera >= destino.ultima:
+		# Tramos consecutivos: sus huecos más el que los une
+		activo, inactivo = _partir_hueco(origen.primera - destino.ultima)
+		destino.activo += origen.activo + activo
+		destino.inactivo += origen.inactivo + inactivo
+	elif origen.ultima > destino.ultima:
+		# Tramos solapados (otro proceso con lecturas intercaladas): solo
+		# cuenta la extensión, como mucho con el tiempo activo de `origen`
+		extension = (origen.ultima - destino.ultima).total_seconds()
+		activo = min(extension, origen.activo)
+		destino.activo += activo
+		destino.inactivo += extension - activo
+	destino.primera = min(destino.primera, origen.primera)
+	destino.ultima = max(destino.ultima, origen.ultima)
+
+
+def _volcar(pendientes):
+	# Cruces eliminados entre la ingesta y el volcado se descartan
+	cruce_ids = set(Cruce.objects.filter(
+		id__in={cruce_id for cruce_id, _ in pendientes}
+	).values_list('id', flat=True))
+	pendientes = {clave: acumulado for clave, acumulado in pendientes.items() if clave[0] in cruce_ids}
+	fechas = {fecha for _, fecha in pendientes}
+
+	with transaction.atomic():
+		# Crear las filas que falten y bloquear todas antes de combinar
+		AcumuladoDiario.objects.bulk_create(
+			[AcumuladoDiario(cruce_id=cruce_id, fecha=fecha) for cruce_id, fecha in pendientes],
+			ignore_conflicts=True
+		)
+		filas = {
+			(fila.cruce_id, fila.fecha): fila
+			for fila in AcumuladoDiario.objects.select_for_update().filter(
+				cruce_id__in=cruce_ids, fecha__in=fechas
+			)
+		}
+
+		actualizadas = []
+		for clave, acumulado in pendientes.items():
+			fila = filas[clave]
+			actual = _desde_fila(fila)
+			if actual.ultima is None and acumulado.ultima is not None:
+				# Primer hueco del día: desde las 00:00 hasta la primera lectura
+				actual.ultima = rango_dia(fila.fecha)[0]
+				actual.primera = acumulado.primera
+			_combinar(actual, acumulado)
+			_a_fila(actual, fila)
+			fila.updated_at = timezone.now()
+			actualizadas.append(fila)
+
+		AcumuladoDiario.objects.bulk_update(actualizadas, [
+			'total_telemetrias', 'suma_voltaje', 'voltaje_minimo', 'voltaje_maximo',
+			'muestras_bateria_baja', 'primera_telemetria', 'ultima_telemetria',
+			'segundos_activo', 'segundos_inactivo', 'total_eventos_barrera', 'updated_at',
+		])
+
+
+def _desde_fila(fila):
+	acumulado = _Acumulado()
+	acumulado.total = fila.total_telemetrias
+	acumulado.suma = fila.suma_voltaje
+	acumulado.minimo = fila.voltaje_minimo
+	acumulado.maximo = fila.voltaje_maximo
+	acumulado.bateria_baja = fila.muestras_bateria_baja
+	acumulado.primera = fila.primera_telemetria
+	acumulado.ultima = fila.ultima_telemetria
+	acumulado.activo = fila.segundos_activo
+	acumulado.inactivo = fila.segundos_inactivo
+	acumulado.eventos = fila.total_eventos_barrera
+	return acumulado
+
+
+def _a_fila(acumulado, fila):
+	fila.total_telemetrias = acumulado.total
+	fila.suma_voltaje = acumulado.suma
+	fila.voltaje_minimo = acumulado.minimo
+	fila.voltaje_maximo = acumulado.maximo
+	fila.muestras_bateria_baja = acumulado.bateria_baja
+	fila.primera_telemetria = acumulado.primera
+	fila.ultima_telemetria = acumulado.ultima
+	fila.segundos_activo = acumulado.activo
+	fila.segundos_inactivo = acumulado.inactivo
+	fila.total_eventos_barrera = acumulado.eventos
+
+
+def purgar(antes_de):
+	"""Eliminar acumulados de días anteriores a `antes_de` (ya calculados)"""
+	return AcumuladoDiario.objects.filter(fecha__lt=antes_de).delete()[0]
+
+
+def metricas_hoy(cruce_id=None):
+	"""
+	Métricas parciales de hoy (sin guardar) a partir de AcumuladoDiario.
+
+	El último hueco se cuenta hasta ahora en lugar de hasta el fin del día.
+	Antes se vuelca lo pendiente de este proceso.
+
+	Returns:
+		list: Instancias de MetricasDesempeno sin guardar, una por cruce
+
+	Raises:
+		ValueError: `cruce_id` no es un entero
+	"""
+	if cruce_id:
+		cruce_id = int(cruce_id)
+	volcar()
+
+	ahora = timezone.now()
+	hoy = timezone.localdate(ahora)
+	inicio, _ = rango_dia(hoy)
+
+	cruces = Cruce.objects.order_by('id')
+	acumulados = AcumuladoDiario.objects.filter(fecha=hoy)
+	if cruce_id:
+		cruces = cruces.filter(id=cruce_id)
+		acumulados = acumulados.filter(cruce_id=cruce_id)
+	acumulados = {fila.cruce_id: fila for fila in acumulados}
+
+	resultado = []
+	for cruce in cruces:
+		metricas = MetricasDesempeno(cruce=cruce, fecha=hoy, updated_at=ahora)
+		fila = acumulados.get(cruce.id)
+
+		if fila and fila.ultima_telemetria:
+			activo, inactivo = _partir_hueco(ahora - fila.ultima_telemetria)
+			metricas.tiempo_activo = (fila.segundos_activo + activo) / 3600
+			metricas.tiempo_inactivo = (fila.segundos_inactivo + inactivo) / 3600
+			metricas.total_telemetrias = fila.total_telemetrias
+			metricas.voltaje_promedio = fila.suma_voltaje / fila.total_telemetrias
+			metricas.voltaje_minimo = fila.voltaje_minimo
+			metricas.voltaje_maximo = fila.voltaje_maximo
+			metricas.horas_bateria_baja = fila.muestras_bateria_baja * INTERVALO_HORAS
+		else:
+			transcurrido = (ahora - inicio) / timedelta(hours=1)
+			metricas.tiempo_activo = 0
+			metricas.tiempo_inactivo = transcurrido
+			metricas.tiempo_sin_comunicacion = transcurrido
+
+		total_horas = metricas.tiempo_activo + metricas.tiempo_inactivo
+		metricas.disponibilidad_porcentaje = (metricas.tiempo_activo / total_horas) * 100 if total_horas > 0 else 0
+		metricas.total_eventos_barrera = fila.total_eventos_barrera if fila else 0
+		resultado.append(metricas)
+
+	return resultado
+
+
+def _volcar_al_salir():
+	try:
+		volcar()
+	except Exception:
+		pass
+
+
+atexit.register(_volcar_al_salir)
@@ -0,0 +1,35 @@
+"""
+Entrada de los procesos del pool de recalcular_rango (metricas.py).
+
+Los procesos 'spawn' importan este módulo para deserializar el inicializador
+y las unidades antes de que Django esté configurado, así que no importa
+modelos al cargarse: inicializar() llama a django.setup() y procesar_unidad()
+importa el cálculo al ejecutarse.
+"""
+
+
+def inicializar(bases_de_datos=None):
+	"""
+	Configurar Django en el proceso del pool.
+
+	Args:
+		bases_de_datos: {alias: settings_dict} de las conexiones del proceso
+			padre, para usar las mismas BD aunque se hayan cambiado en
+			ejecución (p. ej. la BD de tests). La conexión se abre en el
+			primer uso y el proceso la mantiene para todas sus unidades.
+	"""
+	import django
+	django.setup()
+
+	if bases_de_datos:
+		from django.db import connections
+		for alias, ajustes in bases_de_datos.items():
+			connections[alias].settings_dict.update(ajustes)
+
+
+def procesar_unidad(unidad):
+	"""Calcular una unidad (fecha, [cruce_ids]) y devolver (fecha, filas)"""
+	from .metricas import calcular_metricas
+
+	fecha, cruce_ids = unidad
+	return fecha, len(calcular_metricas(fecha, cruce_ids))
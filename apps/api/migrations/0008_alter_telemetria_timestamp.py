@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-17 10:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_add_mantenimiento_preventivo'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='telemetria',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
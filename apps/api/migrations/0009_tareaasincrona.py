@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-17 01:52
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_alter_telemetria_timestamp'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TareaAsincrona',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=50, verbose_name='Tipo de Tarea')),
+                ('payload', models.JSONField(default=dict, verbose_name='Datos')),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('FALLIDA', 'Fallida')], default='PENDIENTE', max_length=20, verbose_name='Estado')),
+                ('intentos', models.IntegerField(default=0, verbose_name='Intentos Realizados')),
+                ('disponible_en', models.DateTimeField(default=django.utils.timezone.now, help_text='No se procesa antes de este momento (reintentos con backoff)', verbose_name='Disponible Desde')),
+                ('ultimo_error', models.TextField(blank=True, verbose_name='Último Error')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Tarea Asíncrona',
+                'verbose_name_plural': 'Tareas Asíncronas',
+                'ordering': ['disponible_en'],
+                'indexes': [models.Index(fields=['estado', 'disponible_en'], name='tarea_estado_disponible_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 5.2.8 on 2026-10-17 01:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def poblar_estado_actual(apps, schema_editor):
+    """Crear la fila de estado de cada cruce a partir de los datos existentes"""
+    from django.db.models import Count, Q
+
+    Cruce = apps.get_model('api', 'Cruce')
+    Telemetria = apps.get_model('api', 'Telemetria')
+    BarrierEvent = apps.get_model('api', 'BarrierEvent')
+    Alerta = apps.get_model('api', 'Alerta')
+    CruceEstadoActual = apps.get_model('api', 'CruceEstadoActual')
+
+    campos_telemetria = (
+        'barrier_voltage', 'battery_voltage', 'barrier_status',
+        'sensor_1', 'sensor_2', 'sensor_3', 'sensor_4',
+        'signal_strength', 'temperature',
+    )
+
+    estados = []
+    for cruce in Cruce.objects.all().iterator():
+        estado = CruceEstadoActual(cruce=cruce)
+
+        telemetria = Telemetria.objects.filter(cruce=cruce).order_by('-timestamp').first()
+        if telemetria:
+            estado.telemetria = telemetria
+            estado.timestamp = telemetria.timestamp
+            for campo in campos_telemetria:
+                setattr(estado, campo, getattr(telemetria, campo))
+
+        evento = BarrierEvent.objects.filter(cruce=cruce).order_by('-event_time').first()
+        if evento:
+            estado.ultimo_evento = evento.event_time
+            estado.ultimo_evento_estado = evento.state
+
+        conteos = Alerta.objects.filter(cruce=cruce, resolved=False).aggregate(
+            alertas_activas=Count('id'),
+            alertas_criticas=Count('id', filter=Q(severity='CRITICAL')),
+            alertas_warning=Count('id', filter=Q(severity='WARNING')),
+            alertas_info=Count('id', filter=Q(severity='INFO')),
+        )
+        for campo, valor in conteos.items():
+            setattr(estado, campo, valor)
+
+        estados.append(estado)
+
+    CruceEstadoActual.objects.bulk_create(estados, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_tareaasincrona'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CruceEstadoActual',
+            fields=[
+                ('cruce', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='estado_actual', serialize=False, to='api.cruce')),
+                ('timestamp', models.DateTimeField(blank=True, null=True)),
+                ('barrier_voltage', models.FloatField(blank=True, null=True)),
+                ('battery_voltage', models.FloatField(blank=True, null=True)),
+                ('barrier_status', models.CharField(blank=True, max_length=4, null=True)),
+                ('sensor_1', models.IntegerField(blank=True, null=True)),
+                ('sensor_2', models.IntegerField(blank=True, null=True)),
+                ('sensor_3', models.IntegerField(blank=True, null=True)),
+                ('sensor_4', models.IntegerField(blank=True, null=True)),
+                ('signal_strength', models.IntegerField(blank=True, null=True)),
+                ('temperature', models.FloatField(blank=True, null=True)),
+                ('ultimo_evento', models.DateTimeField(blank=True, null=True)),
+                ('ultimo_evento_estado', models.CharField(blank=True, max_length=4, null=True)),
+                ('alertas_activas', models.IntegerField(default=0)),
+                ('alertas_criticas', models.IntegerField(default=0)),
+                ('alertas_warning', models.IntegerField(default=0)),
+                ('alertas_info', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('telemetria', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.telemetria')),
+            ],
+            options={
+                'verbose_name': 'Estado Actual de Cruce',
+                'verbose_name_plural': 'Estados Actuales de Cruces',
+            },
+        ),
+        migrations.RunPython(poblar_estado_actual, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_cruceestadoactual'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoExportacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('telemetria', 'Telemetría'), ('alertas', 'Alertas')], max_length=20, verbose_name='Datos')),
+                ('formato', models.CharField(choices=[('csv', 'CSV'), ('parquet', 'Parquet'), ('arrow', 'Arrow IPC')], default='csv', max_length=10, verbose_name='Formato')),
+                ('filtros', models.JSONField(blank=True, default=dict, help_text='Mismos parámetros que el endpoint de listado', verbose_name='Filtros')),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('COMPLETADO', 'Completado'), ('FALLIDO', 'Fallido')], default='PENDIENTE', max_length=20, verbose_name='Estado')),
+                ('archivo', models.CharField(blank=True, max_length=500, verbose_name='Ruta del Archivo')),
+                ('filas', models.BigIntegerField(blank=True, null=True, verbose_name='Filas Exportadas')),
+                ('tamano_bytes', models.BigIntegerField(blank=True, null=True, verbose_name='Tamaño (bytes)')),
+                ('error', models.TextField(blank=True, verbose_name='Error')),
+                ('completado_at', models.DateTimeField(blank=True, null=True, verbose_name='Completado')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='exportaciones', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Trabajo de Exportación',
+                'verbose_name_plural': 'Trabajos de Exportación',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
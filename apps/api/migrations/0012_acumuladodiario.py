@@ -0,0 +1,38 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_trabajoexportacion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AcumuladoDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(verbose_name='Fecha')),
+                ('total_telemetrias', models.IntegerField(default=0, verbose_name='Total Telemetrías')),
+                ('suma_voltaje', models.FloatField(default=0, verbose_name='Suma Voltaje Batería')),
+                ('voltaje_minimo', models.FloatField(blank=True, null=True, verbose_name='Voltaje Mínimo (V)')),
+                ('voltaje_maximo', models.FloatField(blank=True, null=True, verbose_name='Voltaje Máximo (V)')),
+                ('muestras_bateria_baja', models.IntegerField(default=0, verbose_name='Lecturas con Batería Baja')),
+                ('primera_telemetria', models.DateTimeField(blank=True, null=True, verbose_name='Primera Lectura')),
+                ('ultima_telemetria', models.DateTimeField(blank=True, null=True, verbose_name='Última Lectura')),
+                ('segundos_activo', models.FloatField(default=0, help_text='Huecos entre lecturas hasta la última', verbose_name='Tiempo Activo (s)')),
+                ('segundos_inactivo', models.FloatField(default=0, verbose_name='Tiempo Inactivo (s)')),
+                ('total_eventos_barrera', models.IntegerField(default=0, verbose_name='Total Eventos de Barrera')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('cruce', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='acumulados', to='api.cruce')),
+            ],
+            options={
+                'verbose_name': 'Acumulado Diario',
+                'verbose_name_plural': 'Acumulados Diarios',
+                'unique_together': {('cruce', 'fecha')},
+            },
+        ),
+    ]
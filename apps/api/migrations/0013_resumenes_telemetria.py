@@ -0,0 +1,85 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_acumuladodiario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProgresoResumen',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=50, unique=True)),
+                ('ultimo_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Progreso de Resumen',
+                'verbose_name_plural': 'Progreso de Resúmenes',
+            },
+        ),
+        migrations.CreateModel(
+            name='TelemetriaHora',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inicio', models.DateTimeField(verbose_name='Inicio del Intervalo')),
+                ('lecturas', models.IntegerField(default=0, verbose_name='Lecturas')),
+                ('battery_voltage_min', models.FloatField(blank=True, null=True)),
+                ('battery_voltage_max', models.FloatField(blank=True, null=True)),
+                ('battery_voltage_avg', models.FloatField(blank=True, null=True)),
+                ('barrier_voltage_min', models.FloatField(blank=True, null=True)),
+                ('barrier_voltage_max', models.FloatField(blank=True, null=True)),
+                ('barrier_voltage_avg', models.FloatField(blank=True, null=True)),
+                ('temperature_min', models.FloatField(blank=True, null=True)),
+                ('temperature_max', models.FloatField(blank=True, null=True)),
+                ('temperature_avg', models.FloatField(blank=True, null=True)),
+                ('signal_strength_min', models.IntegerField(blank=True, null=True)),
+                ('signal_strength_max', models.IntegerField(blank=True, null=True)),
+                ('signal_strength_avg', models.FloatField(blank=True, null=True)),
+                ('lecturas_barrera_abajo', models.IntegerField(default=0, verbose_name='Lecturas con Barrera Abajo')),
+                ('cruce', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.cruce')),
+            ],
+            options={
+                'verbose_name': 'Telemetría por Hora',
+                'verbose_name_plural': 'Telemetría por Hora',
+                'ordering': ['cruce', 'inicio'],
+                'abstract': False,
+                'unique_together': {('cruce', 'inicio')},
+            },
+        ),
+        migrations.CreateModel(
+            name='TelemetriaMinuto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inicio', models.DateTimeField(verbose_name='Inicio del Intervalo')),
+                ('lecturas', models.IntegerField(default=0, verbose_name='Lecturas')),
+                ('battery_voltage_min', models.FloatField(blank=True, null=True)),
+                ('battery_voltage_max', models.FloatField(blank=True, null=True)),
+                ('battery_voltage_avg', models.FloatField(blank=True, null=True)),
+                ('barrier_voltage_min', models.FloatField(blank=True, null=True)),
+                ('barrier_voltage_max', models.FloatField(blank=True, null=True)),
+                ('barrier_voltage_avg', models.FloatField(blank=True, null=True)),
+                ('temperature_min', models.FloatField(blank=True, null=True)),
+                ('temperature_max', models.FloatField(blank=True, null=True)),
+                ('temperature_avg', models.FloatField(blank=True, null=True)),
+                ('signal_strength_min', models.IntegerField(blank=True, null=True)),
+                ('signal_strength_max', models.IntegerField(blank=True, null=True)),
+                ('signal_strength_avg', models.FloatField(blank=True, null=True)),
+                ('lecturas_barrera_abajo', models.IntegerField(default=0, verbose_name='Lecturas con Barrera Abajo')),
+                ('cruce', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.cruce')),
+            ],
+            options={
+                'verbose_name': 'Telemetría por Minuto',
+                'verbose_name_plural': 'Telemetría por Minuto',
+                'ordering': ['cruce', 'inicio'],
+                'abstract': False,
+                'unique_together': {('cruce', 'inicio')},
+            },
+        ),
+    ]
@@ -0,0 +1,122 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:18
+
+import django.db.models.deletion
+from datetime import date, timezone as dt_timezone
+from django.db import migrations, models
+from django.utils import timezone
+
+# Tabla -> columna de partición
+TABLAS = {
+    'api_telemetria': 'timestamp',
+    'api_barrierevent': 'event_time',
+}
+MESES_ADELANTE = 3
+# Lecturas más antiguas (relojes desfasados) van a la partición por defecto
+MESES_HISTORIA_MAX = 120
+
+
+def _sumar_meses(mes, meses):
+    indice = mes.year * 12 + mes.month - 1 + meses
+    return date(indice // 12, indice % 12 + 1, 1)
+
+
+def _reconstruir(cursor, tabla, columna, particionada):
+    """
+    Recrear `tabla` (particionada por mes o como tabla simple) copiando sus
+    filas, índices y FKs. La PK de una tabla particionada debe incluir la
+    columna de partición: pasa a ser (id, columna).
+    """
+    nueva = f'{tabla}_nueva'
+    cursor.execute(f'LOCK TABLE "{tabla}" IN ACCESS EXCLUSIVE MODE')
+
+    cursor.execute(
+        'SELECT indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s '
+        'AND indexname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass)',
+        [tabla, tabla]
+    )
+    indices = [fila[0] for fila in cursor.fetchall()]
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+        [tabla]
+    )
+    fks = cursor.fetchall()
+    cursor.execute(f'SELECT MIN("{columna}"), MAX(id) FROM "{tabla}"')
+    minimo, maximo_id = cursor.fetchone()
+
+    particion = f' PARTITION BY RANGE ("{columna}")' if particionada else ''
+    cursor.execute(f'CREATE TABLE "{nueva}" (LIKE "{tabla}" INCLUDING DEFAULTS){particion}')
+    # El id pasa a una secuencia propia (la actual se elimina con la tabla)
+    cursor.execute(f'ALTER TABLE "{nueva}" ALTER COLUMN id DROP DEFAULT')
+    clave = f'id, "{columna}"' if particionada else 'id'
+    cursor.execute(f'ALTER TABLE "{nueva}" ADD CONSTRAINT "{nueva}_pkey" PRIMARY KEY ({clave})')
+
+    if particionada:
+        actual = timezone.now().astimezone(dt_timezone.utc).date().replace(day=1)
+        mes = _sumar_meses(actual, -MESES_HISTORIA_MAX)
+        if minimo is not None:
+            mes = max(mes, minimo.astimezone(dt_timezone.utc).date().replace(day=1))
+        while mes <= _sumar_meses(actual, MESES_ADELANTE):
+            siguiente = _sumar_meses(mes, 1)
+            cursor.execute(
+                f'CREATE TABLE "{tabla}_p{mes.year:04d}_{mes.month:02d}" PARTITION OF "{nueva}" '
+                f"FOR VALUES FROM ('{mes.isoformat()} 00:00+00') TO ('{siguiente.isoformat()} 00:00+00')"
+            )
+            mes = siguiente
+        cursor.execute(f'CREATE TABLE "{tabla}_default" PARTITION OF "{nueva}" DEFAULT')
+
+    cursor.execute(f'INSERT INTO "{nueva}" SELECT * FROM "{tabla}"')
+    cursor.execute(f'DROP TABLE "{tabla}"')
+    cursor.execute(f'ALTER TABLE "{nueva}" RENAME TO "{tabla}"')
+    cursor.execute(f'ALTER TABLE "{tabla}" RENAME CONSTRAINT "{nueva}_pkey" TO "{tabla}_pkey"')
+
+    cursor.execute(f'CREATE SEQUENCE "{tabla}_id_seq" AS bigint OWNED BY "{tabla}".id')
+    cursor.execute(f"SELECT setval('\"{tabla}_id_seq\"', %s, false)", [(maximo_id or 0) + 1])
+    cursor.execute(f'ALTER TABLE "{tabla}" ALTER COLUMN id SET DEFAULT nextval(\'"{tabla}_id_seq"\')')
+
+    for indice in indices:
+        cursor.execute(indice)
+    for nombre, definicion in fks:
+        cursor.execute(f'ALTER TABLE "{tabla}" ADD CONSTRAINT "{nombre}" {definicion}')
+
+
+def particionar(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for tabla, columna in TABLAS.items():
+            _reconstruir(cursor, tabla, columna, particionada=True)
+
+
+def desparticionar(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for tabla, columna in TABLAS.items():
+            _reconstruir(cursor, tabla, columna, particionada=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_resumenes_telemetria'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='alerta',
+            name='telemetria',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='alertas', to='api.telemetria'),
+        ),
+        migrations.AlterField(
+            model_name='barrierevent',
+            name='telemetria',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='barrier_events', to='api.telemetria'),
+        ),
+        migrations.AlterField(
+            model_name='cruceestadoactual',
+            name='telemetria',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.telemetria'),
+        ),
+        # Reescribe ambas tablas: aplicar en una ventana de mantenimiento
+        migrations.RunPython(particionar, desparticionar),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_particionar_telemetria'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='barrierevent',
+            name='telemetria',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='barrier_events', to='api.telemetria'),
+        ),
+        migrations.CreateModel(
+            name='ArchivoTelemetria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(help_text='Primer día del mes archivado', verbose_name='Mes')),
+                ('archivo', models.CharField(max_length=500, verbose_name='Ruta del Archivo')),
+                ('filas', models.BigIntegerField(default=0, verbose_name='Filas Archivadas')),
+                ('ultimo_id', models.BigIntegerField(default=0, verbose_name='Último ID Archivado')),
+                ('tamano_bytes', models.BigIntegerField(default=0, verbose_name='Tamaño (bytes)')),
+                ('desde', models.DateTimeField(blank=True, null=True, verbose_name='Primera Lectura')),
+                ('hasta', models.DateTimeField(blank=True, null=True, verbose_name='Última Lectura')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('cruce', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archivos_telemetria', to='api.cruce')),
+            ],
+            options={
+                'verbose_name': 'Archivo de Telemetría',
+                'verbose_name_plural': 'Archivos de Telemetría',
+                'ordering': ['cruce', 'mes'],
+                'unique_together': {('cruce', 'mes')},
+            },
+        ),
+    ]
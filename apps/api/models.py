@@ -1,5 +1,8 @@
 # Create your models here.
+import os
 from django.db import models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
 
@@ -92,7 +95,9 @@ class BarrierEvent(models.Model):
         ('UP', 'Barrera Arriba'),
     ]
     
-    telemetria = models.ForeignKey('Telemetria', on_delete=models.CASCADE, related_name='barrier_events')
+    # Sin FK en la BD: api_telemetria está particionada y su PK es (id, timestamp).
+    # El evento se conserva aunque la lectura se archive (archivar_telemetria)
+    telemetria = models.ForeignKey('Telemetria', on_delete=models.SET_NULL, null=True, blank=True, related_name='barrier_events', db_constraint=False)
     cruce = models.ForeignKey('Cruce', on_delete=models.CASCADE, related_name='barrier_events')
     state = models.CharField(max_length=4, choices=STATE_CHOICES)
     event_time = models.DateTimeField()
@@ -112,6 +117,27 @@ class BarrierEvent(models.Model):
         ]
 
 
+def _contar(queryset):
+    """Subquery con el COUNT(*) de `queryset` (0 si no hay filas)"""
+    return Coalesce(
+        Subquery(queryset.order_by().values('cruce').annotate(total=Count('pk')).values('total')[:1]),
+        0
+    )
+
+
+class CruceQuerySet(models.QuerySet):
+    def con_resumen(self):
+        """
+        Anotar los campos calculados de CruceSerializer (sensores, alertas
+        activas y estado actual) para serializar un listado en una sola query.
+        """
+        return self.select_related('estado_actual').annotate(
+            num_sensores=_contar(Sensor.objects.filter(cruce=OuterRef('pk'))),
+            num_sensores_activos=_contar(Sensor.objects.filter(cruce=OuterRef('pk'), activo=True)),
+            num_alertas_activas=_contar(Alerta.objects.filter(cruce=OuterRef('pk'), resolved=False)),
+        )
+
+
 class Cruce(models.Model):
     """Modelo para los cruces ferroviarios"""
     nombre = models.CharField(max_length=100)
@@ -122,6 +148,8 @@ class Cruce(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CruceQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.nombre} - {self.ubicacion}"
 
@@ -208,7 +236,8 @@ class Sensor(models.Model):
 class Telemetria(models.Model):
     """Modelo principal para las lecturas del ESP32"""
     cruce = models.ForeignKey(Cruce, on_delete=models.CASCADE, related_name='telemetrias')
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Por defecto el momento de recepción; los lotes de gateways pueden traer la hora de la lectura
+    timestamp = models.DateTimeField(default=timezone.now)
     
     # Voltajes principales
     barrier_voltage = models.FloatField()  # Voltaje de barrera del PLC (0-24V)
@@ -244,6 +273,59 @@ class Telemetria(models.Model):
         ]
 
 
+class CruceEstadoActual(models.Model):
+    """
+    Último estado conocido de cada cruce (una fila por cruce).
+    
+    Se actualiza al procesar la telemetría y con los eventos/alertas, para que
+    dashboard, mapa y detalle no busquen la telemetría más reciente por cruce.
+    """
+    cruce = models.OneToOneField(Cruce, on_delete=models.CASCADE, primary_key=True, related_name='estado_actual')
+    
+    # Última telemetría
+    telemetria = models.ForeignKey('Telemetria', on_delete=models.SET_NULL, null=True, blank=True, related_name='+', db_constraint=False)
+    timestamp = models.DateTimeField(null=True, blank=True)
+    barrier_voltage = models.FloatField(null=True, blank=True)
+    battery_voltage = models.FloatField(null=True, blank=True)
+    barrier_status = models.CharField(max_length=4, null=True, blank=True)
+    sensor_1 = models.IntegerField(null=True, blank=True)
+    sensor_2 = models.IntegerField(null=True, blank=True)
+    sensor_3 = models.IntegerField(null=True, blank=True)
+    sensor_4 = models.IntegerField(null=True, blank=True)
+    signal_strength = models.IntegerField(null=True, blank=True)
+    temperature = models.FloatField(null=True, blank=True)
+    
+    # Último evento de barrera
+    ultimo_evento = models.DateTimeField(null=True, blank=True)
+    ultimo_evento_estado = models.CharField(max_length=4, null=True, blank=True)
+    
+    # Alertas activas (no resueltas) por severidad
+    alertas_activas = models.IntegerField(default=0)
+    alertas_criticas = models.IntegerField(default=0)
+    alertas_warning = models.IntegerField(default=0)
+    alertas_info = models.IntegerField(default=0)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    # Campos copiados de Telemetria
+    CAMPOS_TELEMETRIA = (
+        'barrier_voltage', 'battery_voltage', 'barrier_status',
+        'sensor_1', 'sensor_2', 'sensor_3', 'sensor_4',
+        'signal_strength', 'temperature',
+    )
+    
+    @property
+    def tiene_telemetria(self):
+        return self.timestamp is not None
+    
+    def __str__(self):
+        return f"Estado actual {self.cruce_id} - {self.timestamp}"
+
+    class Meta:
+        verbose_name = "Estado Actual de Cruce"
+        verbose_name_plural = "Estados Actuales de Cruces"
+
+
 class Alerta(models.Model):
     """Alertas automáticas del sistema"""
     ALERT_TYPES = [
@@ -269,7 +351,8 @@ class Alerta(models.Model):
     resolved_at = models.DateTimeField(null=True, blank=True)
     
     # Relaciones
-    telemetria = models.ForeignKey(Telemetria, on_delete=models.SET_NULL, null=True, blank=True, related_name='alertas')
+    # Sin FK en la BD: api_telemetria está particionada (ver particiones)
+    telemetria = models.ForeignKey(Telemetria, on_delete=models.SET_NULL, null=True, blank=True, related_name='alertas', db_constraint=False)
     cruce = models.ForeignKey(Cruce, on_delete=models.CASCADE, related_name='alertas')
     sensor = models.ForeignKey(Sensor, on_delete=models.SET_NULL, null=True, blank=True, related_name='alertas')
     
@@ -514,3 +597,204 @@ class MetricasDesempeno(models.Model):
 			models.Index(fields=['-fecha', 'cruce'], name='metricas_fecha_cruce_idx'),
 			models.Index(fields=['cruce', 'disponibilidad_porcentaje'], name='metricas_cruce_disp_idx'),
 		]
+
+
+class TareaAsincrona(models.Model):
+	"""
+	Cola de trabajo en BD para el procesamiento posterior a la ingesta
+	(detección de eventos, alertas, notificaciones). La consume el comando
+	procesar_tareas; las tareas completadas se eliminan.
+	"""
+	ESTADO_CHOICES = [
+		('PENDIENTE', 'Pendiente'),
+		('FALLIDA', 'Fallida'),
+	]
+	
+	tipo = models.CharField(max_length=50, verbose_name="Tipo de Tarea")
+	payload = models.JSONField(default=dict, verbose_name="Datos")
+	estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='PENDIENTE', verbose_name="Estado")
+	intentos = models.IntegerField(default=0, verbose_name="Intentos Realizados")
+	disponible_en = models.DateTimeField(default=timezone.now, verbose_name="Disponible Desde", help_text="No se procesa antes de este momento (reintentos con backoff)")
+	ultimo_error = models.TextField(blank=True, verbose_name="Último Error")
+	created_at = models.DateTimeField(auto_now_add=True)
+	updated_at = models.DateTimeField(auto_now=True)
+	
+	def __str__(self):
+		return f"{self.tipo} #{self.id} - {self.get_estado_display()}"
+	
+	class Meta:
+		verbose_name = "Tarea Asíncrona"
+		verbose_name_plural = "Tareas Asíncronas"
+		ordering = ['disponible_en']
+		indexes = [
+			models.Index(fields=['estado', 'disponible_en'], name='tarea_estado_disponible_idx'),
+		]
+
+
+class TrabajoExportacion(models.Model):
+	"""
+	Exportación generada en segundo plano (tarea 'generar_exportacion').
+	El archivo queda en EXPORTACIONES_DIR hasta que se elimina el trabajo.
+	"""
+	TIPO_CHOICES = [
+		('telemetria', 'Telemetría'),
+		('alertas', 'Alertas'),
+	]
+	
+	FORMATO_CHOICES = [
+		('csv', 'CSV'),
+		('parquet', 'Parquet'),
+		('arrow', 'Arrow IPC'),
+	]
+	
+	ESTADO_CHOICES = [
+		('PENDIENTE', 'Pendiente'),
+		('COMPLETADO', 'Completado'),
+		('FALLIDO', 'Fallido'),
+	]
+	
+	usuario = models.ForeignKey('auth.User', on_delete=models.SET_NULL, null=True, blank=True, related_name='exportaciones')
+	tipo = models.CharField(max_length=20, choices=TIPO_CHOICES, verbose_name="Datos")
+	formato = models.CharField(max_length=10, choices=FORMATO_CHOICES, default='csv', verbose_name="Formato")
+	filtros = models.JSONField(default=dict, blank=True, verbose_name="Filtros", help_text="Mismos parámetros que el endpoint de listado")
+	estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='PENDIENTE', verbose_name="Estado")
+	archivo = models.CharField(max_length=500, blank=True, verbose_name="Ruta del Archivo")
+	filas = models.BigIntegerField(null=True, blank=True, verbose_name="Filas Exportadas")
+	tamano_bytes = models.BigIntegerField(null=True, blank=True, verbose_name="Tamaño (bytes)")
+	error = models.TextField(blank=True, verbose_name="Error")
+	completado_at = models.DateTimeField(null=True, blank=True, verbose_name="Completado")
+	created_at = models.DateTimeField(auto_now_add=True)
+	updated_at = models.DateTimeField(auto_now=True)
+	
+	def __str__(self):
+		return f"Exportación {self.tipo} #{self.id} ({self.formato}) - {self.get_estado_display()}"
+	
+	@property
+	def nombre_descarga(self):
+		"""Nombre del archivo para el cliente (con .gz si va comprimido)"""
+		if not self.archivo:
+			return None
+		return os.path.basename(self.archivo)
+	
+	class Meta:
+		verbose_name = "Trabajo de Exportación"
+		verbose_name_plural = "Trabajos de Exportación"
+		ordering = ['-created_at']
+
+
+class AcumuladoDiario(models.Model):
+	"""
+	Acumuladores del día en curso por cruce, actualizados durante la ingesta
+	(ver metricas_vivas). Permiten servir las métricas parciales del día sin
+	recorrer la telemetría; calcular_metricas sigue siendo el cálculo oficial.
+	"""
+	cruce = models.ForeignKey('Cruce', on_delete=models.CASCADE, related_name='acumulados')
+	fecha = models.DateField(verbose_name="Fecha")
+	total_telemetrias = models.IntegerField(default=0, verbose_name="Total Telemetrías")
+	suma_voltaje = models.FloatField(default=0, verbose_name="Suma Voltaje Batería")
+	voltaje_minimo = models.FloatField(null=True, blank=True, verbose_name="Voltaje Mínimo (V)")
+	voltaje_maximo = models.FloatField(null=True, blank=True, verbose_name="Voltaje Máximo (V)")
+	muestras_bateria_baja = models.IntegerField(default=0, verbose_name="Lecturas con Batería Baja")
+	primera_telemetria = models.DateTimeField(null=True, blank=True, verbose_name="Primera Lectura")
+	ultima_telemetria = models.DateTimeField(null=True, blank=True, verbose_name="Última Lectura")
+	segundos_activo = models.FloatField(default=0, verbose_name="Tiempo Activo (s)", help_text="Huecos entre lecturas hasta la última")
+	segundos_inactivo = models.FloatField(default=0, verbose_name="Tiempo Inactivo (s)")
+	total_eventos_barrera = models.IntegerField(default=0, verbose_name="Total Eventos de Barrera")
+	updated_at = models.DateTimeField(auto_now=True)
+	
+	def __str__(self):
+		return f"Acumulado {self.cruce_id} - {self.fecha} ({self.total_telemetrias} lecturas)"
+	
+	class Meta:
+		verbose_name = "Acumulado Diario"
+		verbose_name_plural = "Acumulados Diarios"
+		unique_together = [['cruce', 'fecha']]
+
+
+class ResumenTelemetria(models.Model):
+	"""
+	Base de los resúmenes de telemetría por intervalo y cruce (ver resumenes).
+	Cada fila agrega las lecturas de [inicio, inicio + intervalo).
+	"""
+	cruce = models.ForeignKey('Cruce', on_delete=models.CASCADE, related_name='+')
+	inicio = models.DateTimeField(verbose_name="Inicio del Intervalo")
+	lecturas = models.IntegerField(default=0, verbose_name="Lecturas")
+	
+	battery_voltage_min = models.FloatField(null=True, blank=True)
+	battery_voltage_max = models.FloatField(null=True, blank=True)
+	battery_voltage_avg = models.FloatField(null=True, blank=True)
+	barrier_voltage_min = models.FloatField(null=True, blank=True)
+	barrier_voltage_max = models.FloatField(null=True, blank=True)
+	barrier_voltage_avg = models.FloatField(null=True, blank=True)
+	temperature_min = models.FloatField(null=True, blank=True)
+	temperature_max = models.FloatField(null=True, blank=True)
+	temperature_avg = models.FloatField(null=True, blank=True)
+	signal_strength_min = models.IntegerField(null=True, blank=True)
+	signal_strength_max = models.IntegerField(null=True, blank=True)
+	signal_strength_avg = models.FloatField(null=True, blank=True)
+	
+	lecturas_barrera_abajo = models.IntegerField(default=0, verbose_name="Lecturas con Barrera Abajo")
+	
+	class Meta:
+		abstract = True
+		ordering = ['cruce', 'inicio']
+		unique_together = [['cruce', 'inicio']]
+	
+	def __str__(self):
+		return f"{self._meta.verbose_name} {self.cruce_id} - {self.inicio}"
+
+
+class TelemetriaMinuto(ResumenTelemetria):
+	"""Resumen de telemetría por minuto"""
+	
+	class Meta(ResumenTelemetria.Meta):
+		verbose_name = "Telemetría por Minuto"
+		verbose_name_plural = "Telemetría por Minuto"
+
+
+class TelemetriaHora(ResumenTelemetria):
+	"""Resumen de telemetría por hora"""
+	
+	class Meta(ResumenTelemetria.Meta):
+		verbose_name = "Telemetría por Hora"
+		verbose_name_plural = "Telemetría por Hora"
+
+
+class ProgresoResumen(models.Model):
+	"""Marca de agua del comando resumir_telemetria (último id de telemetría procesado)"""
+	nombre = models.CharField(max_length=50, unique=True)
+	ultimo_id = models.BigIntegerField(default=0)
+	updated_at = models.DateTimeField(auto_now=True)
+	
+	def __str__(self):
+		return f"{self.nombre}: {self.ultimo_id}"
+	
+	class Meta:
+		verbose_name = "Progreso de Resumen"
+		verbose_name_plural = "Progreso de Resúmenes"
+
+
+class ArchivoTelemetria(models.Model):
+	"""
+	Archivo comprimido con la telemetría cruda de un cruce en un mes, ya
+	eliminada de la tabla (ver archivo_telemetria).
+	"""
+	cruce = models.ForeignKey('Cruce', on_delete=models.CASCADE, related_name='archivos_telemetria')
+	mes = models.DateField(verbose_name="Mes", help_text="Primer día del mes archivado")
+	archivo = models.CharField(max_length=500, verbose_name="Ruta del Archivo")
+	filas = models.BigIntegerField(default=0, verbose_name="Filas Archivadas")
+	ultimo_id = models.BigIntegerField(default=0, verbose_name="Último ID Archivado")
+	tamano_bytes = models.BigIntegerField(default=0, verbose_name="Tamaño (bytes)")
+	desde = models.DateTimeField(null=True, blank=True, verbose_name="Primera Lectura")
+	hasta = models.DateTimeField(null=True, blank=True, verbose_name="Última Lectura")
+	created_at = models.DateTimeField(auto_now_add=True)
+	updated_at = models.DateTimeField(auto_now=True)
+	
+	def __str__(self):
+		return f"Archivo {self.cruce_id} - {self.mes:%Y-%m} ({self.filas} filas)"
+	
+	class Meta:
+		verbose_name = "Archivo de Telemetría"
+		verbose_name_plural = "Archivos de Telemetría"
+		ordering = ['cruce', 'mes']
+		unique_together = [['cruce', 'mes']]
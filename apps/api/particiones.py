@@ -0,0 +1,123 @@
+"""
+Particiones mensuales de api_telemetria y api_barrierevent (PostgreSQL).
+
+La migración 0014 convierte ambas tablas en tablas particionadas por rango
+del timestamp, con una partición por mes (`<tabla>_pYYYY_MM`, límites en UTC)
+y una partición por defecto (`<tabla>_default`) para lecturas fuera de rango.
+El comando gestionar_particiones crea por adelantado las de los próximos meses
+y desacopla (o elimina) las más antiguas que el período de retención: la
+retención pasa a ser una operación de metadatos en lugar de un DELETE masivo.
+"""
+from django.db import connection
+from datetime import date
+import re
+
+# Tabla -> columna de partición
+TABLAS = {
+	'api_telemetria': 'timestamp',
+	'api_barrierevent': 'event_time',
+}
+
+
+class ParticionesNoDisponibles(Exception):
+	"""La base de datos no es PostgreSQL o la tabla no está particionada"""
+
+
+def inicio_mes(fecha):
+	return date(fecha.year, fecha.month, 1)
+
+
+def sumar_meses(mes, meses):
+	indice = mes.year * 12 + mes.month - 1 + meses
+	return date(indice // 12, indice % 12 + 1, 1)
+
+
+def nombre_particion(tabla, mes):
+	return f'{tabla}_p{mes.year:04d}_{mes.month:02d}'
+
+
+def mes_de_particion(tabla, nombre):
+	"""Mes de una partición mensual por su nombre (None si no es mensual)"""
+	coincidencia = re.fullmatch(re.escape(tabla) + r'_p(\d{4})_(\d{2})', nombre)
+	if not coincidencia:
+		return None
+	return date(int(coincidencia.group(1)), int(coincidencia.group(2)), 1)
+
+
+def planificar(existentes, hoy, meses_adelante=3, retener_meses=None):
+	"""
+	Qué particiones crear y cuáles desacoplar.
+
+	Args:
+		existentes: Meses (date día 1) con partición
+		hoy: Fecha de referencia
+		meses_adelante: Meses futuros que deben existir además del actual
+		retener_meses: Meses completos a conservar antes del actual (None = todos)
+
+	Returns:
+		tuple: (meses a crear, meses a desacoplar), ordenados
+	"""
+	actual = inicio_mes(hoy)
+	necesarios = {sumar_meses(actual, i) for i in range(meses_adelante + 1)}
+	crear = sorted(necesarios - set(existentes))
+
+	desacoplar = []
+	if retener_meses is not None:
+		limite = sumar_meses(actual, -retener_meses)
+		desacoplar = sorted(mes for mes in existentes if mes < limite)
+
+	return crear, desacoplar
+
+
+def _verificar(cursor, tabla):
+	if connection.vendor != 'postgresql':
+		raise ParticionesNoDisponibles('Las particiones requieren PostgreSQL')
+	cursor.execute('SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)', [tabla])
+	fila = cursor.fetchone()
+	if not fila or fila[0] != 'p':
+		raise ParticionesNoDisponibles(f'{tabla} no está particionada (¿falta aplicar la migración 0014?)')
+
+
+def particiones(tabla):
+	"""Meses con partición mensual de `tabla`"""
+	with connection.cursor() as cursor:
+		_verificar(cursor, tabla)
+		cursor.execute(
+			'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+			'WHERE i.inhparent = to_regclass(%s)',
+			[tabla]
+		)
+		meses = [mes_de_particion(tabla, nombre) for nombre, in cursor.fetchall()]
+	return sorted(mes for mes in meses if mes)
+
+
+def crear_particion(tabla, mes):
+	"""
+	Crear la partición de `mes`.
+
+	Falla si la partición por defecto ya tiene filas de ese mes: hay que
+	moverlas a mano antes (normalmente solo pasa con relojes desfasados).
+	"""
+	nombre = nombre_particion(tabla, mes)
+	with connection.cursor() as cursor:
+		_verificar(cursor, tabla)
+		cursor.execute(
+			f'CREATE TABLE IF NOT EXISTS "{nombre}" PARTITION OF "{tabla}" '
+			f"FOR VALUES FROM ('{mes.isoformat()} 00:00+00') TO ('{sumar_meses(mes, 1).isoformat()} 00:00+00')"
+		)
+	return nombre
+
+
+def desacoplar_particion(tabla, mes, eliminar=False):
+	"""
+	Desacoplar la partición de `mes`: sus filas dejan de verse en la tabla
+	pero quedan en una tabla independiente (para respaldo), salvo que se
+	indique eliminar.
+	"""
+	nombre = nombre_particion(tabla, mes)
+	with connection.cursor() as cursor:
+		_verificar(cursor, tabla)
+		cursor.execute(f'ALTER TABLE "{tabla}" DETACH PARTITION "{nombre}"')
+		if eliminar:
+			cursor.execute(f'DROP TABLE "{nombre}"')
+	return nombre
@@ -0,0 +1,229 @@
+"""
+Resúmenes de telemetría por minuto y por hora para gráficos.
+
+El comando resumir_telemetria procesa la telemetría nueva (id mayor a la marca
+de agua de ProgresoResumen) y recalcula completos los intervalos que tocan
+esas lecturas, así una lectura atrasada corrige su intervalo en lugar de
+duplicarlo. Cada corrida vuelve a revisar los últimos RESUMEN_SOLAPE_IDS ids
+anteriores a la marca: cubren lecturas de transacciones que se confirmaron
+después de que se leyó la marca (recalcular un intervalo es idempotente).
+
+Los intervalos de un (cruce, mes) ya archivado (ArchivoTelemetria) no se
+recalculan: sus lecturas ya no están en la tabla y el resumen se reduciría a
+las que llegaron tarde. Esas lecturas atrasadas se agregan al archivo en la
+siguiente corrida de archivar_telemetria (y salen en las exportaciones), pero
+no en los gráficos.
+
+serie() elige la resolución según el rango pedido (lecturas crudas, minuto u
+hora) y completa el tramo aún no resumido agregando la telemetría cruda.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Avg, Count, F, Max, Min, Q
+from django.db.models.functions import Trunc
+from django.utils import timezone
+from datetime import datetime, timedelta
+import logging
+
+from .models import Telemetria, TelemetriaMinuto, TelemetriaHora, ProgresoResumen, ArchivoTelemetria
+
+logger = logging.getLogger(__name__)
+
+CAMPOS = ('battery_voltage', 'barrier_voltage', 'temperature', 'signal_strength')
+
+# resolución -> (modelo, unidad de Trunc, duración del intervalo)
+INTERVALOS = {
+	'minuto': (TelemetriaMinuto, 'minute', timedelta(minutes=1)),
+	'hora': (TelemetriaHora, 'hour', timedelta(hours=1)),
+}
+
+# Rango máximo de cada resolución en modo automático (~3000 puntos o menos)
+RESOLUCION_AUTOMATICA = (
+	(timedelta(hours=3), 'raw'),
+	(timedelta(days=2), 'minuto'),
+)
+
+# Tope de la resolución 'raw' pedida explícitamente: el rango de 'auto'
+RANGO_MAXIMO_RAW = RESOLUCION_AUTOMATICA[0][0]
+
+CAMPOS_RESUMEN = ['lecturas'] + [
+	f'{campo}_{agregado}' for campo in CAMPOS for agregado in ('min', 'max', 'avg')
+] + ['lecturas_barrera_abajo']
+
+
+def _agregados():
+	agregados = {
+		'lecturas': Count('id'),
+		'lecturas_barrera_abajo': Count('id', filter=Q(barrier_status='DOWN')),
+	}
+	for campo in CAMPOS:
+		agregados[f'{campo}_min'] = Min(campo)
+		agregados[f'{campo}_max'] = Max(campo)
+		agregados[f'{campo}_avg'] = Avg(campo)
+	return agregados
+
+
+def truncar(momento, unidad):
+	"""Inicio del intervalo (minuto u hora, en la zona horaria del proyecto)"""
+	momento = timezone.localtime(momento).replace(second=0, microsecond=0)
+	if unidad == 'hour':
+		momento = momento.replace(minute=0)
+	return momento
+
+
+def _agrupar(telemetrias, unidad):
+	"""Agregados por (cruce, intervalo) de un queryset de telemetría"""
+	return telemetrias.annotate(
+		inicio=Trunc('timestamp', unidad)
+	).values('cruce_id', 'inicio').annotate(**_agregados()).order_by('cruce_id', 'inicio')
+
+
+def _meses_archivados(rangos):
+	"""{cruce_id: [(inicio, fin)]} de los meses archivados que pueden tocar `rangos`"""
+	if not rangos:
+		return {}
+	hasta = timezone.localdate(max(rango['hasta'] for rango in rangos))
+	archivados = {}
+	for cruce_id, mes in ArchivoTelemetria.objects.filter(
+		cruce_id__in={rango['cruce_id'] for rango in rangos}, mes__lte=hasta
+	).values_list('cruce_id', 'mes'):
+		inicio = timezone.make_aware(datetime(mes.year, mes.month, 1))
+		fin = timezone.make_aware(datetime(mes.year + mes.month // 12, mes.month % 12 + 1, 1))
+		archivados.setdefault(cruce_id, []).append((inicio, fin))
+	return archivados
+
+
+def resumir(resolucion, nuevas):
+	"""
+	Recalcular los intervalos de `resolucion` que contienen lecturas de `nuevas`.
+
+	Returns:
+		int: Intervalos guardados
+	"""
+	modelo, unidad, duracion = INTERVALOS[resolucion]
+
+	rangos = list(nuevas.values('cruce_id').annotate(desde=Min('timestamp'), hasta=Max('timestamp')).order_by())
+	archivados = _meses_archivados(rangos)
+
+	# Rango afectado por cruce: de la primera a la última lectura nueva,
+	# sin los meses archivados del cruce
+	condicion = Q()
+	for rango in rangos:
+		desde = truncar(rango['desde'], unidad)
+		hasta = truncar(rango['hasta'], unidad) + duracion
+		rango_cruce = Q(cruce_id=rango['cruce_id'], timestamp__gte=desde, timestamp__lt=hasta)
+		for inicio_mes, fin_mes in archivados.get(rango['cruce_id'], ()):
+			if inicio_mes < hasta and fin_mes > desde:
+				logger.warning(
+					f"Resumen de telemetría: se omite {inicio_mes:%Y-%m} del cruce {rango['cruce_id']} (ya archivado)"
+				)
+				rango_cruce &= ~Q(timestamp__gte=inicio_mes, timestamp__lt=fin_mes)
+		condicion |= rango_cruce
+	if not condicion:
+		return 0
+
+	filas = [modelo(**fila) for fila in _agrupar(Telemetria.objects.filter(condicion), unidad)]
+	modelo.objects.bulk_create(
+		filas,
+		batch_size=1000,
+		update_conflicts=True,
+		unique_fields=['cruce', 'inicio'],
+		update_fields=CAMPOS_RESUMEN,
+	)
+	return len(filas)
+
+
+def resumir_pendiente(lote=50000, solape=None):
+	"""
+	Procesar la telemetría nueva desde la marca de agua, en tramos de `lote` ids.
+
+	Returns:
+		dict: {'lecturas': ..., 'minuto': intervalos, 'hora': intervalos}
+	"""
+	if solape is None:
+		solape = getattr(settings, 'RESUMEN_SOLAPE_IDS', 5000)
+
+	progreso, _ = ProgresoResumen.objects.get_or_create(nombre='telemetria')
+	maximo = Telemetria.objects.aggregate(maximo=Max('id'))['maximo'] or 0
+	desde_id = max(progreso.ultimo_id - solape, 0)
+	totales = {'lecturas': 0, 'minuto': 0, 'hora': 0}
+
+	while desde_id < maximo:
+		hasta_id = min(desde_id + lote, maximo)
+		nuevas = Telemetria.objects.filter(id__gt=desde_id, id__lte=hasta_id)
+
+		with transaction.atomic():
+			totales['lecturas'] += nuevas.count()
+			for resolucion in INTERVALOS:
+				totales[resolucion] += resumir(resolucion, nuevas)
+			ProgresoResumen.objects.filter(pk=progreso.pk, ultimo_id__lt=hasta_id).update(
+				ultimo_id=hasta_id, updated_at=timezone.now()
+			)
+
+		logger.info(f"Resumen de telemetría: ids {desde_id + 1}-{hasta_id} procesados")
+		desde_id = hasta_id
+
+	return totales
+
+
+def elegir_resolucion(desde, hasta):
+	"""Resolución automática para el rango [desde, hasta]"""
+	for rango_maximo, resolucion in RESOLUCION_AUTOMATICA:
+		if hasta - desde <= rango_maximo:
+			return resolucion
+	return 'hora'
+
+
+def serie(cruce_id, desde, hasta, resolucion='auto'):
+	"""
+	Serie temporal de un cruce para gráficos.
+
+	Con resolución 'raw' cada punto es una lectura; con 'minuto'/'hora' cada
+	punto es un intervalo con lecturas, min/max/avg de cada campo y lecturas
+	con barrera abajo. Los intervalos posteriores al último resumido se
+	agregan al vuelo desde la telemetría cruda.
+
+	Returns:
+		tuple: (resolucion, puntos)
+
+	Raises:
+		ValueError: 'raw' con un rango mayor a RANGO_MAXIMO_RAW o con más de
+			SERIES_MAX_PUNTOS_RAW lecturas
+	"""
+	if resolucion == 'auto':
+		resolucion = elegir_resolucion(desde, hasta)
+
+	telemetrias = Telemetria.objects.filter(cruce_id=cruce_id, timestamp__lte=hasta)
+
+	if resolucion == 'raw':
+		if hasta - desde > RANGO_MAXIMO_RAW:
+			raise ValueError(
+				f'resolucion raw admite hasta {RANGO_MAXIMO_RAW / timedelta(hours=1):g} horas; use minuto u hora'
+			)
+		limite = getattr(settings, 'SERIES_MAX_PUNTOS_RAW', 10000)
+		puntos = list(telemetrias.filter(timestamp__gte=desde).order_by('timestamp').values(
+			'timestamp', *CAMPOS, 'barrier_status'
+		)[:limite + 1])
+		if len(puntos) > limite:
+			raise ValueError(f'El rango tiene más de {limite} lecturas; use minuto u hora')
+		return resolucion, puntos
+
+	modelo, unidad, _ = INTERVALOS[resolucion]
+	inicio = truncar(desde, unidad)
+
+	ultimo = modelo.objects.filter(cruce_id=cruce_id, inicio__gte=inicio, inicio__lte=hasta).aggregate(
+		ultimo=Max('inicio')
+	)['ultimo']
+	# El último intervalo resumido puede estar incompleto: se recalcula
+	corte = ultimo or inicio
+
+	puntos = list(
+		modelo.objects.filter(cruce_id=cruce_id, inicio__gte=inicio, inicio__lt=corte)
+		.order_by('inicio').values(*CAMPOS_RESUMEN, timestamp=F('inicio'))
+	)
+	for fila in _agrupar(telemetrias.filter(timestamp__gte=corte), unidad):
+		fila.pop('cruce_id')
+		fila['timestamp'] = fila.pop('inicio')
+		puntos.append(fila)
+
+	return resolucion, puntos
@@ -2,10 +2,11 @@ from rest_framework import serializers
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
 from django.core.exceptions import ObjectDoesNotExist
+from django.utils.dateparse import parse_date, parse_datetime
 from rest_framework_simplejwt.tokens import RefreshToken
 from .models import (
 	Telemetria, Cruce, Sensor, BarrierEvent, Alerta, UserNotificationSettings, UserProfile,
-	MantenimientoPreventivo, HistorialMantenimiento, MetricasDesempeno
+	MantenimientoPreventivo, HistorialMantenimiento, MetricasDesempeno, TrabajoExportacion
 )
 
 class UserProfileSerializer(serializers.ModelSerializer):
@@ -207,20 +208,28 @@ class CruceSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ('created_at', 'updated_at')
     
+    # Los conteos vienen anotados si el cruce se obtuvo con
+    # Cruce.objects.con_resumen(); si no, se consultan aquí
+    
     def get_total_sensores(self, obj):
         """Obtener total de sensores del cruce"""
+        if hasattr(obj, 'num_sensores'):
+            return obj.num_sensores
         return obj.sensores.count()
     
     def get_sensores_activos(self, obj):
         """Obtener cantidad de sensores activos"""
+        if hasattr(obj, 'num_sensores_activos'):
+            return obj.num_sensores_activos
         return obj.sensores.filter(activo=True).count()
     
     def get_ultima_telemetria(self, obj):
         """Obtener última telemetría del cruce"""
-        ultima = obj.telemetrias.order_by('-timestamp').first()
-        if ultima:
+        from .estado_actual import obtener
+        ultima = obtener(obj)
+        if ultima and ultima.tiene_telemetria:
             return {
-                'id': ultima.id,
+                'id': ultima.telemetria_id,
                 'timestamp': ultima.timestamp,
                 'barrier_voltage': ultima.barrier_voltage,
                 'battery_voltage': ultima.battery_voltage,
@@ -232,6 +241,8 @@ class CruceSerializer(serializers.ModelSerializer):
     
     def get_alertas_activas(self, obj):
         """Obtener cantidad de alertas activas"""
+        if hasattr(obj, 'num_alertas_activas'):
+            return obj.num_alertas_activas
         return obj.alertas.filter(resolved=False).count()
 
 class SensorSerializer(serializers.ModelSerializer):
@@ -321,9 +332,8 @@ class AlertaSerializer(serializers.ModelSerializer):
         return value
 
 
-class ESP32TelemetriaSerializer(serializers.Serializer):
-    """Serializer específico para ESP32 - Sin autenticación JWT"""
-    esp32_token = serializers.CharField(max_length=200, write_only=True, min_length=10)
+class ESP32LecturaSerializer(serializers.Serializer):
+    """Serializer de una lectura del ESP32 (sin token), usado también en lotes"""
     cruce_id = serializers.IntegerField(min_value=1)
     
     # Voltajes principales
@@ -339,22 +349,10 @@ class ESP32TelemetriaSerializer(serializers.Serializer):
     # Información adicional del ESP32 (opcionales)
     signal_strength = serializers.IntegerField(required=False, allow_null=True, min_value=-120, max_value=0)
     temperature = serializers.FloatField(required=False, allow_null=True, min_value=-40.0, max_value=85.0)
-
-    def validate_esp32_token(self, value):
-        """Validar token del ESP32"""
-        from django.conf import settings
-        expected_token = getattr(settings, 'ESP32_TOKEN', 'esp32_default_token_123')
-        if value != expected_token:
-            raise serializers.ValidationError("Token de ESP32 inválido")
-        return value
-
-    def validate_cruce_id(self, value):
-        """Validar que el cruce existe"""
-        try:
-            Cruce.objects.get(id=value, estado='ACTIVO')
-        except Cruce.DoesNotExist:
-            raise serializers.ValidationError("Cruce no encontrado o inactivo")
-        return value
+    
+    # Momento de la lectura (opcional). Los gateways lo envían cuando
+    # reenvían lecturas acumuladas durante un corte de comunicación.
+    timestamp = serializers.DateTimeField(required=False, allow_null=True)
 
     def validate_barrier_voltage(self, value):
         """Validar rango de voltaje de barrera (0-24V)"""
@@ -392,6 +390,61 @@ class ESP32TelemetriaSerializer(serializers.Serializer):
             raise serializers.ValidationError("El valor del sensor debe estar entre 0 y 1023")
         return value
 
+    def validate_timestamp(self, value):
+        """Validar que la lectura no sea en el futuro (se toleran 5 minutos de desfase de reloj)"""
+        from django.utils import timezone
+        if value and value > timezone.now() + timezone.timedelta(minutes=5):
+            raise serializers.ValidationError("La lectura no puede ser en el futuro")
+        return value
+
+
+class ESP32TelemetriaSerializer(ESP32LecturaSerializer):
+    """Serializer específico para ESP32 - Sin autenticación JWT"""
+    esp32_token = serializers.CharField(max_length=200, write_only=True, min_length=10)
+
+    def validate_esp32_token(self, value):
+        """Validar token del ESP32"""
+        from django.conf import settings
+        expected_token = getattr(settings, 'ESP32_TOKEN', 'esp32_default_token_123')
+        if value != expected_token:
+            raise serializers.ValidationError("Token de ESP32 inválido")
+        return value
+
+    def validate_cruce_id(self, value):
+        """Validar que el cruce existe"""
+        try:
+            Cruce.objects.get(id=value, estado='ACTIVO')
+        except Cruce.DoesNotExist:
+            raise serializers.ValidationError("Cruce no encontrado o inactivo")
+        return value
+
+
+class ESP32TelemetriaBatchSerializer(serializers.Serializer):
+    """
+    Serializer para lotes de lecturas enviados por gateways ESP32.
+    
+    Solo valida el token y la forma del lote; cada lectura se valida por separado
+    con ESP32LecturaSerializer para poder aceptar las válidas y reportar las rechazadas.
+    """
+    esp32_token = serializers.CharField(max_length=200, write_only=True, min_length=10)
+    lecturas = serializers.ListField(child=serializers.DictField(), allow_empty=False)
+
+    def validate_esp32_token(self, value):
+        """Validar token del ESP32"""
+        from django.conf import settings
+        expected_token = getattr(settings, 'ESP32_TOKEN', 'esp32_default_token_123')
+        if value != expected_token:
+            raise serializers.ValidationError("Token de ESP32 inválido")
+        return value
+
+    def validate_lecturas(self, value):
+        """Validar tamaño máximo del lote"""
+        from django.conf import settings
+        max_lecturas = getattr(settings, 'ESP32_BATCH_MAX_LECTURAS', 500)
+        if len(value) > max_lecturas:
+            raise serializers.ValidationError(f"El lote no puede superar {max_lecturas} lecturas")
+        return value
+
 
 class UserNotificationSettingsSerializer(serializers.ModelSerializer):
     """Serializer para configuración de notificaciones del usuario"""
@@ -438,4 +491,51 @@ class MetricasDesempenoSerializer(serializers.ModelSerializer):
 	class Meta:
 		model = MetricasDesempeno
 		fields = '__all__'
-		read_only_fields = ('created_at', 'updated_at')
\ No newline at end of file
+		read_only_fields = ('created_at', 'updated_at')
+
+
+class TrabajoExportacionSerializer(serializers.ModelSerializer):
+	"""Serializer para exportaciones en segundo plano"""
+	# Filtros aceptados por tipo (los mismos que el listado correspondiente)
+	FILTROS_PERMITIDOS = {
+		'telemetria': ('cruce_id', 'fecha_desde', 'fecha_hasta'),
+		'alertas': ('cruce_id', 'tipo', 'resuelta', 'severidad', 'fecha_desde', 'fecha_hasta'),
+	}
+	
+	estado_display = serializers.CharField(source='get_estado_display', read_only=True)
+	nombre_archivo = serializers.CharField(source='nombre_descarga', read_only=True)
+	
+	class Meta:
+		model = TrabajoExportacion
+		fields = (
+			'id', 'tipo', 'formato', 'filtros', 'estado', 'estado_display',
+			'filas', 'tamano_bytes', 'nombre_archivo', 'error', 'created_at', 'completado_at'
+		)
+		read_only_fields = ('estado', 'filas', 'tamano_bytes', 'error', 'created_at', 'completado_at')
+	
+	def validate(self, data):
+		filtros = data.get('filtros') or {}
+		if not isinstance(filtros, dict):
+			raise serializers.ValidationError({'filtros': 'Debe ser un objeto'})
+		
+		permitidos = self.FILTROS_PERMITIDOS[data['tipo']]
+		invalidos = sorted(set(filtros) - set(permitidos))
+		if invalidos:
+			raise serializers.ValidationError({
+				'filtros': f"Filtros no válidos para {data['tipo']}: {', '.join(invalidos)}. Permitidos: {', '.join(permitidos)}"
+			})
+		
+		for clave in ('fecha_desde', 'fecha_hasta'):
+			valor = filtros.get(clave)
+			if not valor:
+				continue
+			try:
+				valida = parse_datetime(str(valor)) is not None or parse_date(str(valor)) is not None
+			except ValueError:
+				valida = False
+			if not valida:
+				raise serializers.ValidationError({'filtros': f'Fecha inválida en {clave}: {valor}'})
+		
+		# Como query params: valores de texto
+		data['filtros'] = {clave: str(valor).lower() if isinstance(valor, bool) else str(valor) for clave, valor in filtros.items() if valor is not None}
+		return data
@@ -2,10 +2,13 @@
 Señales para crear automáticamente el perfil de usuario
 y emitir eventos Socket.IO cuando ocurren cambios en el sistema
 """
+from django.db import transaction
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import UserProfile, Telemetria, BarrierEvent, Alerta, Cruce
+from .models import (
+	UserProfile, Telemetria, BarrierEvent, Alerta, Cruce, CruceEstadoActual, MantenimientoPreventivo
+)
 from .socketio_utils import (
 	emit_telemetria,
 	emit_barrier_event,
@@ -13,6 +16,7 @@ from .socketio_utils import (
 	emit_alerta_resuelta,
 	emit_cruce_update,
 )
+from . import dashboard_stream, estado_actual, metricas_vivas
 
 
 @receiver(post_save, sender=User)
@@ -35,6 +39,9 @@ def telemetria_created(sender, instance, created, **kwargs):
 	if created:
 		try:
 			emit_telemetria(instance)
+			# Las lecturas de un lote ya se publicaron juntas (dashboard_stream.publicar_lote)
+			if not getattr(instance, '_dashboard_publicado', False):
+				dashboard_stream.publicar_telemetria(instance)
 		except Exception as e:
 			import logging
 			logger = logging.getLogger(__name__)
@@ -47,14 +54,29 @@ def barrier_event_created(sender, instance, created, **kwargs):
 	Emitir evento Socket.IO cuando se crea un evento de barrera
 	"""
 	if created:
+		# Último evento del cruce (la detección por lotes ya lo registró)
+		if not getattr(instance, '_estado_actual_registrado', False):
+			estado_actual.registrar_evento(instance)
+		metricas_vivas.registrar_evento(instance)
 		try:
 			emit_barrier_event(instance)
+			if not getattr(instance, '_dashboard_publicado', False):
+				dashboard_stream.publicar_evento_barrera(instance)
 		except Exception as e:
 			import logging
 			logger = logging.getLogger(__name__)
 			logger.error(f"Error al emitir evento de barrera: {str(e)}")
 
 
+@receiver(post_delete, sender=BarrierEvent)
+def barrier_event_deleted(sender, instance, **kwargs):
+	"""
+	Recalcular el último evento del cruce (CruceEstadoActual) al eliminar un
+	evento: la detección de eventos compara con él
+	"""
+	estado_actual.recalcular_evento(instance.cruce_id)
+
+
 @receiver(post_save, sender=Alerta)
 def alerta_created_or_updated(sender, instance, created, **kwargs):
 	"""
@@ -86,6 +108,46 @@ def alerta_created_or_updated(sender, instance, created, **kwargs):
 				logger.error(f"Error al emitir alerta resuelta: {str(e)}")
 
 
+@receiver(post_save, sender=Alerta)
+@receiver(post_delete, sender=Alerta)
+def alerta_estado_actual(sender, instance, **kwargs):
+	"""
+	Recontar las alertas activas del cruce (CruceEstadoActual) y publicar
+	el nuevo número en el canal 'dashboard'
+	"""
+	if getattr(instance, '_dashboard_publicado', False):
+		# Creada en lote: recontada y publicada una vez para todo su cruce
+		return
+	try:
+		if getattr(instance, '_estado_actual_registrado', False):
+			total = instance._alertas_activas
+		else:
+			total = estado_actual.recalcular_alertas(
+				instance.cruce_id, crear=kwargs.get('signal') is post_save
+			)['alertas_activas']
+		dashboard_stream.publicar_alertas_activas(instance.cruce_id, total=total)
+	except Exception as e:
+		import logging
+		logger = logging.getLogger(__name__)
+		logger.error(f"Error al publicar delta de alertas: {str(e)}")
+
+
+@receiver(post_save, sender=MantenimientoPreventivo)
+@receiver(post_delete, sender=MantenimientoPreventivo)
+def regla_mantenimiento_modificada(sender, instance, **kwargs):
+	"""
+	Recompilar el índice de reglas del motor de mantenimiento: ya y de nuevo
+	al confirmarse la transacción, para que ningún proceso compile el estado
+	anterior mientras tanto. Al eliminar una regla se borran sus estadísticas.
+	"""
+	from .mantenimiento_engine import invalidar_reglas, estadisticas_reglas, motor_mantenimiento
+	motor_mantenimiento.invalidar()
+	invalidar_reglas()
+	transaction.on_commit(invalidar_reglas)
+	if kwargs.get('signal') is post_delete:
+		estadisticas_reglas.reiniciar([instance.id])
+
+
 @receiver(post_save, sender=Cruce)
 def cruce_created_or_updated(sender, instance, created, **kwargs):
 	"""
@@ -94,6 +156,9 @@ def cruce_created_or_updated(sender, instance, created, **kwargs):
 	import logging
 	logger = logging.getLogger(__name__)
 	
+	if created:
+		CruceEstadoActual.objects.get_or_create(cruce=instance)
+	
 	try:
 		action = "creado" if created else "actualizado"
 		logger.info(f"📡 Signal post_save recibido: Cruce {instance.id} {action} (Nombre: {instance.nombre})")
@@ -14,6 +14,7 @@ Seguridad implementada:
 - Validación de datos
 """
 import socketio
+import asyncio
 import logging
 from django.conf import settings
 from rest_framework_simplejwt.tokens import UntypedToken
@@ -52,8 +53,12 @@ if settings.DEBUG:
 			socketio_cors_origins.append(origin)
 
 # Configuración de Socket.IO con seguridad desde settings
+# Con SOCKETIO_CLIENT_MANAGER los emits se reparten entre todos los workers
+from .socketio_managers import crear_client_manager
+
 sio = socketio.AsyncServer(
 	async_mode='asgi',
+	client_manager=crear_client_manager(),
 	cors_allowed_origins=socketio_cors_origins if socketio_cors_origins else '*',  # Permitir todos en desarrollo si está vacío
 	cors_credentials=getattr(settings, 'SOCKETIO_CORS_CREDENTIALS', True),
 	ping_timeout=getattr(settings, 'SOCKETIO_PING_TIMEOUT', 60),
@@ -217,6 +222,10 @@ async def connect(sid, environ, auth):
 	Requiere autenticación JWT en el campo 'token' de auth.
 	"""
 	try:
+		# Registrar el loop del servidor para el emisor de eventos de Django
+		from .socketio_utils import emisor
+		emisor.registrar_loop(asyncio.get_running_loop())
+		
 		# Obtener información del cliente
 		client_ip = get_client_ip(environ)
 		
@@ -316,6 +325,18 @@ async def disconnect(sid, reason=None):
 		logger.error(f"Error en desconexión Socket.IO: {str(e)}")
 
 
+async def enviar_snapshot_dashboard(sid):
+	"""
+	Enviar el estado completo del dashboard a un cliente recién suscrito.
+	Se entra a la sala antes de leer la BD, así que ningún delta se pierde.
+	"""
+	from .dashboard_stream import construir_dashboard
+	
+	snapshot = await sync_to_async(construir_dashboard)()
+	snapshot['type'] = 'dashboard_snapshot'
+	await sio.emit('dashboard_snapshot', snapshot, room=sid)
+
+
 @sio.event
 async def subscribe(sid, data):
 	"""
@@ -326,6 +347,8 @@ async def subscribe(sid, data):
 	- barrier_events: Eventos de barrera
 	- alertas: Alertas del sistema
 	- cruce_{id}: Eventos de un cruce específico
+	- dashboard: Snapshot inicial ('dashboard_snapshot') y luego solo
+	  cambios por cruce ('dashboard_delta')
 	"""
 	try:
 		# Verificar e incrementar rate limit de eventos
@@ -351,7 +374,7 @@ async def subscribe(sid, data):
 			events = [events]
 		
 		# Validar eventos permitidos
-		allowed_events = ['telemetria', 'barrier_events', 'alertas', 'notifications']
+		allowed_events = ['telemetria', 'barrier_events', 'alertas', 'notifications', 'dashboard']
 		
 		for event in events:
 			if event.startswith('cruce_'):
@@ -364,6 +387,8 @@ async def subscribe(sid, data):
 				# Suscripción a evento general
 				await sio.enter_room(sid, event)
 				logger.info(f"Usuario {user_id} suscrito a {event}")
+				if event == 'dashboard':
+					await enviar_snapshot_dashboard(sid)
 			else:
 				logger.warning(f"Intento de suscripción a evento no permitido: {event}")
 		
@@ -409,6 +434,8 @@ async def join_room(sid, data):
 		room = data['room']
 		await sio.enter_room(sid, room)
 		logger.info(f"Usuario {user_id} se unió a sala: {room}")
+		if room == 'dashboard':
+			await enviar_snapshot_dashboard(sid)
 		
 		await sio.emit('joined_room', {
 			'status': 'success',
@@ -0,0 +1,240 @@
+"""
+Client managers de Socket.IO para repartir eventos entre procesos.
+
+Con varios workers de gunicorn (o el worker procesar_tareas) cada proceso tiene
+su propio AsyncServer; con el manager por defecto un emit solo llega a los
+sockets conectados a ese proceso. Estos managers publican cada emit en un bus
+compartido para que todos los workers lo entreguen a sus clientes:
+
+- PostgresNotifyManager: LISTEN/NOTIFY sobre la misma BD, sin servicios extra.
+- LocalPubSubManager: bus en memoria del proceso, para tests.
+
+Se elige con SOCKETIO_CLIENT_MANAGER ('postgres', 'local' o vacío).
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+import uuid
+from django.conf import settings
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+logger = logging.getLogger(__name__)
+
+# NOTIFY admite payloads de hasta 8000 bytes; se deja margen para la cabecera
+LIMITE_PAYLOAD_NOTIFY = 7900
+PREFIJO_FRAGMENTO = 'frag:'
+
+
+def fragmentar(mensaje, limite=LIMITE_PAYLOAD_NOTIFY):
+	"""
+	Dividir un mensaje (str ASCII) en payloads aptos para NOTIFY.
+
+	Los mensajes cortos se envían tal cual. Los largos se parten en fragmentos
+	'frag:<id>:<indice>:<total>:<contenido>' que el receptor reensambla.
+	"""
+	if len(mensaje) <= limite:
+		return [mensaje]
+
+	mensaje_id = uuid.uuid4().hex
+	cabecera = len(f'{PREFIJO_FRAGMENTO}{mensaje_id}:99999:99999:')
+	tamano = limite - cabecera
+	partes = [mensaje[i:i + tamano] for i in range(0, len(mensaje), tamano)]
+	return [
+		f'{PREFIJO_FRAGMENTO}{mensaje_id}:{indice}:{len(partes)}:{parte}'
+		for indice, parte in enumerate(partes)
+	]
+
+
+class Reensamblador:
+	"""Reconstruir mensajes fragmentados por fragmentar()"""
+
+	def __init__(self, expiracion=30):
+		self.expiracion = expiracion
+		self._pendientes = {}
+
+	def agregar(self, payload):
+		"""
+		Procesar un payload recibido.
+
+		Returns:
+			str: Mensaje completo, o None si faltan fragmentos
+		"""
+		if not payload.startswith(PREFIJO_FRAGMENTO):
+			return payload
+
+		mensaje_id, indice, total, contenido = payload[len(PREFIJO_FRAGMENTO):].split(':', 3)
+		ahora = time.monotonic()
+		inicio, partes = self._pendientes.setdefault(mensaje_id, (ahora, {}))
+		partes[int(indice)] = contenido
+
+		if len(partes) < int(total):
+			self._purgar(ahora)
+			return None
+
+		del self._pendientes[mensaje_id]
+		return ''.join(partes[i] for i in range(int(total)))
+
+	def _purgar(self, ahora):
+		# Fragmentos de mensajes que nunca se completaron (p. ej. reconexión)
+		for mensaje_id, (inicio, _) in list(self._pendientes.items()):
+			if ahora - inicio > self.expiracion:
+				del self._pendientes[mensaje_id]
+
+
+class PostgresNotifyManager(AsyncPubSubManager):
+	"""
+	Manager Socket.IO sobre PostgreSQL LISTEN/NOTIFY.
+
+	Usa dos conexiones psycopg2 propias (fuera del ORM): una para publicar y
+	otra para escuchar, integrada en el event loop con add_reader. Los mensajes
+	que superan el límite de NOTIFY se fragmentan y se envían en una única
+	transacción, de modo que llegan juntos y en orden.
+	"""
+	name = 'postgres_notify'
+
+	def __init__(self, channel='socketio', write_only=False, logger=None, conexion=None):
+		super().__init__(channel=channel, write_only=write_only, logger=logger)
+		self._parametros_conexion = conexion
+		self._conexion_publicar = None
+		self._lock_publicar = threading.Lock()
+
+	def _conectar(self):
+		import psycopg2
+		from django.db import connections
+
+		parametros = dict(self._parametros_conexion or connections['default'].get_connection_params())
+		parametros.pop('cursor_factory', None)
+		conexion = psycopg2.connect(**parametros)
+		conexion.autocommit = True
+		return conexion
+
+	def _publicar_sync(self, payloads):
+		with self._lock_publicar:
+			for intento in range(2):
+				try:
+					if self._conexion_publicar is None or self._conexion_publicar.closed:
+						self._conexion_publicar = self._conectar()
+					conexion = self._conexion_publicar
+					with conexion.cursor() as cursor:
+						if len(payloads) > 1:
+							cursor.execute('BEGIN')
+						for payload in payloads:
+							cursor.execute('SELECT pg_notify(%s, %s)', (self.channel, payload))
+						if len(payloads) > 1:
+							cursor.execute('COMMIT')
+					return
+				except Exception:
+					# Conexión caída: se descarta y se reintenta una vez
+					if self._conexion_publicar is not None:
+						try:
+							self._conexion_publicar.close()
+						except Exception:
+							pass
+					self._conexion_publicar = None
+					if intento:
+						raise
+
+	async def _publish(self, data):
+		payloads = fragmentar(json.dumps(data, ensure_ascii=True))
+		loop = asyncio.get_running_loop()
+		await loop.run_in_executor(None, self._publicar_sync, payloads)
+
+	async def _listen(self):
+		reensamblador = Reensamblador()
+		loop = asyncio.get_running_loop()
+
+		while True:
+			cola = asyncio.Queue()
+			conexion = None
+			try:
+				conexion = await loop.run_in_executor(None, self._conectar)
+				with conexion.cursor() as cursor:
+					cursor.execute(f'LISTEN "{self.channel}"')
+
+				def leer():
+					try:
+						conexion.poll()
+					except Exception as e:
+						cola.put_nowait(e)
+						return
+					while conexion.notifies:
+						cola.put_nowait(conexion.notifies.pop(0).payload)
+
+				loop.add_reader(conexion.fileno(), leer)
+				logger.info(f"✅ Escuchando canal '{self.channel}' (PostgreSQL LISTEN/NOTIFY)")
+				try:
+					while True:
+						payload = await cola.get()
+						if isinstance(payload, Exception):
+							raise payload
+						mensaje = reensamblador.agregar(payload)
+						if mensaje is not None:
+							yield mensaje
+				finally:
+					loop.remove_reader(conexion.fileno())
+			except asyncio.CancelledError:
+				raise
+			except Exception as e:
+				logger.error(f"❌ Error en LISTEN '{self.channel}', reconectando en 1s: {str(e)}")
+				await asyncio.sleep(1)
+			finally:
+				if conexion is not None and not conexion.closed:
+					conexion.close()
+
+
+class LocalPubSubManager(AsyncPubSubManager):
+	"""
+	Manager Socket.IO con un bus en memoria del proceso.
+
+	Todos los managers con el mismo canal comparten los mensajes, igual que
+	varios workers con PostgresNotifyManager. Pensado para tests.
+	"""
+	name = 'local_pubsub'
+	_suscriptores = {}
+
+	def __init__(self, channel='socketio', write_only=False, logger=None):
+		super().__init__(channel=channel, write_only=write_only, logger=logger)
+		self._cola = None
+		if not write_only:
+			self._cola = asyncio.Queue()
+			self._suscriptores.setdefault(channel, []).append(self._cola)
+
+	async def _publish(self, data):
+		mensaje = json.dumps(data)
+		for cola in self._suscriptores.get(self.channel, []):
+			cola.put_nowait(mensaje)
+
+	async def _listen(self):
+		while True:
+			yield await self._cola.get()
+
+	def cerrar(self):
+		"""Dejar de recibir mensajes del canal"""
+		if self._cola in self._suscriptores.get(self.channel, []):
+			self._suscriptores[self.channel].remove(self._cola)
+
+
+def crear_client_manager():
+	"""
+	Crear el client manager según SOCKETIO_CLIENT_MANAGER.
+
+	Returns:
+		AsyncPubSubManager o None (manager en memoria de un solo proceso)
+	"""
+	tipo = getattr(settings, 'SOCKETIO_CLIENT_MANAGER', '')
+	canal = getattr(settings, 'SOCKETIO_CHANNEL', 'socketio')
+
+	if tipo == 'postgres':
+		motor = settings.DATABASES['default']['ENGINE']
+		if 'postgresql' not in motor:
+			logger.warning(f"⚠️ SOCKETIO_CLIENT_MANAGER=postgres requiere PostgreSQL (motor: {motor}). "
+						   f"Usando manager de un solo proceso")
+			return None
+		return PostgresNotifyManager(channel=canal)
+	if tipo == 'local':
+		return LocalPubSubManager(channel=canal)
+	if tipo:
+		logger.warning(f"⚠️ SOCKETIO_CLIENT_MANAGER desconocido: {tipo}. Usando manager de un solo proceso")
+	return None
@@ -4,315 +4,470 @@ Utilidades para emitir eventos Socket.IO desde Django.
 Este módulo proporciona funciones para emitir eventos en tiempo real
 cuando ocurren cambios en el sistema (telemetría, alertas, eventos de barrera).
 
-Nota: Estas funciones deben ejecutarse en un contexto asíncrono.
-Para uso desde código síncrono (como signals de Django), usar threading + asyncio.run().
+Las funciones emit_* son síncronas (se llaman desde signals de Django):
+serializan los datos en el thread que las llama y dejan las emisiones en la
+cola acotada de un emisor persistente (un thread y un event loop por proceso),
+que es quien ejecuta los sio.emit. Si la cola se llena se aplica la política
+SOCKETIO_EMIT_QUEUE_POLICY y se contabiliza en las métricas del emisor.
+
+La telemetría no se emite lectura a lectura: se agrupa por sala durante
+SOCKETIO_TELEMETRIA_VENTANA_MS y se emite un único frame 'telemetria_batch'.
+Los eventos por lectura (new_telemetria/telemetria) solo se mantienen con
+SOCKETIO_TELEMETRIA_LEGACY para clientes antiguos.
 """
 import logging
 import asyncio
+import atexit
+import json
+import os
 import threading
+import time
+from collections import deque, OrderedDict
+from datetime import datetime
+from django.conf import settings
 from .socketio_app import sio
 
 logger = logging.getLogger(__name__)
 
 
-def _run_async_in_thread(async_func, *args, **kwargs):
+def _json_safe(data):
+	"""Convertir datetimes/decimales a tipos JSON (los datos viajan entre threads)"""
+	def json_serial(obj):
+		if isinstance(obj, datetime):
+			return obj.isoformat()
+		return str(obj)
+
+	return json.loads(json.dumps(data, default=json_serial))
+
+
+class EmisorSocketIO:
 	"""
-	Helper común para ejecutar funciones asíncronas en un thread separado.
-	
-	Esto evita conflictos con el event loop principal cuando se llama desde
-	código síncrono (como signals de Django).
-	
-	Args:
-		async_func: Función asíncrona a ejecutar
-		*args, **kwargs: Argumentos para la función asíncrona
+	Emisor persistente de eventos Socket.IO.
+
+	Un único thread consumidor por proceso toma lotes de la cola y los emite.
+	Si el servidor ASGI ya registró su event loop (al conectarse el primer
+	cliente), las emisiones se ejecutan en ese loop; si no (p. ej. en el worker
+	procesar_tareas), en un loop propio que vive lo mismo que el thread.
+
+	Cada entrada es una lista de emisiones (evento, datos, sala). Las entradas con
+	clave se coalescen: una entrada nueva reemplaza a la pendiente con la misma
+	clave (p. ej. cruce_update del mismo cruce).
+
+	agregar_a_lote() acumula items por (evento, sala) durante la ventana
+	configurada; al cerrarse la ventana se encola un único frame con todos.
 	"""
-	try:
-		def run_async():
-			asyncio.run(async_func(*args, **kwargs))
-		
-		thread = threading.Thread(target=run_async, daemon=True)
-		thread.start()
-	except Exception as e:
-		logger.error(f"Error al ejecutar función asíncrona en thread: {str(e)}", exc_info=True)
 
+	POLITICAS = ('drop_oldest', 'drop_newest')
+	LOTE_MAXIMO = 100
+	ITEMS_MAXIMOS_POR_FRAME = 500
 
-async def _emit_telemetria_async(telemetria_instance):
-	"""Función asíncrona interna para emitir telemetría"""
-	try:
-		from .serializers import TelemetriaSerializer
-		
-		serializer = TelemetriaSerializer(telemetria_instance)
-		data = serializer.data
-		
-		event_data = {
-			'type': 'telemetria',
-			'data': data,
-			'timestamp': telemetria_instance.timestamp.isoformat(),
+	def __init__(self, capacidad=None, politica=None, ventana_ms=None):
+		self.capacidad = capacidad or getattr(settings, 'SOCKETIO_EMIT_QUEUE_SIZE', 10000)
+		self.politica = politica or getattr(settings, 'SOCKETIO_EMIT_QUEUE_POLICY', 'drop_oldest')
+		if ventana_ms is None:
+			ventana_ms = getattr(settings, 'SOCKETIO_TELEMETRIA_VENTANA_MS', 250)
+		self.ventana = ventana_ms / 1000
+		if self.politica not in self.POLITICAS:
+			raise ValueError(f'Política de cola inválida: {self.politica}')
+
+		lock = threading.Lock()
+		self._condicion = threading.Condition(lock)  # Hay entradas en la cola
+		self._vacia = threading.Condition(lock)  # Se terminó de emitir un lote
+		self._cola = deque()
+		self._por_clave = {}
+		self._lotes = OrderedDict()  # (evento, sala) -> (cierre, [items])
+		self._thread = None
+		self._pid = None
+		self._loop = None
+		self._loop_servidor = None
+		self._en_vuelo = 0
+		self._metricas = OrderedDict(
+			encoladas=0,
+			coalescidas=0,
+			descartadas=0,
+			emitidas=0,
+			errores=0,
+			profundidad_maxima=0,
+			agrupadas=0,
+			frames_agrupados=0,
+		)
+
+	def registrar_loop(self, loop):
+		"""Registrar el event loop del servidor ASGI (llamado desde connect)"""
+		self._loop_servidor = loop
+
+	def encolar(self, emisiones, clave=None):
+		"""
+		Encolar una lista de emisiones [(evento, datos, sala), ...].
+
+		Nunca bloquea: si la cola está llena se descarta según la política.
+		"""
+		with self._condicion:
+			self._asegurar_thread()
+
+			if clave is not None and clave in self._por_clave:
+				self._por_clave[clave][1] = emisiones
+				self._metricas['coalescidas'] += 1
+				return
+
+			self._anadir(clave, emisiones)
+			self._condicion.notify()
+
+	def _anadir(self, clave, emisiones):
+		# Añadir una entrada aplicando la política de cola llena (con el lock tomado)
+		if len(self._cola) >= self.capacidad:
+			self._metricas['descartadas'] += 1
+			if self.politica == 'drop_newest':
+				return
+			descartada = self._cola.popleft()
+			if descartada[0] is not None:
+				self._por_clave.pop(descartada[0], None)
+
+		entrada = [clave, emisiones]
+		self._cola.append(entrada)
+		if clave is not None:
+			self._por_clave[clave] = entrada
+		self._metricas['encoladas'] += 1
+		self._metricas['profundidad_maxima'] = max(self._metricas['profundidad_maxima'], len(self._cola))
+
+	def agregar_a_lote(self, evento, sala, item):
+		"""
+		Acumular un item para emitirlo en el próximo frame `evento` de la sala.
+
+		El frame se encola al cumplirse la ventana desde el primer item, o antes
+		si se alcanza ITEMS_MAXIMOS_POR_FRAME.
+		"""
+		with self._condicion:
+			self._asegurar_thread()
+
+			clave = (evento, sala)
+			nuevo = clave not in self._lotes
+			if nuevo:
+				self._lotes[clave] = (time.monotonic() + self.ventana, [])
+			items = self._lotes[clave][1]
+			items.append(item)
+			self._metricas['agrupadas'] += 1
+
+			if len(items) >= self.ITEMS_MAXIMOS_POR_FRAME:
+				self._cerrar_lote(clave)
+				self._condicion.notify()
+			elif nuevo:
+				# El consumidor debe recalcular cuándo cerrar la ventana
+				self._condicion.notify()
+
+	def _cerrar_lote(self, clave):
+		# Convertir el lote acumulado en una entrada de la cola (con el lock tomado)
+		evento, sala = clave
+		_, items = self._lotes.pop(clave)
+		frame = {
+			'type': evento,
+			'room': sala,
+			'count': len(items),
+			'data': items,
 		}
-		
-		# Emitir a sala general de telemetría
-		await sio.emit('new_telemetria', event_data, room='telemetria')
-		await sio.emit('telemetria', event_data, room='telemetria')  # Compatibilidad
-		
-		# Emitir a sala específica del cruce
-		cruce_room = f'cruce_{telemetria_instance.cruce.id}'
-		await sio.emit('new_telemetria', event_data, room=cruce_room)
-		await sio.emit('telemetria', event_data, room=cruce_room)  # Compatibilidad
-		
-		logger.debug(f"Telemetría emitida: Cruce {telemetria_instance.cruce.id}, ID {telemetria_instance.id}")
-		
-	except Exception as e:
-		logger.error(f"Error al emitir telemetría: {str(e)}")
+		self._metricas['frames_agrupados'] += 1
+		self._anadir(None, [(evento, frame, sala)])
+
+	def _cerrar_lotes_vencidos(self, forzar=False):
+		"""
+		Encolar los lotes cuya ventana terminó (con el lock tomado).
+
+		Returns:
+			float: Segundos hasta el próximo cierre, o None si no hay lotes
+		"""
+		ahora = time.monotonic()
+		for clave, (cierre, _) in list(self._lotes.items()):
+			if forzar or cierre <= ahora:
+				self._cerrar_lote(clave)
+		if not self._lotes:
+			return None
+		return max(0.0, min(cierre for cierre, _ in self._lotes.values()) - ahora)
+
+	def metricas(self):
+		"""Métricas de backpressure del emisor de este proceso"""
+		with self._condicion:
+			datos = dict(self._metricas)
+			datos['profundidad'] = len(self._cola)
+			datos['lotes_abiertos'] = len(self._lotes)
+			datos['capacidad'] = self.capacidad
+			datos['politica'] = self.politica
+			datos['activo'] = self._thread is not None and self._thread.is_alive()
+		return datos
+
+	def vaciar(self, timeout=5.0):
+		"""Esperar a que se emita lo pendiente (al terminar el proceso)"""
+		limite = time.monotonic() + timeout
+		with self._condicion:
+			self._cerrar_lotes_vencidos(forzar=True)
+			self._condicion.notify()
+			while (self._cola or self._en_vuelo) and self._thread and self._thread.is_alive():
+				restante = limite - time.monotonic()
+				if restante <= 0:
+					return False
+				self._vacia.wait(restante)
+		return True
+
+	def _asegurar_thread(self):
+		# Tras un fork (workers de gunicorn) el thread del padre no existe
+		if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+			return
+		if self._pid != os.getpid():
+			self._cola.clear()
+			self._por_clave.clear()
+			self._lotes.clear()
+			self._loop_servidor = None
+		self._pid = os.getpid()
+		self._thread = threading.Thread(target=self._consumir, name='socketio-emisor', daemon=True)
+		self._thread.start()
+
+	def _consumir(self):
+		self._loop = asyncio.new_event_loop()
+		while True:
+			with self._condicion:
+				espera = self._cerrar_lotes_vencidos()
+				while not self._cola:
+					self._condicion.wait(espera)
+					espera = self._cerrar_lotes_vencidos()
+				lote = []
+				while self._cola and len(lote) < self.LOTE_MAXIMO:
+					clave, emisiones = self._cola.popleft()
+					if clave is not None:
+						self._por_clave.pop(clave, None)
+					lote.extend(emisiones)
+				self._en_vuelo = len(lote)
+
+			try:
+				self._ejecutar(lote)
+			except Exception as e:
+				with self._condicion:
+					self._metricas['errores'] += 1
+				logger.error(f"Error al emitir lote Socket.IO: {str(e)}", exc_info=True)
+
+			with self._condicion:
+				self._en_vuelo = 0
+				self._vacia.notify_all()
+
+	def _ejecutar(self, lote):
+		loop = self._loop_servidor
+		if loop is not None and loop.is_running():
+			futuro = asyncio.run_coroutine_threadsafe(self._emitir(lote), loop)
+			futuro.result(timeout=30)
+		else:
+			self._loop.run_until_complete(self._emitir(lote))
+
+	async def _emitir(self, lote):
+		emitidas = 0
+		errores = 0
+		for evento, datos, sala in lote:
+			try:
+				await sio.emit(evento, datos, room=sala)
+				emitidas += 1
+			except Exception as e:
+				errores += 1
+				logger.error(f"Error al emitir '{evento}' a sala '{sala}': {str(e)}")
+		with self._condicion:
+			self._metricas['emitidas'] += emitidas
+			self._metricas['errores'] += errores
+
+
+emisor = EmisorSocketIO()
+atexit.register(emisor.vaciar)
 
 
 def emit_telemetria(telemetria_instance):
 	"""
 	Emitir evento de telemetría nueva.
-	
+
 	Args:
 		telemetria_instance: Instancia de Telemetria
 	"""
-	_run_async_in_thread(_emit_telemetria_async, telemetria_instance)
+	try:
+		from .serializers import TelemetriaSerializer
 
+		data = _json_safe(TelemetriaSerializer(telemetria_instance).data)
+		cruce_room = f'cruce_{telemetria_instance.cruce_id}'
+
+		# Un frame 'telemetria_batch' por sala y ventana
+		emisor.agregar_a_lote('telemetria_batch', 'telemetria', data)
+		emisor.agregar_a_lote('telemetria_batch', cruce_room, data)
+
+		if getattr(settings, 'SOCKETIO_TELEMETRIA_LEGACY', False):
+			event_data = {
+				'type': 'telemetria',
+				'data': data,
+				'timestamp': telemetria_instance.timestamp.isoformat(),
+			}
+			emisor.encolar([
+				# Sala general de telemetría
+				('new_telemetria', event_data, 'telemetria'),
+				('telemetria', event_data, 'telemetria'),  # Compatibilidad
+				# Sala específica del cruce
+				('new_telemetria', event_data, cruce_room),
+				('telemetria', event_data, cruce_room),  # Compatibilidad
+			])
+
+		logger.debug(f"Telemetría encolada: Cruce {telemetria_instance.cruce_id}, ID {telemetria_instance.id}")
 
-async def _emit_barrier_event_async(barrier_event_instance):
-	"""Función asíncrona interna para emitir evento de barrera"""
-	try:
-		from .serializers import BarrierEventSerializer
-		
-		serializer = BarrierEventSerializer(barrier_event_instance)
-		data = serializer.data
-		
-		event_data = {
-			'type': 'barrier_event',
-			'data': data,
-			'timestamp': barrier_event_instance.event_time.isoformat(),
-		}
-		
-		# Emitir a sala general de eventos de barrera
-		await sio.emit('barrier_event', event_data, room='barrier_events')
-		
-		# Emitir a sala específica del cruce
-		cruce_room = f'cruce_{barrier_event_instance.cruce.id}'
-		await sio.emit('barrier_event', event_data, room=cruce_room)
-		
-		# Emitir notificación a usuarios suscritos
-		await sio.emit('notification', {
-			'type': 'barrier_event',
-			'title': f'Evento de Barrera - {barrier_event_instance.cruce.nombre}',
-			'message': f'Barrera {barrier_event_instance.get_state_display()}',
-			'data': data,
-			'severity': 'info',
-			'timestamp': barrier_event_instance.event_time.isoformat(),
-		}, room='notifications')
-		
-		logger.info(f"Evento de barrera emitido: Cruce {barrier_event_instance.cruce.id}, Estado {barrier_event_instance.state}")
-		
 	except Exception as e:
-		logger.error(f"Error al emitir evento de barrera: {str(e)}")
+		logger.error(f"Error al emitir telemetría: {str(e)}")
 
 
 def emit_barrier_event(barrier_event_instance):
 	"""
 	Emitir evento de cambio de barrera.
-	
+
 	Args:
 		barrier_event_instance: Instancia de BarrierEvent
 	"""
-	_run_async_in_thread(_emit_barrier_event_async, barrier_event_instance)
+	try:
+		from .serializers import BarrierEventSerializer
 
+		data = _json_safe(BarrierEventSerializer(barrier_event_instance).data)
+		timestamp = barrier_event_instance.event_time.isoformat()
 
-async def _emit_alerta_async(alerta_instance):
-	"""Función asíncrona interna para emitir alerta"""
-	try:
-		from .serializers import AlertaSerializer
-		
-		serializer = AlertaSerializer(alerta_instance)
-		data = serializer.data
-		
 		event_data = {
-			'type': 'alerta',
+			'type': 'barrier_event',
 			'data': data,
-			'timestamp': alerta_instance.created_at.isoformat(),
-		}
-		
-		# Emitir a sala general de alertas
-		await sio.emit('new_alerta', event_data, room='alertas')
-		await sio.emit('alerta', event_data, room='alertas')  # Compatibilidad
-		
-		# Emitir a sala específica del cruce
-		cruce_room = f'cruce_{alerta_instance.cruce.id}'
-		await sio.emit('new_alerta', event_data, room=cruce_room)
-		await sio.emit('alerta', event_data, room=cruce_room)  # Compatibilidad
-		
-		# Emitir notificación según severidad
-		severity_map = {
-			'CRITICAL': 'error',
-			'WARNING': 'warning',
-			'INFO': 'info',
+			'timestamp': timestamp,
 		}
-		
-		notification_severity = severity_map.get(alerta_instance.severity, 'info')
-		
-		# Emitir notificación a usuarios suscritos
-		await sio.emit('notification', {
-			'type': 'alerta',
-			'title': f'Alerta {alerta_instance.get_severity_display()} - {alerta_instance.cruce.nombre}',
-			'message': alerta_instance.description,
-			'data': data,
-			'severity': notification_severity,
-			'timestamp': alerta_instance.created_at.isoformat(),
-		}, room='notifications')
-		
-		logger.info(f"Alerta emitida: Cruce {alerta_instance.cruce.id}, Tipo {alerta_instance.type}, Severidad {alerta_instance.severity}")
-		
+
+		emisor.encolar([
+			# Sala general de eventos de barrera
+			('barrier_event', event_data, 'barrier_events'),
+			# Sala específica del cruce
+			('barrier_event', event_data, f'cruce_{barrier_event_instance.cruce_id}'),
+			# Notificación a usuarios suscritos
+			('notification', {
+				'type': 'barrier_event',
+				'title': f'Evento de Barrera - {barrier_event_instance.cruce.nombre}',
+				'message': f'Barrera {barrier_event_instance.get_state_display()}',
+				'data': data,
+				'severity': 'info',
+				'timestamp': timestamp,
+			}, 'notifications'),
+		])
+
+		logger.info(f"Evento de barrera encolado: Cruce {barrier_event_instance.cruce_id}, Estado {barrier_event_instance.state}")
+
 	except Exception as e:
-		logger.error(f"Error al emitir alerta: {str(e)}")
+		logger.error(f"Error al emitir evento de barrera: {str(e)}")
 
 
 def emit_alerta(alerta_instance):
 	"""
 	Emitir evento de alerta nueva.
-	
+
 	Args:
 		alerta_instance: Instancia de Alerta
 	"""
-	_run_async_in_thread(_emit_alerta_async, alerta_instance)
-
-
-async def _emit_alerta_resuelta_async(alerta_instance):
-	"""Función asíncrona interna para emitir alerta resuelta"""
 	try:
 		from .serializers import AlertaSerializer
-		
-		serializer = AlertaSerializer(alerta_instance)
-		data = serializer.data
-		
+
+		data = _json_safe(AlertaSerializer(alerta_instance).data)
+		timestamp = alerta_instance.created_at.isoformat()
+
 		event_data = {
-			'type': 'alerta_resuelta',
+			'type': 'alerta',
 			'data': data,
-			'timestamp': alerta_instance.resolved_at.isoformat() if alerta_instance.resolved_at else None,
+			'timestamp': timestamp,
+		}
+
+		# Notificación según severidad
+		severity_map = {
+			'CRITICAL': 'error',
+			'WARNING': 'warning',
+			'INFO': 'info',
 		}
-		
-		# Emitir a sala general de alertas
-		await sio.emit('alerta_resolved', event_data, room='alertas')
-		await sio.emit('alerta_resuelta', event_data, room='alertas')  # Compatibilidad
-		
-		# Emitir a sala específica del cruce
-		cruce_room = f'cruce_{alerta_instance.cruce.id}'
-		await sio.emit('alerta_resolved', event_data, room=cruce_room)
-		await sio.emit('alerta_resuelta', event_data, room=cruce_room)  # Compatibilidad
-		
-		logger.info(f"Alerta resuelta emitida: Alerta {alerta_instance.id}, Cruce {alerta_instance.cruce.id}")
-		
+
+		cruce_room = f'cruce_{alerta_instance.cruce_id}'
+		emisor.encolar([
+			# Sala general de alertas
+			('new_alerta', event_data, 'alertas'),
+			('alerta', event_data, 'alertas'),  # Compatibilidad
+			# Sala específica del cruce
+			('new_alerta', event_data, cruce_room),
+			('alerta', event_data, cruce_room),  # Compatibilidad
+			# Notificación a usuarios suscritos
+			('notification', {
+				'type': 'alerta',
+				'title': f'Alerta {alerta_instance.get_severity_display()} - {alerta_instance.cruce.nombre}',
+				'message': alerta_instance.description,
+				'data': data,
+				'severity': severity_map.get(alerta_instance.severity, 'info'),
+				'timestamp': timestamp,
+			}, 'notifications'),
+		])
+
+		logger.info(f"Alerta encolada: Cruce {alerta_instance.cruce_id}, Tipo {alerta_instance.type}, Severidad {alerta_instance.severity}")
+
 	except Exception as e:
-		logger.error(f"Error al emitir alerta resuelta: {str(e)}")
+		logger.error(f"Error al emitir alerta: {str(e)}")
 
 
 def emit_alerta_resuelta(alerta_instance):
 	"""
 	Emitir evento cuando una alerta es resuelta.
-	
+
 	Args:
 		alerta_instance: Instancia de Alerta
 	"""
-	_run_async_in_thread(_emit_alerta_resuelta_async, alerta_instance)
+	try:
+		from .serializers import AlertaSerializer
 
+		event_data = _json_safe({
+			'type': 'alerta_resuelta',
+			'data': AlertaSerializer(alerta_instance).data,
+			'timestamp': alerta_instance.resolved_at.isoformat() if alerta_instance.resolved_at else None,
+		})
+
+		cruce_room = f'cruce_{alerta_instance.cruce_id}'
+		emisor.encolar([
+			# Sala general de alertas
+			('alerta_resolved', event_data, 'alertas'),
+			('alerta_resuelta', event_data, 'alertas'),  # Compatibilidad
+			# Sala específica del cruce
+			('alerta_resolved', event_data, cruce_room),
+			('alerta_resuelta', event_data, cruce_room),  # Compatibilidad
+		])
+
+		logger.info(f"Alerta resuelta encolada: Alerta {alerta_instance.id}, Cruce {alerta_instance.cruce_id}")
 
-async def _emit_cruce_update_async(serialized_data, timestamp, cruce_id):
-	"""Función asíncrona interna para emitir actualización de cruce"""
-	try:
-		logger.info(f"🔄 Iniciando emisión de actualización de cruce: ID {cruce_id}")
-		
-		# Asegurar que todos los datos datetime se conviertan a strings ISO
-		import json
-		from datetime import datetime
-		
-		def json_serial(obj):
-			"""JSON serializer para objetos que no son serializables por defecto"""
-			if isinstance(obj, datetime):
-				return obj.isoformat()
-			raise TypeError(f"Type {type(obj)} not serializable")
-		
-		# Convertir serialized_data a JSON y de vuelta para asegurar serialización correcta
-		# Esto convierte todos los datetime a strings ISO
-		serialized_json = json.dumps(serialized_data, default=json_serial)
-		serialized_data_clean = json.loads(serialized_json)
-		
-		event_data = {
-			'type': 'cruce_update',
-			'data': serialized_data_clean,
-			'timestamp': timestamp,
-		}
-		
-		# Emitir a sala específica del cruce
-		cruce_room = f'cruce_{cruce_id}'
-		
-		# Verificar cuántos clientes hay en la sala (para diagnóstico)
-		try:
-			# Obtener todos los SIDs en la sala
-			room_sids = list(sio.manager.get_participants('/', cruce_room))
-			num_clients = len(room_sids) if room_sids else 0
-			logger.info(f"📊 Clientes en sala '{cruce_room}': {num_clients}")
-			if num_clients > 0:
-				logger.info(f"   SIDs en sala: {room_sids[:5]}...")  # Mostrar primeros 5
-			else:
-				logger.warning(f"⚠️ No hay clientes en la sala '{cruce_room}' - el evento no llegará a nadie")
-		except Exception as e:
-			logger.warning(f"⚠️ No se pudo verificar clientes en sala: {str(e)}")
-		
-		logger.info(f"📤 Emitiendo evento 'cruce_update' a sala '{cruce_room}' para Cruce {cruce_id}")
-		
-		await sio.emit('cruce_update', event_data, room=cruce_room)
-		
-		logger.info(f"✅ Cruce actualizado emitido exitosamente: Cruce {cruce_id} (Sala: {cruce_room})")
-		
 	except Exception as e:
-		logger.error(f"❌ Error al emitir actualización de cruce {cruce_id}: {str(e)}", exc_info=True)
+		logger.error(f"Error al emitir alerta resuelta: {str(e)}")
 
 
 def emit_cruce_update(cruce_instance):
 	"""
 	Emitir evento cuando un cruce es actualizado.
-	
+
+	Las actualizaciones pendientes del mismo cruce se coalescen: solo se
+	emite el estado más reciente.
+
 	Args:
 		cruce_instance: Instancia de Cruce
 	"""
 	try:
-		logger.info(f"🚀 Signal detectado: Cruce {cruce_instance.id} actualizado. Iniciando emisión Socket.IO...")
-		
-		# Serializar el objeto ANTES de entrar al contexto asíncrono
-		# Esto evita problemas con sync_to_async dentro de asyncio.run()
+		from .models import Cruce
 		from .serializers import CruceSerializer
-		
-		logger.info(f"📦 Serializando datos del cruce {cruce_instance.id}...")
-		serializer = CruceSerializer(cruce_instance)
-		serialized_data = serializer.data
-		timestamp = cruce_instance.updated_at.isoformat()
-		
-		logger.info(f"✅ Datos serializados correctamente para Cruce {cruce_instance.id}")
-		
-		_run_async_in_thread(_emit_cruce_update_async, serialized_data, timestamp, cruce_instance.id)
-		logger.info(f"✅ Thread de emisión iniciado para Cruce {cruce_instance.id}")
-	except Exception as e:
-		logger.error(f"❌ Error al ejecutar emisión de actualización de cruce {cruce_instance.id}: {str(e)}", exc_info=True)
 
+		# Releer con los conteos anotados: una query en lugar de una por campo
+		cruce = Cruce.objects.con_resumen().filter(pk=cruce_instance.pk).first() or cruce_instance
 
-async def _emit_dashboard_update_async():
-	"""Función asíncrona interna para emitir actualización de dashboard"""
-	try:
-		from django.utils import timezone
-		
-		await sio.emit('dashboard_update', {
-			'type': 'dashboard_update',
-			'message': 'Dashboard actualizado',
-			'timestamp': timezone.now().isoformat(),
-		}, room='notifications')
-		
-		logger.debug("Actualización de dashboard emitida")
-		
+		event_data = _json_safe({
+			'type': 'cruce_update',
+			'data': CruceSerializer(cruce).data,
+			'timestamp': cruce_instance.updated_at.isoformat(),
+		})
+
+		cruce_room = f'cruce_{cruce_instance.id}'
+		emisor.encolar(
+			[('cruce_update', event_data, cruce_room)],
+			clave=f'cruce_update:{cruce_instance.id}'
+		)
+
+		logger.info(f"✅ Actualización de cruce encolada: Cruce {cruce_instance.id} (Sala: {cruce_room})")
 	except Exception as e:
-		logger.error(f"Error al emitir actualización de dashboard: {str(e)}")
+		logger.error(f"❌ Error al emitir actualización de cruce {cruce_instance.id}: {str(e)}", exc_info=True)
 
 
 def emit_dashboard_update():
@@ -320,5 +475,16 @@ def emit_dashboard_update():
 	Emitir evento de actualización del dashboard.
 	Útil para notificar cambios generales en el sistema.
 	"""
-	_run_async_in_thread(_emit_dashboard_update_async)
+	try:
+		from django.utils import timezone
+
+		emisor.encolar([('dashboard_update', {
+			'type': 'dashboard_update',
+			'message': 'Dashboard actualizado',
+			'timestamp': timezone.now().isoformat(),
+		}, 'notifications')], clave='dashboard_update')
+
+		logger.debug("Actualización de dashboard encolada")
 
+	except Exception as e:
+		logger.error(f"Error al emitir actualización de dashboard: {str(e)}")
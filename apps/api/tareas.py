@@ -0,0 +1,298 @@
+"""
+Cola de tareas en BD para el procesamiento posterior a la ingesta.
+
+Los endpoints de ingesta solo validan, insertan la telemetría y encolan una
+tarea; el comando procesar_tareas ejecuta la detección de eventos, las alertas
+y las notificaciones (Socket.IO, emails) con reintentos.
+
+Cada tarea se procesa en una transacción junto con su borrado, así que sus
+efectos en BD se aplican una sola vez. Si el worker muere a mitad, el lock se
+libera y otra instancia la retoma.
+
+Las tareas se toman en orden de creación. Las de TIPOS_ORDENADOS (lecturas de
+telemetría) no se adelantan a una tarea anterior del mismo cruce que está
+esperando un reintento o que otro worker tiene tomada: la detección de eventos
+de barrera compara con el último estado del cruce, así que las lecturas de un
+cruce se procesan de a una y en orden.
+
+Las de TIPOS_SIN_TRANSACCION (exportaciones) pueden tardar minutos: dentro del
+lote solo se reservan por TAREAS_RESERVA_SEGUNDOS y el handler se ejecuta
+después, fuera de la transacción del lote.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from datetime import timedelta
+import logging
+
+from .models import TareaAsincrona
+
+logger = logging.getLogger(__name__)
+
+# Registro de handlers: tipo -> función(payload)
+_HANDLERS = {}
+
+# Tipos que se procesan en orden por cruce (payload con 'cruce_ids')
+TIPOS_ORDENADOS = {'procesar_telemetria'}
+
+# Tipos largos que se ejecutan fuera de la transacción del lote
+TIPOS_SIN_TRANSACCION = {'generar_exportacion'}
+
+
+def registrar_tarea(tipo):
+	"""Decorador para registrar el handler de un tipo de tarea"""
+	def decorador(func):
+		_HANDLERS[tipo] = func
+		return func
+	return decorador
+
+
+def encolar(tipo, payload):
+	"""
+	Encolar una tarea.
+
+	Si se llama dentro de una transacción, la tarea queda visible para los
+	workers solo cuando ésta se confirma.
+	"""
+	if tipo not in _HANDLERS:
+		raise ValueError(f'Tipo de tarea desconocido: {tipo}')
+	return TareaAsincrona.objects.create(tipo=tipo, payload=payload)
+
+
+def _backoff(intentos):
+	"""Segundos de espera antes del siguiente intento (exponencial con tope)"""
+	base = getattr(settings, 'TAREAS_REINTENTO_BASE_SEGUNDOS', 5)
+	return min(base * (2 ** (intentos - 1)), 3600)
+
+
+def _cruces_tarea(tarea):
+	"""Cruces de una tarea ordenada ('cruce_ids' o, en tareas antiguas, los de sus lecturas)"""
+	if 'cruce_ids' in tarea.payload:
+		return set(tarea.payload['cruce_ids'])
+	from .models import Telemetria
+	return set(Telemetria.objects.filter(
+		id__in=tarea.payload.get('telemetria_ids', [])
+	).values_list('cruce_id', flat=True))
+
+
+def _registrar_fallo(tarea, error, max_intentos):
+	"""Anotar el error y reprogramar la tarea, o descartarla al agotar intentos"""
+	tarea.intentos += 1
+	tarea.ultimo_error = f'{type(error).__name__}: {error}'
+	if tarea.intentos >= max_intentos:
+		tarea.estado = 'FALLIDA'
+		logger.error(f"❌ Tarea {tarea} descartada tras {tarea.intentos} intentos: {tarea.ultimo_error}")
+	else:
+		tarea.disponible_en = timezone.now() + timedelta(seconds=_backoff(tarea.intentos))
+		logger.warning(f"⚠️ Tarea {tarea} falló (intento {tarea.intentos}), reintento en {_backoff(tarea.intentos)}s: {tarea.ultimo_error}")
+	tarea.save(update_fields=['intentos', 'ultimo_error', 'estado', 'disponible_en', 'updated_at'])
+
+
+def procesar_lote(limite=20, tipos=None, excluir_tipos=None):
+	"""
+	Procesar hasta `limite` tareas pendientes.
+
+	Las tareas se reservan con SELECT ... FOR UPDATE SKIP LOCKED, de modo que
+	varios workers pueden consumir la cola en paralelo sin tomar la misma
+	tarea. Con `tipos` / `excluir_tipos` un worker puede dedicarse (o no) a
+	ciertos tipos, p. ej. exportaciones largas en un worker aparte del de
+	ingesta.
+
+	Una tarea de TIPOS_ORDENADOS se salta (queda pendiente) mientras una
+	tarea anterior de alguno de sus cruces espera un reintento, ha fallado o
+	quedó saltada en este lote, o está tomada por otro worker (pendiente y
+	disponible pero no reservable con SKIP LOCKED). Así varios workers de
+	ingesta reparten los cruces sin procesar fuera de orden las lecturas de
+	uno mismo.
+
+	Returns:
+		tuple: (procesadas, fallidas)
+	"""
+	max_intentos = getattr(settings, 'TAREAS_MAX_INTENTOS', 5)
+	procesadas = 0
+	fallidas = 0
+	diferidas = []
+
+	with transaction.atomic():
+		ahora = timezone.now()
+		pendientes = TareaAsincrona.objects.select_for_update(skip_locked=True).filter(
+			estado='PENDIENTE',
+			disponible_en__lte=ahora
+		)
+		if tipos:
+			pendientes = pendientes.filter(tipo__in=tipos)
+		if excluir_tipos:
+			pendientes = pendientes.exclude(tipo__in=excluir_tipos)
+
+		# (id, cruces) de las tareas ordenadas anteriores que aún no se procesaron
+		en_espera = [
+			(tarea.id, _cruces_tarea(tarea))
+			for tarea in TareaAsincrona.objects.filter(
+				estado='PENDIENTE', tipo__in=TIPOS_ORDENADOS, disponible_en__gt=ahora
+			).only('id', 'payload')
+		]
+
+		def bloqueada(tarea):
+			if tarea.tipo not in TIPOS_ORDENADOS or not en_espera:
+				return False
+			cruces = _cruces_tarea(tarea)
+			return any(id_anterior < tarea.id and cruces & anteriores for id_anterior, anteriores in en_espera)
+
+		# Se pagina por id para que las tareas bloqueadas no ocupen el lote
+		tareas = []
+		ultimo_id = 0
+		while len(tareas) < limite:
+			pagina = list(pendientes.filter(id__gt=ultimo_id).order_by('id')[:limite])
+			if not pagina:
+				break
+			desde, ultimo_id = ultimo_id, pagina[-1].id
+			if any(tarea.tipo in TIPOS_ORDENADOS for tarea in pagina):
+				# Las ordenadas anteriores que no se pudieron reservar las tiene
+				# otro worker (o se confirmaron después): esperan como un reintento
+				en_espera.extend(
+					(tarea.id, _cruces_tarea(tarea))
+					for tarea in TareaAsincrona.objects.filter(
+						estado='PENDIENTE', tipo__in=TIPOS_ORDENADOS, disponible_en__lte=ahora,
+						id__gt=desde, id__lt=ultimo_id
+					).exclude(id__in=[tarea.id for tarea in pagina]).only('id', 'payload')
+				)
+			for tarea in pagina:
+				if not bloqueada(tarea):
+					tareas.append(tarea)
+				elif tarea.tipo in TIPOS_ORDENADOS:
+					# Una saltada también bloquea a las posteriores de sus otros cruces
+					en_espera.append((tarea.id, _cruces_tarea(tarea)))
+		tareas = tareas[:limite]
+
+		for tarea in tareas:
+			if tarea.tipo in TIPOS_SIN_TRANSACCION:
+				# Reservada: si el worker muere, otra instancia la retoma al vencer
+				tarea.disponible_en = ahora + timedelta(seconds=getattr(settings, 'TAREAS_RESERVA_SEGUNDOS', 3600))
+				tarea.save(update_fields=['disponible_en', 'updated_at'])
+				diferidas.append(tarea)
+				continue
+			if bloqueada(tarea):
+				continue
+			handler = _HANDLERS.get(tarea.tipo)
+			try:
+				if handler is None:
+					raise ValueError(f'Tipo de tarea desconocido: {tarea.tipo}')
+				# Savepoint: si el handler falla se descartan sus cambios
+				# (y sus on_commit) pero no los de las demás tareas del lote
+				with transaction.atomic():
+					handler(tarea.payload)
+			except Exception as e:
+				_registrar_fallo(tarea, e, max_intentos)
+				fallidas += 1
+				if tarea.tipo in TIPOS_ORDENADOS and tarea.estado == 'PENDIENTE':
+					en_espera.append((tarea.id, _cruces_tarea(tarea)))
+			else:
+				tarea.delete()
+				procesadas += 1
+
+	for tarea in diferidas:
+		try:
+			_HANDLERS[tarea.tipo](tarea.payload)
+		except Exception as e:
+			_registrar_fallo(tarea, e, max_intentos)
+			fallidas += 1
+		else:
+			tarea.delete()
+			procesadas += 1
+
+	return procesadas, fallidas
+
+
+def reintentar_fallidas():
+	"""Volver a encolar las tareas fallidas (reinicia los intentos)"""
+	return TareaAsincrona.objects.filter(estado='FALLIDA').update(
+		estado='PENDIENTE', intentos=0, disponible_en=timezone.now()
+	)
+
+
+# ============================================================================
+# HANDLERS
+# ============================================================================
+
+@registrar_tarea('procesar_telemetria')
+def procesar_telemetria(payload):
+	"""
+	Detección de eventos, alertas y notificaciones de telemetría ya insertada.
+
+	payload: {'telemetria_ids': [...], 'cruce_ids': [...]}
+	"""
+	from .models import Telemetria
+	from .views import detect_barrier_events_batch, check_alerts_batch, _notificar_lote
+	from .estado_actual import registrar_telemetrias
+	from . import metricas_vivas
+	from .mantenimiento_engine import evaluar_ingesta
+
+	# Con el estado actual del cruce: la detección de eventos lee de ahí el
+	# último evento sin otra query (los campos de telemetría de esa copia
+	# quedan anteriores a registrar_telemetrias)
+	telemetrias = list(
+		Telemetria.objects.filter(id__in=payload['telemetria_ids']).select_related('cruce', 'cruce__estado_actual')
+	)
+	if not telemetrias:
+		return
+
+	registrar_telemetrias(telemetrias)
+	metricas_vivas.registrar_telemetrias(telemetrias)
+	evaluar_ingesta(telemetrias)
+	eventos = detect_barrier_events_batch(telemetrias)
+	alertas = check_alerts_batch(telemetrias)
+
+	# La telemetría se insertó con bulk_create (sin post_save): los receivers
+	# (Socket.IO, emails) se disparan aquí, una vez confirmada la transacción
+	transaction.on_commit(lambda: _notificar_lote(telemetrias, eventos, alertas))
+	logger.info(f"Tarea procesar_telemetria: {len(telemetrias)} lecturas, {len(eventos)} eventos, {len(alertas)} alertas")
+
+
+@registrar_tarea('generar_exportacion')
+def generar_exportacion(payload):
+	"""
+	Generar el archivo de un TrabajoExportacion.
+
+	Los errores quedan en el trabajo (FALLIDO) y no se reintentan: una
+	exportación que falla volvería a fallar igual.
+
+	payload: {'trabajo_id': ...}
+	"""
+	from .models import TrabajoExportacion
+	from .views import filtrar_telemetria, filtrar_alertas, telemetria_archivada
+	from .exportacion import COLUMNAS_TELEMETRIA, COLUMNAS_ALERTAS, procesar_trabajo
+
+	trabajo = TrabajoExportacion.objects.filter(id=payload['trabajo_id'], estado='PENDIENTE').first()
+	if trabajo is None:
+		# Eliminado antes de procesarse
+		return
+
+	archivadas = ()
+	if trabajo.tipo == 'alertas':
+		queryset, columnas = filtrar_alertas(trabajo.filtros), COLUMNAS_ALERTAS
+	else:
+		queryset, columnas = filtrar_telemetria(trabajo.filtros), COLUMNAS_TELEMETRIA
+		archivadas = telemetria_archivada(trabajo.filtros, COLUMNAS_TELEMETRIA)
+
+	procesar_trabajo(trabajo, queryset, columnas, archivadas)
+
+
+@registrar_tarea('aplicar_mantenimiento')
+def aplicar_mantenimiento(payload):
+	"""
+	Crear el mantenimiento (con su alerta y email) de una regla que se cumplió
+	en la ingesta (ver mantenimiento_engine.evaluar_ingesta).
+
+	Si la regla se desactivó o eliminó, o la lectura ya no existe, no se hace
+	nada.
+
+	payload: {'regla_id': ..., 'telemetria_id': ...}
+	"""
+	from .models import MantenimientoPreventivo, Telemetria
+	from .mantenimiento_engine import motor_mantenimiento
+
+	regla = MantenimientoPreventivo.objects.filter(id=payload['regla_id'], activo=True).first()
+	telemetria = Telemetria.objects.select_related('cruce').filter(id=payload['telemetria_id']).first()
+	if regla is None or telemetria is None:
+		return
+	motor_mantenimiento._aplicar_regla(regla, telemetria)
@@ -1,16 +1,22 @@
 """
 Tests para las vistas de la API
 """
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
 from rest_framework.test import APIClient
 from rest_framework import status
 from apps.api.models import (
 	Cruce, Sensor, Telemetria, Alerta, BarrierEvent,
-	UserProfile, MantenimientoPreventivo, HistorialMantenimiento
+	UserProfile, MantenimientoPreventivo, HistorialMantenimiento, TareaAsincrona,
+	CruceEstadoActual, TrabajoExportacion, MetricasDesempeno, AcumuladoDiario,
+	TelemetriaMinuto, TelemetriaHora, ArchivoTelemetria
 )
 from django.utils import timezone
-from datetime import timedelta
+from datetime import datetime, timedelta
+import json
 
 
 class TelemetriaAPITestCase(TestCase):
@@ -259,3 +265,1628 @@ class AlertaAPITestCase(TestCase):
 		alerta.refresh_from_db()
 		self.assertTrue(alerta.resolved)
 
+
+
+@override_settings(INGESTA_ASINCRONA=False)
+class ESP32BatchTestCase(TestCase):
+	"""Tests para el endpoint de ingesta por lotes del ESP32"""
+	
+	URL = '/api/esp32/telemetria/batch'
+	
+	def setUp(self):
+		cache.clear()
+		self.client = APIClient()
+		self.cruce_1 = Cruce.objects.create(nombre='Cruce 1', ubicacion='Ubicación 1', estado='ACTIVO')
+		self.cruce_2 = Cruce.objects.create(nombre='Cruce 2', ubicacion='Ubicación 2', estado='ACTIVO')
+		self.cruce_inactivo = Cruce.objects.create(nombre='Cruce 3', ubicacion='Ubicación 3', estado='INACTIVO')
+		self.inicio = timezone.now() - timedelta(minutes=10)
+	
+	def _lectura(self, cruce, segundos, barrier_voltage=22.0, battery_voltage=12.5, **extra):
+		lectura = {
+			'cruce_id': cruce.id,
+			'barrier_voltage': barrier_voltage,
+			'battery_voltage': battery_voltage,
+			'timestamp': (self.inicio + timedelta(seconds=segundos)).isoformat(),
+		}
+		lectura.update(extra)
+		return lectura
+	
+	def test_lote_varios_cruces(self):
+		"""Test que el lote inserta lecturas de varios cruces y detecta eventos en una pasada"""
+		data = {
+			'esp32_token': 'esp32_default_token_123',
+			'lecturas': [
+				self._lectura(self.cruce_1, 0, barrier_voltage=22.0),   # DOWN
+				self._lectura(self.cruce_1, 5, barrier_voltage=22.0),   # sin cambio
+				self._lectura(self.cruce_1, 10, barrier_voltage=0.5),   # UP
+				self._lectura(self.cruce_2, 0, barrier_voltage=22.0, battery_voltage=10.5),
+				self._lectura(self.cruce_2, 5, battery_voltage=30.0),   # inválida
+				self._lectura(self.cruce_inactivo, 0),                  # cruce inactivo
+			]
+		}
+		
+		response = self.client.post(self.URL, data, format='json')
+		self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+		self.assertEqual(response.data['insertadas'], 4)
+		self.assertEqual([r['indice'] for r in response.data['rechazadas']], [4, 5])
+		
+		self.assertEqual(Telemetria.objects.filter(cruce=self.cruce_1).count(), 3)
+		estados = list(
+			BarrierEvent.objects.filter(cruce=self.cruce_1).order_by('event_time').values_list('state', flat=True)
+		)
+		self.assertEqual(estados, ['DOWN', 'UP'])
+		self.assertEqual(response.data['events_created'], 3)
+		
+		# La hora de la lectura se respeta
+		primera = Telemetria.objects.filter(cruce=self.cruce_1).order_by('timestamp').first()
+		self.assertEqual(primera.timestamp, self.inicio)
+		self.assertEqual(primera.barrier_status, 'DOWN')
+		
+		self.assertTrue(Alerta.objects.filter(cruce=self.cruce_2, type='LOW_BATTERY').exists())
+	
+	def test_lote_token_invalido(self):
+		"""Test que un token inválido rechaza el lote completo"""
+		data = {'esp32_token': 'token_incorrecto_123', 'lecturas': [self._lectura(self.cruce_1, 0)]}
+		
+		response = self.client.post(self.URL, data, format='json')
+		self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+		self.assertEqual(Telemetria.objects.count(), 0)
+	
+	def test_lote_sin_lecturas_validas(self):
+		"""Test que un lote sin lecturas válidas no inserta nada"""
+		data = {
+			'esp32_token': 'esp32_default_token_123',
+			'lecturas': [self._lectura(self.cruce_inactivo, 0)]
+		}
+		
+		response = self.client.post(self.URL, data, format='json')
+		self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+		self.assertEqual(Telemetria.objects.count(), 0)
+
+
+@override_settings(INGESTA_ASINCRONA=False)
+class EstadoBarreraCacheTestCase(TestCase):
+	"""Tests para el estado de barrera por cruce (CruceEstadoActual)"""
+	
+	URL = '/api/esp32/telemetria'
+	
+	def setUp(self):
+		cache.clear()
+		self.client = APIClient()
+		self.cruce = Cruce.objects.create(nombre='Cruce Cache', ubicacion='Ubicación', estado='ACTIVO')
+	
+	def _enviar(self, barrier_voltage, timestamp=None):
+		data = {
+			'esp32_token': 'esp32_default_token_123',
+			'cruce_id': self.cruce.id,
+			'barrier_voltage': barrier_voltage,
+			'battery_voltage': 12.5,
+		}
+		if timestamp:
+			data['timestamp'] = timestamp.isoformat()
+		return self.client.post(self.URL, data, format='json')
+	
+	def test_lectura_sin_cambio_no_consulta_eventos(self):
+		"""Test que una lectura sin cambio de estado no toca BarrierEvent ni escribe el estado"""
+		response = self._enviar(22.0)
+		self.assertEqual(response.data['events_created'], 1)
+		
+		with CaptureQueriesContext(connection) as contexto:
+			response = self._enviar(22.0)
+		self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+		self.assertEqual(response.data['events_created'], 0)
+		
+		sqls = [q['sql'] for q in contexto.captured_queries]
+		self.assertFalse([sql for sql in sqls if 'api_barrierevent' in sql])
+		self.assertFalse([sql for sql in sqls if 'ultimo_evento' in sql and sql.startswith('UPDATE')])
+		# barrier_status se calcula antes del INSERT: no hay UPDATE de telemetría
+		self.assertFalse([sql for sql in sqls if sql.startswith('UPDATE') and 'api_telemetria' in sql])
+		self.assertEqual(Telemetria.objects.filter(barrier_status='DOWN').count(), 2)
+	
+	def test_cache_vacia_no_afecta(self):
+		"""Test que el estado no depende de la cache"""
+		self._enviar(22.0)
+		cache.clear()
+		
+		response = self._enviar(22.0)
+		self.assertEqual(response.data['events_created'], 0)
+		self.assertEqual(BarrierEvent.objects.filter(cruce=self.cruce).count(), 1)
+	
+	def test_eliminar_evento_recalcula_estado(self):
+		"""Test que al eliminar el último evento se vuelve al anterior"""
+		inicio = timezone.now() - timedelta(minutes=5)
+		self._enviar(22.0, inicio)
+		self.assertEqual(self._enviar(0.5, inicio + timedelta(seconds=10)).data['events_created'], 1)
+		
+		BarrierEvent.objects.filter(cruce=self.cruce, state='UP').delete()
+		self.assertEqual(CruceEstadoActual.objects.get(cruce=self.cruce).ultimo_evento_estado, 'DOWN')
+		
+		# La lectura siguiente vuelve a detectar la subida
+		self.assertEqual(self._enviar(0.5, inicio + timedelta(seconds=20)).data['events_created'], 1)
+
+
+@override_settings(INGESTA_ASINCRONA=True)
+class IngestaAsincronaTestCase(TestCase):
+	"""Tests para la ingesta con procesamiento en cola"""
+	
+	def setUp(self):
+		from apps.api.mantenimiento_engine import motor_mantenimiento
+		
+		cache.clear()
+		# Reglas de tests anteriores (revertidas sin signals) en el índice del motor
+		motor_mantenimiento.invalidar()
+		self.client = APIClient()
+		self.cruce = Cruce.objects.create(nombre='Cruce Cola', ubicacion='Ubicación', estado='ACTIVO')
+	
+	def test_endpoint_encola_y_worker_procesa(self):
+		"""Test que el endpoint responde 202 y el worker crea eventos y alertas"""
+		from apps.api.tareas import procesar_lote
+		
+		data = {
+			'esp32_token': 'esp32_default_token_123',
+			'cruce_id': self.cruce.id,
+			'barrier_voltage': 22.0,
+			'battery_voltage': 10.5,
+		}
+		response = self.client.post('/api/esp32/telemetria', data, format='json')
+		self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+		self.assertEqual(TareaAsincrona.objects.count(), 1)
+		self.assertFalse(BarrierEvent.objects.exists())
+		self.assertEqual(Telemetria.objects.get().barrier_status, 'DOWN')
+		
+		with self.captureOnCommitCallbacks(execute=True):
+			procesadas, fallidas = procesar_lote()
+		
+		self.assertEqual((procesadas, fallidas), (1, 0))
+		self.assertFalse(TareaAsincrona.objects.exists())
+		self.assertEqual(BarrierEvent.objects.filter(cruce=self.cruce).count(), 1)
+		self.assertTrue(Alerta.objects.filter(cruce=self.cruce, type='LOW_BATTERY').exists())
+	
+	@override_settings(TAREAS_MAX_INTENTOS=2)
+	def test_tarea_fallida_se_reintenta_y_descarta(self):
+		"""Test que una tarea con error se reprograma y se descarta al agotar intentos"""
+		from apps.api.tareas import procesar_lote
+		
+		tarea = TareaAsincrona.objects.create(tipo='inexistente', payload={})
+		
+		procesar_lote()
+		tarea.refresh_from_db()
+		self.assertEqual(tarea.estado, 'PENDIENTE')
+		self.assertEqual(tarea.intentos, 1)
+		self.assertGreater(tarea.disponible_en, timezone.now())
+		
+		TareaAsincrona.objects.filter(id=tarea.id).update(disponible_en=timezone.now())
+		procesar_lote()
+		tarea.refresh_from_db()
+		self.assertEqual(tarea.estado, 'FALLIDA')
+		self.assertIn('inexistente', tarea.ultimo_error)
+
+
+class OrdenTareasTestCase(TestCase):
+	"""Tests para el orden de la cola y las tareas fuera de la transacción del lote"""
+
+	def test_lectura_reintentada_bloquea_las_posteriores_del_cruce(self):
+		"""Test que una tarea en reintento no es adelantada por otra del mismo cruce"""
+		from unittest import mock
+		from apps.api import tareas
+
+		procesados = []
+		reintentada = TareaAsincrona.objects.create(
+			tipo='procesar_telemetria', payload={'telemetria_ids': [1], 'cruce_ids': [1]},
+			intentos=1, disponible_en=timezone.now() + timedelta(minutes=1)
+		)
+		posterior = TareaAsincrona.objects.create(
+			tipo='procesar_telemetria', payload={'telemetria_ids': [2], 'cruce_ids': [1]}
+		)
+		TareaAsincrona.objects.create(
+			tipo='procesar_telemetria', payload={'telemetria_ids': [3], 'cruce_ids': [2]}
+		)
+
+		with mock.patch.dict(tareas._HANDLERS, {'procesar_telemetria': lambda p: procesados.extend(p['telemetria_ids'])}):
+			self.assertEqual(tareas.procesar_lote(), (1, 0))
+			self.assertEqual(procesados, [3])
+			self.assertTrue(TareaAsincrona.objects.filter(id=posterior.id, estado='PENDIENTE').exists())
+
+			TareaAsincrona.objects.filter(id=reintentada.id).update(disponible_en=timezone.now())
+			self.assertEqual(tareas.procesar_lote(), (2, 0))
+
+		self.assertEqual(procesados, [3, 1, 2])
+		self.assertFalse(TareaAsincrona.objects.exists())
+
+	def test_fallo_en_el_lote_bloquea_las_posteriores_del_cruce(self):
+		"""Test que si una lectura falla, las siguientes de su cruce esperan al reintento"""
+		from unittest import mock
+		from apps.api import tareas
+
+		def handler(payload):
+			if payload['telemetria_ids'] == [1]:
+				raise RuntimeError('fallo')
+
+		TareaAsincrona.objects.create(tipo='procesar_telemetria', payload={'telemetria_ids': [1], 'cruce_ids': [1]})
+		posterior = TareaAsincrona.objects.create(
+			tipo='procesar_telemetria', payload={'telemetria_ids': [2], 'cruce_ids': [1]}
+		)
+
+		with mock.patch.dict(tareas._HANDLERS, {'procesar_telemetria': handler}):
+			self.assertEqual(tareas.procesar_lote(), (0, 1))
+
+		self.assertTrue(TareaAsincrona.objects.filter(id=posterior.id, intentos=0).exists())
+
+	def test_tarea_tomada_por_otro_worker_bloquea_las_posteriores(self):
+		"""Test que no se adelanta a una tarea del cruce que otro worker tiene reservada"""
+		from unittest import mock
+		from apps.api import tareas
+
+		procesados = []
+		en_curso = TareaAsincrona.objects.create(
+			tipo='procesar_telemetria', payload={'telemetria_ids': [1], 'cruce_ids': [1]}
+		)
+		# Saltada por el cruce 1: también bloquea a la posterior del cruce 2
+		TareaAsincrona.objects.create(
+			tipo='procesar_telemetria', payload={'telemetria_ids': [2], 'cruce_ids': [1, 2]}
+		)
+		TareaAsincrona.objects.create(
+			tipo='procesar_telemetria', payload={'telemetria_ids': [3], 'cruce_ids': [2]}
+		)
+		TareaAsincrona.objects.create(
+			tipo='procesar_telemetria', payload={'telemetria_ids': [4], 'cruce_ids': [3]}
+		)
+
+		# SKIP LOCKED no devuelve la tarea que tiene el otro worker
+		reservables = lambda **kwargs: TareaAsincrona.objects.exclude(id=en_curso.id)
+		with mock.patch.dict(tareas._HANDLERS, {'procesar_telemetria': lambda p: procesados.extend(p['telemetria_ids'])}), \
+				mock.patch.object(TareaAsincrona.objects, 'select_for_update', reservables):
+			self.assertEqual(tareas.procesar_lote(), (1, 0))
+
+		self.assertEqual(procesados, [4])
+		self.assertEqual(TareaAsincrona.objects.count(), 3)
+
+	def test_lecturas_del_lote_ven_el_estado_de_las_anteriores(self):
+		"""Test que las tareas de un mismo lote no duplican eventos de barrera"""
+		from apps.api import tareas
+
+		cruce = Cruce.objects.create(nombre='Cruce Lote', ubicacion='Ubicación', estado='ACTIVO')
+		inicio = timezone.now() - timedelta(minutes=5)
+		for segundos, voltaje in ((0, 0.5), (10, 22.0), (20, 22.0), (30, 22.0)):
+			telemetria = Telemetria.objects.create(
+				cruce=cruce, barrier_voltage=voltaje, battery_voltage=12.5,
+				barrier_status='DOWN' if voltaje > 2.0 else 'UP',
+				timestamp=inicio + timedelta(seconds=segundos)
+			)
+			tareas.encolar('procesar_telemetria', {'telemetria_ids': [telemetria.id], 'cruce_ids': [cruce.id]})
+
+		self.assertEqual(tareas.procesar_lote(), (4, 0))
+		self.assertEqual(
+			list(BarrierEvent.objects.filter(cruce=cruce).order_by('event_time').values_list('state', flat=True)),
+			['UP', 'DOWN']
+		)
+
+	def test_exportacion_fuera_de_la_transaccion_del_lote(self):
+		"""Test que el handler de exportación no corre dentro del atomic del lote"""
+		from unittest import mock
+		from apps.api import tareas
+
+		niveles = []
+		fuera = len(connection.atomic_blocks)
+		TareaAsincrona.objects.create(tipo='generar_exportacion', payload={'trabajo_id': 1})
+
+		with mock.patch.dict(tareas._HANDLERS, {'generar_exportacion': lambda p: niveles.append(len(connection.atomic_blocks))}):
+			self.assertEqual(tareas.procesar_lote(), (1, 0))
+
+		self.assertEqual(niveles, [fuera])
+		self.assertFalse(TareaAsincrona.objects.exists())
+
+
+class EmisorSocketIOTestCase(TestCase):
+	"""Tests para la cola acotada del emisor Socket.IO"""
+	
+	def _emisor(self, **kwargs):
+		from apps.api.socketio_utils import EmisorSocketIO
+		
+		emisor = EmisorSocketIO(**kwargs)
+		# Sin thread consumidor: la cola se inspecciona directamente
+		emisor._asegurar_thread = lambda: None
+		return emisor
+	
+	def test_coalesce_por_clave(self):
+		"""Test que una entrada con la misma clave reemplaza a la pendiente"""
+		emisor = self._emisor(capacidad=10)
+		emisor.encolar([('cruce_update', {'v': 1}, 'cruce_1')], clave='cruce_update:1')
+		emisor.encolar([('cruce_update', {'v': 2}, 'cruce_1')], clave='cruce_update:1')
+		
+		metricas = emisor.metricas()
+		self.assertEqual(metricas['profundidad'], 1)
+		self.assertEqual(metricas['coalescidas'], 1)
+		self.assertEqual(emisor._cola[0][1], [('cruce_update', {'v': 2}, 'cruce_1')])
+	
+	def test_cola_llena_descarta_segun_politica(self):
+		"""Test que con la cola llena se descarta la más antigua o la nueva"""
+		emisor = self._emisor(capacidad=2, politica='drop_oldest')
+		for i in range(3):
+			emisor.encolar([('telemetria', {'i': i}, 'telemetria')])
+		self.assertEqual([e[1][0][1]['i'] for e in emisor._cola], [1, 2])
+		self.assertEqual(emisor.metricas()['descartadas'], 1)
+		
+		emisor = self._emisor(capacidad=2, politica='drop_newest')
+		for i in range(3):
+			emisor.encolar([('telemetria', {'i': i}, 'telemetria')])
+		self.assertEqual([e[1][0][1]['i'] for e in emisor._cola], [0, 1])
+		self.assertEqual(emisor.metricas()['profundidad_maxima'], 2)
+	
+	def test_telemetria_agrupada_por_sala(self):
+		"""Test que las lecturas de la ventana se emiten como un frame por sala"""
+		emisor = self._emisor(ventana_ms=60000)
+		for i in range(3):
+			emisor.agregar_a_lote('telemetria_batch', 'telemetria', {'id': i})
+			emisor.agregar_a_lote('telemetria_batch', f'cruce_{i % 2}', {'id': i})
+		self.assertEqual(emisor.metricas()['profundidad'], 0)
+		
+		emisor._cerrar_lotes_vencidos(forzar=True)
+		frames = {e[1][0][2]: e[1][0][1] for e in emisor._cola}
+		self.assertEqual(len(frames), 3)
+		self.assertEqual(frames['telemetria']['count'], 3)
+		self.assertEqual([d['id'] for d in frames['cruce_0']['data']], [0, 2])
+		self.assertEqual(emisor.metricas()['frames_agrupados'], 3)
+
+
+class SocketIOClientManagerTestCase(TestCase):
+	"""Tests para los client managers multi-proceso de Socket.IO"""
+	
+	def test_bus_local_reparte_entre_managers(self):
+		"""Test que un mensaje publicado llega a todos los managers del canal"""
+		import asyncio
+		from apps.api.socketio_managers import LocalPubSubManager
+		
+		async def escenario():
+			worker_a = LocalPubSubManager(channel='test_bus')
+			worker_b = LocalPubSubManager(channel='test_bus')
+			try:
+				await worker_a._publish({'method': 'emit', 'event': 'telemetria', 'room': 'cruce_1'})
+				recibido = await asyncio.wait_for(worker_b._listen().__anext__(), timeout=1)
+			finally:
+				worker_a.cerrar()
+				worker_b.cerrar()
+			return recibido
+		
+		mensaje = json.loads(asyncio.run(escenario()))
+		self.assertEqual(mensaje['event'], 'telemetria')
+		self.assertEqual(mensaje['room'], 'cruce_1')
+	
+	def test_fragmentacion_notify(self):
+		"""Test que los mensajes grandes se fragmentan bajo el límite de NOTIFY y se reensamblan"""
+		from apps.api.socketio_managers import fragmentar, Reensamblador, LIMITE_PAYLOAD_NOTIFY
+		
+		mensaje = json.dumps({'data': 'x' * 20000})
+		payloads = fragmentar(mensaje)
+		self.assertEqual(len(payloads), 3)
+		self.assertTrue(all(len(p) <= LIMITE_PAYLOAD_NOTIFY for p in payloads))
+		
+		reensamblador = Reensamblador()
+		resultados = [reensamblador.agregar(p) for p in payloads]
+		self.assertEqual(resultados[:-1], [None, None])
+		self.assertEqual(resultados[-1], mensaje)
+		
+		# Los mensajes cortos pasan sin cambios
+		self.assertEqual(fragmentar('{"a": 1}'), ['{"a": 1}'])
+
+
+class DashboardDeltaTestCase(TestCase):
+	"""Tests para los deltas del canal Socket.IO 'dashboard'"""
+	
+	def setUp(self):
+		cache.clear()
+		self.cruce = Cruce.objects.create(nombre='Cruce Dashboard', ubicacion='Ubicación', estado='ACTIVO')
+	
+	def _telemetria(self, segundos, barrier_voltage, battery_voltage=12.5):
+		return Telemetria(
+			cruce=self.cruce,
+			timestamp=timezone.now() + timedelta(seconds=segundos),
+			barrier_voltage=barrier_voltage,
+			battery_voltage=battery_voltage,
+			barrier_status='DOWN' if barrier_voltage > 2.0 else 'UP',
+		)
+	
+	def test_solo_campos_que_cambian(self):
+		"""Test que el delta solo incluye los campos modificados"""
+		from apps.api.dashboard_stream import publicar_telemetria
+		
+		delta = publicar_telemetria(self._telemetria(0, 22.0))
+		self.assertEqual(delta['telemetria_actual']['barrier_status'], 'DOWN')
+		
+		# Misma lectura: sin delta
+		self.assertEqual(publicar_telemetria(self._telemetria(1, 22.0)), {})
+		
+		delta = publicar_telemetria(self._telemetria(2, 0.5))
+		self.assertEqual(
+			set(delta['telemetria_actual']),
+			{'barrier_voltage', 'barrier_status', 'timestamp'}
+		)
+		
+		# Lectura más antigua que la última enviada: se ignora
+		self.assertEqual(publicar_telemetria(self._telemetria(-10, 22.0)), {})
+	
+	def test_delta_alertas_activas(self):
+		"""Test que crear y resolver alertas publica el conteo de alertas activas"""
+		from apps.api.dashboard_stream import publicar_alertas_activas
+		
+		alerta = Alerta.objects.create(
+			type='LOW_BATTERY', severity='CRITICAL', description='Batería baja', cruce=self.cruce
+		)
+		# El signal ya publicó el conteo (1): no hay cambios
+		self.assertEqual(publicar_alertas_activas(self.cruce.id), {})
+		
+		Alerta.objects.filter(id=alerta.id).update(resolved=True)
+		self.assertEqual(publicar_alertas_activas(self.cruce.id), {'alertas_activas': 0})
+
+	def test_sin_estado_guardado_envia_valores_completos(self):
+		"""Test que tras perder el estado en cache se envían todos los campos"""
+		from apps.api.dashboard_stream import publicar_telemetria, CLAVE_ESTADO, CAMPOS_TELEMETRIA
+
+		publicar_telemetria(self._telemetria(0, 22.0))
+		cache.delete(CLAVE_ESTADO.format(self.cruce.id))
+
+		delta = publicar_telemetria(self._telemetria(1, 22.0))
+		self.assertEqual(set(delta['telemetria_actual']), set(CAMPOS_TELEMETRIA) | {'timestamp'})
+		self.assertEqual(publicar_telemetria(self._telemetria(2, 22.0)), {})
+
+	@override_settings(INGESTA_ASINCRONA=False)
+	def test_lote_un_delta_por_cruce(self):
+		"""Test que un lote emite un solo delta por cruce, con la última lectura"""
+		from unittest import mock
+		from apps.api import dashboard_stream
+
+		inicio = timezone.now() - timedelta(minutes=10)
+		data = {
+			'esp32_token': 'esp32_default_token_123',
+			'lecturas': [
+				{
+					'cruce_id': self.cruce.id,
+					'barrier_voltage': 22.0 if segundos < 50 else 0.5,
+					'battery_voltage': 10.5,
+					'timestamp': (inicio + timedelta(seconds=segundos)).isoformat(),
+				}
+				for segundos in range(0, 100, 10)
+			]
+		}
+		emitidos = []
+		with mock.patch.object(dashboard_stream, '_emitir_delta', lambda cruce_id, delta: emitidos.append((cruce_id, delta))):
+			with self.captureOnCommitCallbacks(execute=True):
+				response = APIClient().post('/api/esp32/telemetria/batch', data, format='json')
+		self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+		self.assertEqual(len(emitidos), 1)
+		cruce_id, delta = emitidos[0]
+		self.assertEqual(cruce_id, self.cruce.id)
+		self.assertEqual(delta['telemetria_actual']['barrier_status'], 'UP')
+		self.assertEqual(datetime.fromisoformat(delta['telemetria_actual']['timestamp']), inicio + timedelta(seconds=90))
+		self.assertEqual(datetime.fromisoformat(delta['ultimo_evento']), inicio + timedelta(seconds=50))
+		self.assertEqual(delta['alertas_activas'], Alerta.objects.filter(cruce=self.cruce, resolved=False).count())
+
+
+@override_settings(INGESTA_ASINCRONA=False)
+class CruceEstadoActualTestCase(TestCase):
+	"""Tests para la tabla CruceEstadoActual (último estado por cruce)"""
+	
+	URL = '/api/esp32/telemetria/batch'
+	
+	def setUp(self):
+		cache.clear()
+		self.client = APIClient()
+		self.cruce_1 = Cruce.objects.create(nombre='Cruce 1', ubicacion='Ubicación 1', estado='ACTIVO')
+		self.cruce_2 = Cruce.objects.create(nombre='Cruce 2', ubicacion='Ubicación 2', estado='ACTIVO')
+		self.inicio = timezone.now() - timedelta(minutes=10)
+	
+	def _enviar(self, *lecturas):
+		data = {
+			'esp32_token': 'esp32_default_token_123',
+			'lecturas': [
+				{
+					'cruce_id': cruce.id,
+					'barrier_voltage': barrier_voltage,
+					'battery_voltage': battery_voltage,
+					'timestamp': (self.inicio + timedelta(seconds=segundos)).isoformat(),
+				}
+				for cruce, segundos, barrier_voltage, battery_voltage in lecturas
+			]
+		}
+		with self.captureOnCommitCallbacks(execute=True):
+			response = self.client.post(self.URL, data, format='json')
+		self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+	
+	def test_ingesta_actualiza_estado(self):
+		"""Test que la ingesta guarda la última lectura, el último evento y las alertas activas"""
+		self._enviar(
+			(self.cruce_1, 0, 22.0, 12.5),
+			(self.cruce_1, 10, 0.5, 12.5),
+			(self.cruce_2, 0, 22.0, 10.5),
+		)
+		
+		estado = CruceEstadoActual.objects.get(cruce=self.cruce_1)
+		self.assertEqual(estado.timestamp, self.inicio + timedelta(seconds=10))
+		self.assertEqual(estado.barrier_status, 'UP')
+		self.assertEqual(estado.ultimo_evento_estado, 'UP')
+		self.assertEqual(estado.telemetria_id, Telemetria.objects.filter(cruce=self.cruce_1).latest('timestamp').id)
+		
+		estado_2 = CruceEstadoActual.objects.get(cruce=self.cruce_2)
+		self.assertEqual(estado_2.alertas_activas, Alerta.objects.filter(cruce=self.cruce_2, resolved=False).count())
+		self.assertGreater(estado_2.alertas_activas, 0)
+		
+		# Una lectura atrasada no pisa el estado
+		self._enviar((self.cruce_1, 5, 22.0, 12.5))
+		estado.refresh_from_db()
+		self.assertEqual(estado.timestamp, self.inicio + timedelta(seconds=10))
+		self.assertEqual(estado.barrier_status, 'UP')
+	
+	def test_alertas_del_lote_se_recuentan_una_vez_por_cruce(self):
+		"""Test que un lote con muchas alertas recuenta las activas una vez por cruce"""
+		with CaptureQueriesContext(connection) as consultas:
+			self._enviar(*[(self.cruce_1, segundos, 0.5, 10.5) for segundos in range(0, 100, 10)])
+		
+		recuentos = [q['sql'] for q in consultas.captured_queries if q['sql'].startswith('SELECT COUNT') and 'api_alerta' in q['sql']]
+		self.assertEqual(len(recuentos), 1)
+		self.assertEqual(CruceEstadoActual.objects.get(cruce=self.cruce_1).alertas_activas, 20)
+	
+	def test_dashboard_sin_queries_por_cruce(self):
+		"""Test que el dashboard se arma con una sola query"""
+		from apps.api.dashboard_stream import construir_dashboard
+		
+		self._enviar((self.cruce_1, 0, 22.0, 12.5), (self.cruce_2, 0, 0.5, 12.5))
+		
+		with self.assertNumQueries(1):
+			datos = construir_dashboard()
+		
+		por_id = {c['id']: c for c in datos['cruces']}
+		self.assertEqual(por_id[self.cruce_1.id]['telemetria_actual']['barrier_status'], 'DOWN')
+		self.assertEqual(por_id[self.cruce_2.id]['telemetria_actual']['barrier_status'], 'UP')
+
+
+class CruceMapaTestCase(TestCase):
+	"""Tests para el endpoint del mapa de cruces"""
+	
+	URL = '/api/cruces/mapa/'
+	
+	def setUp(self):
+		cache.clear()
+		self.client = APIClient()
+		# El perfil lo crea el signal de User
+		self.user = User.objects.create_user(username='mapa', password='testpass123456')
+		self.client.force_authenticate(user=self.user)
+	
+	def _crear_cruces(self, cantidad):
+		for i in range(cantidad):
+			cruce = Cruce.objects.create(
+				nombre=f'Cruce Mapa {Cruce.objects.count()}', ubicacion='Ubicación', estado='ACTIVO',
+				coordenadas_lat=-33.4 + i * 0.01, coordenadas_lng=-70.6
+			)
+			Alerta.objects.create(type='LOW_BATTERY', severity='WARNING', description='Batería baja', cruce=cruce)
+	
+	def _queries(self):
+		with CaptureQueriesContext(connection) as contexto:
+			response = self.client.get(self.URL)
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		return len(contexto), response
+	
+	def test_queries_constantes(self):
+		"""Test que el número de queries no crece con el número de cruces"""
+		self._crear_cruces(2)
+		queries_pocos, _ = self._queries()
+		
+		self._crear_cruces(10)
+		queries_muchos, response = self._queries()
+		
+		self.assertEqual(queries_pocos, queries_muchos)
+		self.assertEqual(response.data['total_cruces'], 12)
+		self.assertTrue(all(c['alertas_activas'] == 1 for c in response.data['cruces']))
+	
+	def test_etag_304(self):
+		"""Test que un mapa sin cambios responde 304 y uno modificado 200"""
+		self._crear_cruces(3)
+		response = self.client.get(self.URL)
+		etag = response['ETag']
+		self.assertTrue(response.has_header('Last-Modified'))
+		
+		response = self.client.get(self.URL, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+		
+		cruce = Cruce.objects.first()
+		Alerta.objects.create(type='SENSOR_ERROR', severity='INFO', description='Sensor', cruce=cruce)
+		response = self.client.get(self.URL, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertNotEqual(response['ETag'], etag)
+
+
+class CruceListadoTestCase(TestCase):
+	"""Tests para el listado de cruces con conteos anotados"""
+	
+	URL = '/api/cruces/'
+	
+	def setUp(self):
+		cache.clear()
+		self.client = APIClient()
+		self.user = User.objects.create_user(username='listado', password='testpass123456')
+		self.client.force_authenticate(user=self.user)
+	
+	def _crear_cruces(self, cantidad):
+		for _ in range(cantidad):
+			cruce = Cruce.objects.create(nombre=f'Cruce {Cruce.objects.count():03d}', ubicacion='Ubicación')
+			Sensor.objects.create(nombre='Barrera', tipo='BARRERA', cruce=cruce, activo=True)
+			Sensor.objects.create(nombre='Gabinete', tipo='GABINETE', cruce=cruce, activo=False)
+			Alerta.objects.create(type='LOW_BATTERY', severity='WARNING', description='Batería baja', cruce=cruce)
+	
+	def _listar(self):
+		with CaptureQueriesContext(connection) as contexto:
+			response = self.client.get(self.URL)
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		return len(contexto), response.data.get('results', response.data)
+	
+	def test_listado_queries_constantes(self):
+		"""Test que el listado no hace queries por cruce y mantiene los campos calculados"""
+		self._crear_cruces(2)
+		queries_pocos, _ = self._listar()
+		
+		self._crear_cruces(8)
+		queries_muchos, cruces = self._listar()
+		
+		self.assertEqual(queries_pocos, queries_muchos)
+		self.assertEqual(len(cruces), 10)
+		for cruce in cruces:
+			self.assertEqual(cruce['total_sensores'], 2)
+			self.assertEqual(cruce['sensores_activos'], 1)
+			self.assertEqual(cruce['alertas_activas'], 1)
+			self.assertIsNone(cruce['ultima_telemetria'])
+
+
+class ExportacionTelemetriaTestCase(TestCase):
+	"""Tests para la exportación de telemetría a CSV"""
+	
+	URL = '/api/telemetria/exportar/'
+	
+	def setUp(self):
+		self.client = APIClient()
+		self.user = User.objects.create_user(username='exportar', password='testpass123456')
+		self.client.force_authenticate(user=self.user)
+		self.cruce = Cruce.objects.create(nombre='Cruce Export', ubicacion='Ubicación')
+		self.otro = Cruce.objects.create(nombre='Otro Cruce', ubicacion='Ubicación')
+	
+	def _crear(self, cruce, cantidad):
+		inicio = timezone.now() - timedelta(days=1)
+		Telemetria.objects.bulk_create([
+			Telemetria(
+				cruce=cruce, timestamp=inicio + timedelta(minutes=i),
+				barrier_voltage=22.0, battery_voltage=12.5, barrier_status='DOWN', sensor_1=0
+			)
+			for i in range(cantidad)
+		])
+	
+	def _exportar(self, **params):
+		with CaptureQueriesContext(connection) as contexto:
+			response = self.client.get(self.URL, params)
+			contenido = b''.join(response.streaming_content).decode('utf-8')
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		return len(contexto), contenido.splitlines()
+	
+	def test_exportacion_streaming(self):
+		"""Test que la exportación es streaming, filtra y no hace queries por fila"""
+		self._crear(self.cruce, 3)
+		self._crear(self.otro, 2)
+		queries_pocas, lineas = self._exportar(cruce_id=self.cruce.id)
+		self.assertEqual(len(lineas), 4)
+		self.assertTrue(lineas[0].startswith('ID,Cruce,Fecha'))
+		self.assertIn(',Cruce Export,', lineas[1])
+		# Sensor en 0 se exporta vacío, igual que antes
+		self.assertEqual(lineas[1].split(',')[5], '')
+		
+		self._crear(self.cruce, 20)
+		queries_muchas, lineas = self._exportar(cruce_id=self.cruce.id)
+		self.assertEqual(len(lineas), 24)
+		self.assertEqual(queries_pocas, queries_muchas)
+
+	def test_accept_json_recibe_csv(self):
+		"""Test que un cliente con Accept: application/json sigue recibiendo el CSV"""
+		self._crear(self.cruce, 2)
+		response = self.client.get(self.URL, HTTP_ACCEPT='application/json')
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+		self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 3)
+
+	@override_settings(EXPORTACION_CHUNK_SIZE=10)
+	def test_exportacion_columnar(self):
+		"""Test que parquet y arrow se escriben por bloques con columnas tipadas"""
+		try:
+			import pyarrow as pa
+			import pyarrow.parquet as pq
+		except ImportError:
+			self.skipTest('pyarrow no instalado')
+		import io
+		
+		self._crear(self.cruce, 23)
+		
+		response = self.client.get(self.URL, {'format': 'parquet', 'cruce_id': self.cruce.id})
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		archivo = pq.ParquetFile(io.BytesIO(b''.join(response.streaming_content)))
+		self.assertEqual(archivo.metadata.num_rows, 23)
+		self.assertEqual(archivo.metadata.num_row_groups, 3)
+		tabla = archivo.read()
+		self.assertEqual(tabla.schema.field('timestamp').type, pa.timestamp('us', tz='UTC'))
+		self.assertEqual(set(tabla.column('cruce_nombre').to_pylist()), {'Cruce Export'})
+		
+		response = self.client.get(self.URL, {'format': 'arrow'})
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		tabla = pa.ipc.open_stream(b''.join(response.streaming_content)).read_all()
+		self.assertEqual(tabla.num_rows, 23)
+		self.assertEqual(tabla.column('sensor_1').to_pylist()[0], 0)
+
+
+class ExportacionASGITestCase(TransactionTestCase):
+	"""Tests para las exportaciones servidas por el handler ASGI (uvicorn)"""
+	
+	URL = '/api/telemetria/exportar/'
+	
+	def setUp(self):
+		cache.clear()
+		self.user = User.objects.create_user(username='asgi', password='testpass123456')
+		self.cruce = Cruce.objects.create(nombre='Cruce ASGI', ubicacion='Ubicación')
+		inicio = timezone.now() - timedelta(days=1)
+		Telemetria.objects.bulk_create([
+			Telemetria(
+				cruce=self.cruce, timestamp=inicio + timedelta(minutes=i),
+				barrier_voltage=22.0, battery_voltage=12.5, barrier_status='DOWN'
+			)
+			for i in range(7)
+		])
+	
+	def _get_asgi(self, url, query=''):
+		import asyncio
+		from asgiref.sync import async_to_sync
+		from django.core.handlers.asgi import ASGIHandler
+		from rest_framework_simplejwt.tokens import AccessToken
+		
+		scope = {
+			'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+			'method': 'GET', 'scheme': 'http', 'path': url, 'root_path': '',
+			'query_string': query.encode(), 'server': ('testserver', 80), 'client': ('127.0.0.1', 1234),
+			'headers': [
+				(b'host', b'testserver'),
+				(b'authorization', f'Bearer {AccessToken.for_user(self.user)}'.encode()),
+			],
+		}
+		recibidos = []
+		mensajes = []
+		
+		async def receive():
+			if not recibidos:
+				recibidos.append(True)
+				return {'type': 'http.request', 'body': b'', 'more_body': False}
+			await asyncio.sleep(3600)
+		
+		async def send(mensaje):
+			mensajes.append(mensaje)
+		
+		async_to_sync(ASGIHandler())(scope, receive, send)
+		cuerpos = [m for m in mensajes if m['type'] == 'http.response.body']
+		return mensajes[0]['status'], cuerpos
+	
+	@override_settings(EXPORTACION_CHUNK_SIZE=2)
+	def test_csv_por_bloques_bajo_asgi(self):
+		"""Test que bajo ASGI el CSV se envía por bloques sin consumir el iterador entero"""
+		import warnings
+		
+		with warnings.catch_warnings(record=True) as avisos:
+			warnings.simplefilter('always')
+			estado, cuerpos = self._get_asgi(self.URL, f'cruce_id={self.cruce.id}')
+		
+		self.assertEqual(estado, 200)
+		self.assertFalse([a for a in avisos if 'consume synchronous iterators' in str(a.message)])
+		lineas = b''.join(c.get('body', b'') for c in cuerpos).decode('utf-8').splitlines()
+		self.assertEqual(len(lineas), 8)
+		# Encabezado + 7 filas en bloques de 2 líneas, más el cierre
+		self.assertEqual(len([c for c in cuerpos if c.get('body')]), 4)
+
+
+class TrabajoExportacionTestCase(TestCase):
+	"""Tests para las exportaciones en segundo plano"""
+	
+	URL = '/api/exportaciones/'
+	
+	def setUp(self):
+		import tempfile
+		self.directorio = tempfile.TemporaryDirectory()
+		self.addCleanup(self.directorio.cleanup)
+		ajustes = override_settings(EXPORTACIONES_DIR=self.directorio.name)
+		ajustes.enable()
+		self.addCleanup(ajustes.disable)
+		
+		self.client = APIClient()
+		self.user = User.objects.create_user(username='exportaciones', password='testpass123456')
+		self.client.force_authenticate(user=self.user)
+		self.cruce = Cruce.objects.create(nombre='Cruce Job', ubicacion='Ubicación')
+		Alerta.objects.bulk_create([
+			Alerta(type='LOW_BATTERY', severity='CRITICAL', description=f'Alerta {i}', cruce=self.cruce)
+			for i in range(50)
+		])
+	
+	def test_exportacion_en_segundo_plano(self):
+		"""Test que el worker genera el archivo gzip y la descarga admite Range"""
+		import gzip
+		from apps.api.tareas import procesar_lote
+		
+		response = self.client.post(self.URL, {
+			'tipo': 'alertas', 'formato': 'csv', 'filtros': {'cruce_id': self.cruce.id, 'resuelta': False}
+		}, format='json')
+		self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+		trabajo_id = response.data['id']
+		self.assertEqual(response.data['filtros'], {'cruce_id': str(self.cruce.id), 'resuelta': 'false'})
+		
+		# Todavía sin archivo
+		response = self.client.get(f'{self.URL}{trabajo_id}/descargar/')
+		self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+		
+		self.assertEqual(procesar_lote(tipos=['generar_exportacion']), (1, 0))
+		trabajo = TrabajoExportacion.objects.get(id=trabajo_id)
+		self.assertEqual(trabajo.estado, 'COMPLETADO')
+		self.assertEqual(trabajo.filas, 50)
+		
+		response = self.client.get(f'{self.URL}{trabajo_id}/descargar/')
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		completo = b''.join(response.streaming_content)
+		self.assertEqual(len(completo), trabajo.tamano_bytes)
+		lineas = gzip.decompress(completo).decode('utf-8').splitlines()
+		self.assertEqual(len(lineas), 51)
+		self.assertIn('Batería Baja,Crítica,Cruce Job', lineas[1])
+		
+		# Reanudar desde el byte 100
+		response = self.client.get(f'{self.URL}{trabajo_id}/descargar/', HTTP_RANGE='bytes=100-')
+		self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+		self.assertEqual(response['Content-Range'], f'bytes 100-{len(completo) - 1}/{len(completo)}')
+		self.assertEqual(b''.join(response.streaming_content), completo[100:])
+		
+		response = self.client.get(f'{self.URL}{trabajo_id}/descargar/', HTTP_RANGE=f'bytes={len(completo)}-')
+		self.assertEqual(response.status_code, 416)
+	
+	def test_filtros_invalidos(self):
+		"""Test que se rechazan filtros que no corresponden al tipo"""
+		response = self.client.post(self.URL, {
+			'tipo': 'telemetria', 'filtros': {'severidad': 'CRITICAL'}
+		}, format='json')
+		self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+		self.assertFalse(TareaAsincrona.objects.exists())
+
+
+class ExportacionAlertasTestCase(TestCase):
+	"""Tests para la exportación de alertas"""
+	
+	URL = '/api/alertas/exportar/'
+	
+	def setUp(self):
+		self.client = APIClient()
+		self.user = User.objects.create_user(username='alertas', password='testpass123456')
+		self.client.force_authenticate(user=self.user)
+		self.cruce = Cruce.objects.create(nombre='Cruce Alertas', ubicacion='Ubicación')
+	
+	def _crear(self, cantidad, dias_atras):
+		alertas = Alerta.objects.bulk_create([
+			Alerta(type='VOLTAGE_CRITICAL', severity='WARNING', description='Voltaje', cruce=self.cruce, resolved=True)
+			for _ in range(cantidad)
+		])
+		Alerta.objects.filter(id__in=[a.id for a in alertas]).update(
+			created_at=timezone.now() - timedelta(days=dias_atras)
+		)
+	
+	def _exportar(self, **params):
+		with CaptureQueriesContext(connection) as contexto:
+			response = self.client.get(self.URL, params)
+			lineas = b''.join(response.streaming_content).decode('utf-8').splitlines()
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		return len(contexto), lineas
+	
+	def test_exportacion_streaming_con_fechas(self):
+		"""Test que la exportación no hace queries por fila y filtra por rango de fechas"""
+		self._crear(3, dias_atras=1)
+		queries_pocas, lineas = self._exportar()
+		self.assertEqual(lineas[0], 'ID,Tipo,Severidad,Cruce,Descripción,Resuelta,Fecha Creación,Fecha Resolución')
+		self.assertIn(',Voltaje Crítico,Advertencia,Cruce Alertas,Voltaje,Sí,', lineas[1])
+		
+		self._crear(30, dias_atras=10)
+		queries_muchas, lineas = self._exportar()
+		self.assertEqual(len(lineas), 34)
+		self.assertEqual(queries_pocas, queries_muchas)
+		
+		desde = (timezone.now() - timedelta(days=5)).isoformat()
+		_, lineas = self._exportar(fecha_desde=desde)
+		self.assertEqual(len(lineas), 4)
+	
+	def test_fecha_invalida(self):
+		"""Test que una fecha inválida responde 400 en la exportación y en el listado"""
+		for url in (self.URL, '/api/alertas/'):
+			response = self.client.get(url, {'fecha_desde': 'garbage'})
+			self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+			self.assertIn('Fecha inválida', json.loads(response.content)['error'])
+		
+		response = self.client.post('/api/exportaciones/', {
+			'tipo': 'alertas', 'filtros': {'fecha_hasta': '2024-13-45'}
+		}, format='json')
+		self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CalcularMetricasTestCase(TestCase):
+	"""Tests para el cálculo de métricas diarias por conjuntos"""
+	
+	def setUp(self):
+		from datetime import date
+		from apps.api.metricas import rango_dia
+		self.fecha = date(2025, 3, 10)
+		self.inicio, _ = rango_dia(self.fecha)
+		self.cruce = Cruce.objects.create(nombre='Cruce Métricas', ubicacion='Ubicación')
+		self.sin_datos = Cruce.objects.create(nombre='Cruce Sin Datos', ubicacion='Ubicación')
+	
+	def test_metricas_del_dia(self):
+		"""Test que la disponibilidad sigue la regla de huecos y el upsert actualiza la fila"""
+		from apps.api.metricas import calcular_metricas
+		
+		# Huecos: 0.5h desde el inicio, 0.5h, 2h (1 activa + 1 inactiva) y ~21h hasta el fin
+		Telemetria.objects.bulk_create([
+			Telemetria(cruce=self.cruce, timestamp=self.inicio + timedelta(minutes=minutos),
+					   barrier_voltage=22.0, battery_voltage=voltaje)
+			for minutos, voltaje in ((30, 12.0), (60, 11.0), (180, 13.0))
+		])
+		Alerta.objects.bulk_create([
+			Alerta(type='LOW_BATTERY', severity='CRITICAL', description='Batería', cruce=self.cruce)
+		])
+		Alerta.objects.update(created_at=self.inicio + timedelta(hours=2))
+		
+		with self.assertNumQueries(7):
+			calcular_metricas(self.fecha)
+		
+		metricas = MetricasDesempeno.objects.get(cruce=self.cruce, fecha=self.fecha)
+		self.assertEqual(metricas.total_telemetrias, 3)
+		self.assertAlmostEqual(metricas.voltaje_promedio, 12.0)
+		self.assertEqual(metricas.voltaje_minimo, 11.0)
+		self.assertAlmostEqual(metricas.horas_bateria_baja, 5 / 60)
+		self.assertAlmostEqual(metricas.tiempo_activo, 3.0, places=4)
+		self.assertAlmostEqual(metricas.tiempo_inactivo, 21.0, places=4)
+		self.assertEqual(metricas.total_alertas, 1)
+		self.assertEqual(metricas.alertas_criticas, 1)
+		
+		vacio = MetricasDesempeno.objects.get(cruce=self.sin_datos, fecha=self.fecha)
+		self.assertEqual(vacio.tiempo_inactivo, 24.0)
+		self.assertEqual(vacio.disponibilidad_porcentaje, 0)
+		
+		# Recalcular actualiza la misma fila
+		Telemetria.objects.filter(battery_voltage=13.0).delete()
+		calcular_metricas(self.fecha)
+		self.assertEqual(MetricasDesempeno.objects.count(), 2)
+		metricas.refresh_from_db()
+		self.assertEqual(metricas.total_telemetrias, 2)
+	
+	def test_recalcular_rango(self):
+		"""Test que el backfill calcula cada (fecha, cruce) del rango y reporta el avance"""
+		from io import StringIO
+		from django.core.management import call_command
+		
+		Telemetria.objects.create(
+			cruce=self.cruce, timestamp=self.inicio + timedelta(days=1, hours=3),
+			barrier_voltage=22.0, battery_voltage=12.5
+		)
+		
+		salida = StringIO()
+		call_command(
+			'calcular_metricas', desde='2025-03-10', hasta='2025-03-12',
+			cruces_por_unidad=1, stdout=salida
+		)
+		
+		self.assertEqual(MetricasDesempeno.objects.count(), 6)
+		self.assertIn('[6/6]', salida.getvalue())
+		dia = MetricasDesempeno.objects.get(cruce=self.cruce, fecha=self.inicio.date() + timedelta(days=1))
+		self.assertEqual(dia.total_telemetrias, 1)
+
+
+class RecalcularRangoParaleloTestCase(TransactionTestCase):
+	"""Tests del backfill de métricas con un pool de procesos 'spawn'"""
+	
+	def test_worker_spawn_configura_django(self):
+		"""Test que el inicializador y las unidades se deserializan y corren en un proceso 'spawn'"""
+		import multiprocessing
+		from concurrent.futures import ProcessPoolExecutor
+		from datetime import date
+		from apps.api.metricas_worker import inicializar, procesar_unidad
+		
+		contexto = multiprocessing.get_context('spawn')
+		with ProcessPoolExecutor(max_workers=1, mp_context=contexto, initializer=inicializar) as pool:
+			# Sin cruces no hay consultas: solo se comprueba que Django carga
+			self.assertEqual(pool.submit(procesar_unidad, (date(2025, 3, 10), [])).result(), (date(2025, 3, 10), 0))
+	
+	def test_recalcular_rango_con_dos_workers(self):
+		"""Test que recalcular_rango con workers=2 calcula todo el rango en la BD de tests"""
+		from datetime import date
+		from apps.api.metricas import recalcular_rango
+		
+		if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+			self.skipTest('Los procesos del pool no ven una BD SQLite en memoria')
+		
+		cruces = [Cruce.objects.create(nombre=f'Cruce Pool {i}', ubicacion='Ubicación') for i in range(2)]
+		filas = recalcular_rango(
+			date(2025, 3, 10), date(2025, 3, 11), cruce_ids=[c.id for c in cruces], workers=2, cruces_por_unidad=1
+		)
+		self.assertEqual(filas, 4)
+		self.assertEqual(MetricasDesempeno.objects.filter(cruce__in=cruces).count(), 4)
+
+
+@override_settings(METRICAS_VIVAS_INTERVALO=0)
+class MetricasVivasTestCase(TestCase):
+	"""Tests para las métricas del día acumuladas durante la ingesta"""
+	
+	def setUp(self):
+		from apps.api import metricas_vivas
+		from apps.api.metricas import rango_dia
+		metricas_vivas._pendientes.clear()
+		cache.clear()
+		self.inicio, _ = rango_dia(timezone.localdate())
+		self.cruce = Cruce.objects.create(nombre='Cruce Vivo', ubicacion='Ubicación')
+		self.user = User.objects.create_user(username='metricas_vivas', password='test123')
+		self.client = APIClient()
+		self.client.force_authenticate(user=self.user)
+	
+	def _registrar(self, *lecturas):
+		from apps.api import metricas_vivas
+		telemetrias = Telemetria.objects.bulk_create([
+			Telemetria(cruce=self.cruce, timestamp=self.inicio + timedelta(minutes=minutos),
+					   barrier_voltage=22.0, battery_voltage=voltaje)
+			for minutos, voltaje in lecturas
+		])
+		with self.captureOnCommitCallbacks(execute=True):
+			metricas_vivas.registrar_telemetrias(telemetrias)
+	
+	def test_acumulados_entre_volcados(self):
+		"""Test que los huecos y voltajes se combinan entre volcados sucesivos"""
+		# Huecos: 0.5h desde las 00:00, 0.5h y 2h (1 activa + 1 inactiva)
+		self._registrar((30, 12.0), (60, 11.0))
+		self._registrar((180, 13.0))
+		
+		acumulado = AcumuladoDiario.objects.get(cruce=self.cruce)
+		self.assertEqual(acumulado.total_telemetrias, 3)
+		self.assertAlmostEqual(acumulado.suma_voltaje, 36.0)
+		self.assertEqual(acumulado.voltaje_minimo, 11.0)
+		self.assertEqual(acumulado.voltaje_maximo, 13.0)
+		self.assertEqual(acumulado.muestras_bateria_baja, 1)
+		self.assertAlmostEqual(acumulado.segundos_activo, 2 * 3600)
+		self.assertAlmostEqual(acumulado.segundos_inactivo, 3600)
+	
+	def test_metricas_hoy(self):
+		"""Test que el endpoint hoy sirve las métricas parciales sin recorrer la telemetría"""
+		self._registrar((30, 12.0), (60, 11.0))
+		
+		with CaptureQueriesContext(connection) as consultas:
+			response = self.client.get('/api/metricas-desempeno/hoy/', {'cruce': self.cruce.id})
+		
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertFalse(any('api_telemetria' in q['sql'] for q in consultas.captured_queries))
+		self.assertEqual(len(response.data), 1)
+		self.assertEqual(response.data[0]['total_telemetrias'], 2)
+		self.assertAlmostEqual(response.data[0]['voltaje_promedio'], 11.5)
+
+		response = self.client.get('/api/metricas-desempeno/hoy/', {'cruce': 'abc'})
+		self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+	def test_procesos_con_lecturas_intercaladas(self):
+		"""Test que dos procesos con lecturas intercaladas no cuentan dos veces los huecos"""
+		from apps.api import metricas_vivas
+
+		# Proceso A: 0, 10 y 20 min; proceso B: 5, 15 y 25 min
+		for minutos in ((0, 10, 20), (5, 15, 25)):
+			acumulado = metricas_vivas._Acumulado()
+			for m in minutos:
+				acumulado.agregar(self.inicio + timedelta(minutes=m), 12.5)
+			metricas_vivas._pendientes[(self.cruce.id, timezone.localdate(self.inicio))] = acumulado
+			metricas_vivas.volcar()
+
+		acumulado = AcumuladoDiario.objects.get(cruce=self.cruce)
+		self.assertEqual(acumulado.total_telemetrias, 6)
+		self.assertAlmostEqual(acumulado.segundos_activo, 25 * 60)
+		self.assertAlmostEqual(acumulado.segundos_inactivo, 0)
+		self.assertEqual(acumulado.ultima_telemetria, self.inicio + timedelta(minutes=25))
+
+
+class ResumenTelemetriaTestCase(TestCase):
+	"""Tests para los resúmenes de telemetría por minuto/hora y el endpoint de series"""
+	
+	def setUp(self):
+		cache.clear()
+		self.cruce = Cruce.objects.create(nombre='Cruce Series', ubicacion='Ubicación')
+		self.inicio = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=3)
+		self.user = User.objects.create_user(username='series', password='test123')
+		self.client = APIClient()
+		self.client.force_authenticate(user=self.user)
+	
+	def _lecturas(self, *lecturas):
+		Telemetria.objects.bulk_create([
+			Telemetria(cruce=self.cruce, timestamp=self.inicio + timedelta(seconds=segundos),
+					   barrier_voltage=barrera, battery_voltage=12.0,
+					   barrier_status='DOWN' if barrera > 2.0 else 'UP')
+			for segundos, barrera in lecturas
+		])
+	
+	def test_resumen_incremental(self):
+		"""Test que una lectura atrasada recalcula su intervalo sin duplicarlo"""
+		from apps.api.resumenes import resumir_pendiente
+		
+		self._lecturas((0, 22.0), (30, 0.5), (65, 24.0), (3700, 0.5))
+		totales = resumir_pendiente(solape=0)
+		self.assertEqual(totales['lecturas'], 4)
+		self.assertEqual(TelemetriaMinuto.objects.count(), 3)
+		self.assertEqual(TelemetriaHora.objects.count(), 2)
+		
+		minuto = TelemetriaMinuto.objects.get(inicio=self.inicio)
+		self.assertEqual(minuto.lecturas, 2)
+		self.assertEqual(minuto.barrier_voltage_max, 22.0)
+		self.assertAlmostEqual(minuto.barrier_voltage_avg, 11.25)
+		self.assertEqual(minuto.lecturas_barrera_abajo, 1)
+		
+		# Lectura atrasada en un minuto ya resumido
+		self._lecturas((45, 1.0))
+		totales = resumir_pendiente(solape=0)
+		self.assertEqual(totales['lecturas'], 1)
+		self.assertEqual(TelemetriaMinuto.objects.count(), 3)
+		self.assertEqual(TelemetriaMinuto.objects.get(inicio=self.inicio).lecturas, 3)
+		self.assertEqual(TelemetriaHora.objects.get(inicio=self.inicio).lecturas, 4)
+	
+	def test_series_resolucion_automatica(self):
+		"""Test que la resolución depende del rango y que el tramo sin resumir se agrega al vuelo"""
+		from apps.api.resumenes import resumir_pendiente
+		
+		self._lecturas((0, 22.0), (3700, 0.5))
+		resumir_pendiente()
+		self._lecturas((3710, 24.0))
+		
+		response = self.client.get('/api/telemetria/series/', {
+			'cruce_id': self.cruce.id,
+			'fecha_desde': (self.inicio - timedelta(days=30)).isoformat(),
+		})
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual(response.data['resolucion'], 'hora')
+		self.assertEqual([p['lecturas'] for p in response.data['puntos']], [1, 2])
+		
+		response = self.client.get('/api/telemetria/series/', {
+			'cruce_id': self.cruce.id,
+			'fecha_desde': self.inicio.isoformat(),
+			'fecha_hasta': (self.inicio + timedelta(hours=2)).isoformat(),
+		})
+		self.assertEqual(response.data['resolucion'], 'raw')
+		self.assertEqual(response.data['total_puntos'], 3)
+		
+		response = self.client.get('/api/telemetria/series/', {'resolucion': 'hora'})
+		self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+	@override_settings(SERIES_MAX_PUNTOS_RAW=2)
+	def test_series_raw_acotada_y_cruce_invalido(self):
+		"""Test que raw forzado tiene tope de rango y de lecturas, y que cruce_id se valida"""
+		self._lecturas((0, 22.0), (60, 0.5), (120, 24.0))
+		url = '/api/telemetria/series/'
+
+		response = self.client.get(url, {
+			'cruce_id': self.cruce.id, 'resolucion': 'raw',
+			'fecha_desde': (self.inicio - timedelta(days=30)).isoformat(),
+		})
+		self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+		response = self.client.get(url, {
+			'cruce_id': self.cruce.id, 'resolucion': 'raw',
+			'fecha_desde': self.inicio.isoformat(),
+			'fecha_hasta': (self.inicio + timedelta(hours=1)).isoformat(),
+		})
+		self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+		response = self.client.get(url, {
+			'cruce_id': self.cruce.id, 'resolucion': 'raw',
+			'fecha_desde': self.inicio.isoformat(),
+			'fecha_hasta': (self.inicio + timedelta(seconds=90)).isoformat(),
+		})
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		self.assertEqual(response.data['total_puntos'], 2)
+
+		response = self.client.get(url, {'cruce_id': 'abc'})
+		self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ParticionesTestCase(TestCase):
+	"""Tests para la planificación de particiones mensuales"""
+	
+	def test_planificar(self):
+		"""Test que se crean los meses faltantes y se desacoplan los anteriores a la retención"""
+		from datetime import date
+		from apps.api.particiones import planificar, nombre_particion, mes_de_particion
+		
+		existentes = [date(2024, 11, 1), date(2024, 12, 1), date(2025, 1, 1), date(2025, 2, 1)]
+		crear, desacoplar = planificar(existentes, date(2025, 1, 20), meses_adelante=3, retener_meses=1)
+		
+		self.assertEqual(crear, [date(2025, 3, 1), date(2025, 4, 1)])
+		self.assertEqual(desacoplar, [date(2024, 11, 1)])
+		self.assertEqual(planificar(existentes, date(2025, 1, 20), 1)[1], [])
+		
+		nombre = nombre_particion('api_telemetria', date(2025, 3, 1))
+		self.assertEqual(nombre, 'api_telemetria_p2025_03')
+		self.assertEqual(mes_de_particion('api_telemetria', nombre), date(2025, 3, 1))
+		self.assertIsNone(mes_de_particion('api_telemetria', 'api_telemetria_default'))
+
+
+class ArchivoTelemetriaTestCase(TestCase):
+	"""Tests para el archivo de telemetría cruda antigua"""
+	
+	def setUp(self):
+		import tempfile
+		from datetime import datetime
+		self.directorio = tempfile.TemporaryDirectory()
+		self.addCleanup(self.directorio.cleanup)
+		ajustes = override_settings(ARCHIVO_TELEMETRIA_DIR=self.directorio.name)
+		ajustes.enable()
+		self.addCleanup(ajustes.disable)
+		
+		self.client = APIClient()
+		self.user = User.objects.create_user(username='archivo', password='testpass123456')
+		self.client.force_authenticate(user=self.user)
+		self.cruce = Cruce.objects.create(nombre='Cruce Archivo', ubicacion='Ubicación')
+		self.inicio = timezone.make_aware(datetime(2025, 1, 10, 8, 0))
+	
+	def _crear(self, *minutos):
+		return Telemetria.objects.bulk_create([
+			Telemetria(cruce=self.cruce, timestamp=self.inicio + timedelta(minutes=m),
+					   barrier_voltage=22.0, battery_voltage=12.5, barrier_status='DOWN')
+			for m in minutos
+		])
+	
+	def _archivar(self):
+		from io import StringIO
+		from django.core.management import call_command
+		salida = StringIO()
+		call_command('archivar_telemetria', stdout=salida)
+		return salida.getvalue()
+	
+	def test_archivar_y_exportar(self):
+		"""Test que se archiva lo ya resumido, se conservan los eventos y la exportación lo incluye"""
+		from apps.api.resumenes import resumir_pendiente
+		
+		lecturas = self._crear(0, 5, 10)
+		evento = BarrierEvent.objects.create(
+			telemetria=lecturas[0], cruce=self.cruce, state='DOWN',
+			event_time=self.inicio, voltage_at_event=22.0
+		)
+		Telemetria.objects.create(cruce=self.cruce, barrier_voltage=0.5, battery_voltage=12.5)
+		
+		# Sin resúmenes no se archiva nada
+		self.assertIn('sin resumir', self._archivar())
+		self.assertEqual(Telemetria.objects.count(), 4)
+		
+		resumir_pendiente()
+		self._archivar()
+		self.assertEqual(Telemetria.objects.count(), 1)
+		archivo = ArchivoTelemetria.objects.get(cruce=self.cruce)
+		self.assertEqual(archivo.filas, 3)
+		evento.refresh_from_db()
+		self.assertIsNone(evento.telemetria_id)
+		
+		# Lectura atrasada del mismo mes: se agrega al archivo existente
+		self._crear(20)
+		resumir_pendiente()
+		self._archivar()
+		archivo.refresh_from_db()
+		self.assertEqual(archivo.filas, 4)
+		
+		response = self.client.get('/api/telemetria/exportar/', {'cruce_id': self.cruce.id})
+		lineas = b''.join(response.streaming_content).decode('utf-8').splitlines()
+		self.assertEqual(len(lineas), 6)
+		self.assertIn(',Cruce Archivo,', lineas[-1])
+		
+		response = self.client.get('/api/telemetria/exportar/', {
+			'cruce_id': self.cruce.id, 'fecha_desde': '2025-01-10T08:04:00', 'fecha_hasta': '2025-01-31'
+		})
+		lineas = b''.join(response.streaming_content).decode('utf-8').splitlines()
+		self.assertEqual(len(lineas), 4)
+
+	def test_lectura_atrasada_no_pisa_resumen_archivado(self):
+		"""Test que una lectura atrasada de un mes archivado no reemplaza su resumen"""
+		from apps.api.resumenes import resumir_pendiente
+
+		self._crear(0, 5, 10)
+		resumir_pendiente()
+		self._archivar()
+		self.assertFalse(Telemetria.objects.exists())
+
+		self._crear(7)
+		resumir_pendiente()
+		self.assertEqual(TelemetriaHora.objects.get(cruce=self.cruce, inicio=self.inicio).lecturas, 3)
+		self.assertEqual(TelemetriaMinuto.objects.filter(cruce=self.cruce).count(), 3)
+
+		# La lectura atrasada igual se archiva en la siguiente corrida
+		self._archivar()
+		self.assertEqual(ArchivoTelemetria.objects.get(cruce=self.cruce).filas, 4)
+
+
+class IndiceReglasMantenimientoTestCase(TestCase):
+	"""Tests del índice compilado de reglas del motor de mantenimiento"""
+	
+	def setUp(self):
+		cache.clear()
+		self.cruce = Cruce.objects.create(nombre='Cruce Reglas', ubicacion='Test', estado='ACTIVO')
+		self.otro = Cruce.objects.create(nombre='Cruce Otro', ubicacion='Test', estado='ACTIVO')
+		self.regla = MantenimientoPreventivo.objects.create(
+			nombre='Batería baja',
+			tipo_mantenimiento='BATERIA',
+			prioridad='ALTA',
+			condiciones={'battery_voltage': {'operator': 'lt', 'value': 11.0}, 'temperature': {'operator': 'gt', 'value': 60}},
+			activo=True
+		)
+	
+	def test_regla_de_telemetria_sin_queries(self):
+		"""Test que una regla solo de telemetría no hace queries si no se cumple"""
+		from apps.api.mantenimiento_engine import motor_mantenimiento
+		
+		telemetria = Telemetria.objects.create(cruce=self.cruce, barrier_voltage=0.5, battery_voltage=12.5)
+		motor_mantenimiento.evaluar_telemetria(telemetria)
+		
+		with self.assertNumQueries(0):
+			self.assertEqual(motor_mantenimiento.evaluar_telemetria(telemetria), [])
+	
+	def test_invalidacion_y_reglas_por_cruce(self):
+		"""Test que cambios en las reglas se ven en la siguiente evaluación"""
+		from apps.api.mantenimiento_engine import motor_mantenimiento
+		
+		telemetria = Telemetria.objects.create(cruce=self.cruce, barrier_voltage=0.5, battery_voltage=11.5)
+		self.assertEqual(motor_mantenimiento.evaluar_telemetria(telemetria), [])
+		
+		# Umbral modificado: temperatura nula se omite, la batería ahora cumple
+		self.regla.condiciones = {'battery_voltage': {'operator': 'lt', 'value': 12.0}, 'temperature': {'operator': 'gt', 'value': 60}}
+		self.regla.save()
+		self.assertEqual(len(motor_mantenimiento.evaluar_telemetria(telemetria)), 1)
+		
+		# Regla nueva de otro cruce: no aplica a este
+		MantenimientoPreventivo.objects.create(
+			nombre='Barrera otro cruce', tipo_mantenimiento='BARRERA', prioridad='MEDIA',
+			condiciones={'barrier_voltage': 5}, cruce=self.otro, activo=True
+		)
+		self.assertEqual([c.regla.nombre for c in motor_mantenimiento.reglas_para(self.cruce.id)], ['Batería baja'])
+		self.assertEqual(len(motor_mantenimiento.reglas_para(self.otro.id)), 2)
+		
+		self.regla.delete()
+		self.assertEqual(len(motor_mantenimiento.reglas_para(self.cruce.id)), 0)
+
+
+@override_settings(INGESTA_ASINCRONA=False)
+class MantenimientoIngestaTestCase(TestCase):
+	"""Tests de la evaluación de reglas de mantenimiento en la ingesta"""
+	
+	def setUp(self):
+		cache.clear()
+		self.client = APIClient()
+		self.cruce = Cruce.objects.create(nombre='Cruce Ingesta', ubicacion='Test', estado='ACTIVO')
+		MantenimientoPreventivo.objects.create(
+			nombre='Batería baja', tipo_mantenimiento='BATERIA', prioridad='ALTA',
+			condiciones={'battery_voltage': {'operator': 'lt', 'value': 11.0}}, activo=True
+		)
+	
+	def _enviar(self, bateria):
+		data = {
+			'esp32_token': 'esp32_default_token_123',
+			'cruce_id': self.cruce.id,
+			'barrier_voltage': 0.5,
+			'battery_voltage': bateria,
+		}
+		with self.captureOnCommitCallbacks(execute=True):
+			response = self.client.post('/api/esp32/telemetria', data, format='json')
+		self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+	
+	def test_ingesta_genera_mantenimiento_con_enfriamiento(self):
+		"""Test que la ingesta evalúa las reglas y respeta el enfriamiento por cruce"""
+		from apps.api.tareas import procesar_lote
+		
+		self._enviar(12.5)
+		self.assertFalse(HistorialMantenimiento.objects.exists())
+		
+		# Dentro del período de enfriamiento no se vuelve a evaluar
+		self._enviar(10.5)
+		self.assertFalse(HistorialMantenimiento.objects.exists())
+		
+		cache.delete(f'mantenimiento_evaluado_{self.cruce.id}')
+		self._enviar(10.5)
+		# La regla cumplida se encola: la petición no crea el mantenimiento
+		self.assertFalse(HistorialMantenimiento.objects.exists())
+		self.assertEqual(TareaAsincrona.objects.filter(tipo='aplicar_mantenimiento').count(), 1)
+		
+		with self.captureOnCommitCallbacks(execute=True):
+			self.assertEqual(procesar_lote(), (1, 0))
+		self.assertEqual(HistorialMantenimiento.objects.filter(cruce=self.cruce, estado='PENDIENTE').count(), 1)
+	
+	def test_regla_desactivada_antes_de_aplicar(self):
+		"""Test que la tarea encolada no aplica una regla desactivada mientras tanto"""
+		from apps.api.tareas import procesar_lote
+		
+		self._enviar(10.5)
+		MantenimientoPreventivo.objects.update(activo=False)
+		
+		self.assertEqual(procesar_lote(), (1, 0))
+		self.assertFalse(HistorialMantenimiento.objects.exists())
+		self.assertFalse(TareaAsincrona.objects.exists())
+	
+	def test_presupuesto_por_lectura(self):
+		"""Test que al agotar el presupuesto no se evalúan las reglas restantes"""
+		from apps.api.mantenimiento_engine import motor_mantenimiento
+		
+		MantenimientoPreventivo.objects.create(
+			nombre='Barrera', tipo_mantenimiento='BARRERA', prioridad='BAJA',
+			condiciones={'barrier_voltage': 1.0}, activo=True
+		)
+		telemetria = Telemetria.objects.create(cruce=self.cruce, barrier_voltage=0.5, battery_voltage=10.5)
+		
+		with self.assertLogs('apps.api.mantenimiento_engine', level='WARNING'):
+			generados = motor_mantenimiento.evaluar_telemetria(telemetria, presupuesto=-1)
+		self.assertEqual(len(generados), 1)
+		
+		# Sin límite se evalúa también la regla omitida
+		restantes = motor_mantenimiento.evaluar_telemetria(telemetria)
+		self.assertEqual(len(restantes), 1)
+		self.assertNotEqual(restantes[0].regla_id, generados[0].regla_id)
+
+
+class ContextoEvaluacionTestCase(TestCase):
+	"""Tests del contexto de agregados compartido por las reglas de mantenimiento"""
+	
+	def setUp(self):
+		cache.clear()
+		self.cruce = Cruce.objects.create(nombre='Cruce Contexto', ubicacion='Test', estado='ACTIVO')
+		MantenimientoPreventivo.objects.create(
+			nombre='Batería baja sostenida', tipo_mantenimiento='BATERIA', prioridad='ALTA',
+			condiciones={'hours_low_battery': {'operator': 'gt', 'value': 5}}, activo=True
+		)
+		MantenimientoPreventivo.objects.create(
+			nombre='Revisión reciente', tipo_mantenimiento='GENERAL', prioridad='MEDIA',
+			condiciones={'hours_low_battery': {'operator': 'gt', 'value': 10}, 'days_since_maintenance': {'operator': 'lt', 'value': 30}},
+			activo=True
+		)
+	
+	def test_agregados_una_vez_para_todas_las_reglas(self):
+		"""Test que N reglas comparten una consulta por agregado dentro de una pasada"""
+		from apps.api.mantenimiento_engine import motor_mantenimiento
+		
+		telemetria = Telemetria.objects.create(cruce=self.cruce, barrier_voltage=0.5, battery_voltage=11.0)
+		motor_mantenimiento.reglas_para(self.cruce.id)
+		
+		# Lecturas con batería baja + último mantenimiento
+		with self.assertNumQueries(2):
+			self.assertEqual(motor_mantenimiento.evaluar_telemetria(telemetria), [])
+		
+		# Cada pasada consulta los agregados de nuevo (sin cache entre pasadas)
+		HistorialMantenimiento.objects.create(
+			cruce=self.cruce, tipo_mantenimiento='GENERAL', descripcion='Revisión',
+			fecha_programada=timezone.now(), fecha_fin=timezone.now() - timedelta(days=2), estado='COMPLETADO'
+		)
+		with self.assertNumQueries(2):
+			self.assertEqual(motor_mantenimiento.evaluar_telemetria(telemetria), [])
+
+
+class MantenimientoProgramadoLoteTestCase(TestCase):
+	"""Tests de la evaluación por lotes de reglas programadas"""
+	
+	def setUp(self):
+		from apps.api import estado_actual
+		
+		cache.clear()
+		self.cruces = []
+		for i in range(6):
+			cruce = Cruce.objects.create(nombre=f'Cruce Lote {i}', ubicacion='Test', estado='ACTIVO' if i < 5 else 'INACTIVO')
+			telemetria = Telemetria.objects.create(
+				cruce=cruce, barrier_voltage=0.5, battery_voltage=10.5 if i % 2 == 0 else 12.5,
+				temperature=None if i == 0 else 30.0 + i
+			)
+			estado_actual.registrar_telemetrias([telemetria])
+			self.cruces.append(cruce)
+		
+		ayer = timezone.now() - timedelta(days=1)
+		MantenimientoPreventivo.objects.create(
+			nombre='Batería estacional', tipo_mantenimiento='BATERIA', prioridad='ALTA', fecha_inicio=ayer,
+			condiciones={'battery_percentage': {'operator': 'lt', 'value': 50}, 'temperature': {'operator': 'between', 'value': [30, 33]}},
+			activo=True
+		)
+		MantenimientoPreventivo.objects.create(
+			nombre='Revisión cruce inactivo', tipo_mantenimiento='GENERAL', prioridad='BAJA', fecha_inicio=ayer,
+			condiciones={'days_since_maintenance': {'operator': 'gt', 'value': 365}}, cruce=self.cruces[5], activo=True
+		)
+		# Sin fecha de inicio: no es programada
+		MantenimientoPreventivo.objects.create(
+			nombre='Batería', tipo_mantenimiento='BATERIA', prioridad='ALTA',
+			condiciones={'battery_voltage': 11.0}, activo=True
+		)
+	
+	def test_evaluar_programados(self):
+		"""Test que se evalúan todas las reglas sobre todos los cruces sin duplicar"""
+		from apps.api.mantenimiento_engine import motor_mantenimiento
+		
+		generados = motor_mantenimiento.evaluar_mantenimientos_programados()
+		
+		# Batería < 50% y temperatura nula o entre 30 y 33: cruces 0 y 2 (el 4 tiene 34°, el 5 está inactivo)
+		self.assertEqual(
+			sorted((m.regla.nombre, m.cruce.nombre) for m in generados),
+			[('Batería estacional', 'Cruce Lote 0'), ('Batería estacional', 'Cruce Lote 2'),
+			 ('Revisión cruce inactivo', 'Cruce Lote 5')]
+		)
+		self.assertEqual(motor_mantenimiento.evaluar_mantenimientos_programados(), [])
+	
+	def test_con_y_sin_numpy(self):
+		"""Test que la evaluación vectorizada coincide con la evaluación fila por fila"""
+		from apps.api import mantenimiento_lote
+		from apps.api.mantenimiento_engine import motor_mantenimiento
+		
+		reglas = motor_mantenimiento.reglas_compiladas()
+		filas = mantenimiento_lote.cargar_estados({self.cruces[5].id})
+		self.assertEqual(len(filas), 6)
+		
+		np = mantenimiento_lote._importar_numpy()
+		if np is None:
+			self.skipTest('numpy no instalado')
+		
+		def claves(candidatos):
+			return sorted((compilada.regla.nombre, fila.cruce_id) for compilada, fila in candidatos)
+		
+		vectorizados = claves(mantenimiento_lote._candidatos_numpy(np, reglas, filas))
+		self.assertTrue(vectorizados)
+		self.assertEqual(vectorizados, claves(mantenimiento_lote._candidatos_filas(reglas, filas)))
+
+
+class EvaluacionReglasCortoCircuitoTestCase(TestCase):
+	"""Tests del corte temprano y las estadísticas por regla"""
+	
+	def setUp(self):
+		from apps.api.mantenimiento_engine import estadisticas_reglas
+		
+		# Contadores pendientes de otros tests en este proceso
+		estadisticas_reglas.volcar()
+		cache.clear()
+		self.client = APIClient()
+		self.user = User.objects.create_user(username='admin_reglas', password='adminpass123456')
+		self.user.profile.role = 'ADMIN'
+		self.user.profile.save()
+		self.client.force_authenticate(user=self.user)
+		self.cruce = Cruce.objects.create(nombre='Cruce Corte', ubicacion='Test', estado='ACTIVO')
+		self.regla = MantenimientoPreventivo.objects.create(
+			nombre='Batería y revisión', tipo_mantenimiento='BATERIA', prioridad='ALTA',
+			condiciones={
+				'hours_low_battery': {'operator': 'gt', 'value': 5},
+				'days_since_maintenance': {'operator': 'lt', 'value': 30},
+				'battery_voltage': {'operator': 'lt', 'value': 12.0},
+			},
+			activo=True
+		)
+	
+	def test_corte_en_la_primera_condicion_que_falla(self):
+		"""Test que las condiciones en memoria van primero y las consultas se cortan al fallar una"""
+		from apps.api.mantenimiento_engine import motor_mantenimiento
+		
+		motor_mantenimiento.reglas_para(self.cruce.id)
+		telemetria = Telemetria.objects.create(cruce=self.cruce, barrier_voltage=0.5, battery_voltage=12.5)
+		with self.assertNumQueries(0):
+			self.assertEqual(motor_mantenimiento.evaluar_telemetria(telemetria), [])
+		
+		# Nunca hubo mantenimiento (999 días): no se cuentan las lecturas con batería baja
+		telemetria = Telemetria.objects.create(cruce=self.cruce, barrier_voltage=0.5, battery_voltage=11.0)
+		with CaptureQueriesContext(connection) as consultas:
+			self.assertEqual(motor_mantenimiento.evaluar_telemetria(telemetria), [])
+		self.assertEqual(len(consultas), 1)
+		self.assertIn('api_historialmantenimiento', consultas[0]['sql'])
+	
+	def test_estadisticas_por_regla(self):
+		"""Test que el endpoint de administración expone evaluaciones, cumplimiento y tiempo"""
+		from apps.api.mantenimiento_engine import motor_mantenimiento
+		
+		for bateria in (12.5, 12.5, 11.0):
+			telemetria = Telemetria.objects.create(cruce=self.cruce, barrier_voltage=0.5, battery_voltage=bateria)
+			motor_mantenimiento.evaluar_telemetria(telemetria)
+		
+		response = self.client.get('/api/mantenimiento-preventivo/estadisticas/')
+		self.assertEqual(response.status_code, status.HTTP_200_OK)
+		fila = response.data['reglas'][0]
+		self.assertEqual(fila['nombre'], 'Batería y revisión')
+		self.assertEqual((fila['evaluaciones'], fila['cumplidas'], fila['con_consultas']), (3, 0, 1))
+		self.assertEqual(fila['tasa_cumplimiento'], 0)
+		self.assertGreater(fila['tiempo_total_ms'], 0)
+		
+		response = self.client.delete('/api/mantenimiento-preventivo/estadisticas/')
+		self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+		response = self.client.get('/api/mantenimiento-preventivo/estadisticas/')
+		self.assertEqual(response.data['reglas'][0]['evaluaciones'], 0)
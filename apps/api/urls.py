@@ -15,6 +15,7 @@ router.register(r'users', views.UserViewSet, basename='user')
 router.register(r'mantenimiento-preventivo', views.MantenimientoPreventivoViewSet, basename='mantenimiento-preventivo')
 router.register(r'historial-mantenimiento', views.HistorialMantenimientoViewSet, basename='historial-mantenimiento')
 router.register(r'metricas-desempeno', views.MetricasDesempenoViewSet, basename='metricas-desempeno')
+router.register(r'exportaciones', views.TrabajoExportacionViewSet, basename='exportacion')
 
 urlpatterns = [
     # Endpoints básicos
@@ -31,6 +32,7 @@ urlpatterns = [
     
     # Endpoint público para ESP32 (sin autenticación JWT)
     path('esp32/telemetria', views.esp32_telemetria, name='esp32-telemetria'),
+    path('esp32/telemetria/batch', views.esp32_telemetria_batch, name='esp32-telemetria-batch'),
     
     # Incluir URLs de ViewSets (incluye automáticamente las rutas @action)
     path('', include(router.urls)),
@@ -1,6 +1,7 @@
 from django.shortcuts import render
 from rest_framework.decorators import api_view, permission_classes, action
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
 from rest_framework.reverse import reverse
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework import status
@@ -34,25 +35,41 @@ class openapi:
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate, login, logout
 from django.utils import timezone
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Q, Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.utils.dateparse import parse_date, parse_datetime
+from django.db.models.signals import post_save
 from django.conf import settings
+from datetime import datetime, timedelta
+import hashlib
 import logging
+import os
 from .serializers import (
     LoginSerializer, RegisterSerializer, UserSerializer, TokenSerializer,
     TelemetriaSerializer, CruceSerializer, SensorSerializer, 
     BarrierEventSerializer, AlertaSerializer, ESP32TelemetriaSerializer,
+    ESP32LecturaSerializer, ESP32TelemetriaBatchSerializer,
     UserNotificationSettingsSerializer,
     MantenimientoPreventivoSerializer, HistorialMantenimientoSerializer,
-    MetricasDesempenoSerializer
+    MetricasDesempenoSerializer, TrabajoExportacionSerializer
 )
 from .user_serializer import UserManagementSerializer, UserUpdateSerializer
 from .models import (
     Telemetria, Cruce, Sensor, BarrierEvent, Alerta, UserNotificationSettings, UserProfile,
-    MantenimientoPreventivo, HistorialMantenimiento, MetricasDesempeno
+    MantenimientoPreventivo, HistorialMantenimiento, MetricasDesempeno, TrabajoExportacion
 )
 from .permissions import IsAdmin, IsAdminOrMaintenance, IsObserverOrAbove, CanModifyCruces, CanModifyAlertas
 from django.contrib.auth.models import User
 from .security import log_security_event
+from .tareas import encolar as encolar_tarea
+from .exportacion import (
+    RENDERERS_EXPORTACION, COLUMNAS_TELEMETRIA, COLUMNAS_METRICAS, COLUMNAS_ALERTAS, CONTENT_TYPES,
+    FormatoNoDisponible, respuesta_exportacion, respuesta_archivo
+)
+from . import estado_actual, metricas_vivas, resumenes, archivo_telemetria
+from .mantenimiento_engine import evaluar_ingesta as evaluar_mantenimiento
 
 # Configurar logging
 logger = logging.getLogger(__name__)
@@ -97,6 +114,7 @@ def api_root(request, format=None):
         'cruces': reverse('api:cruce-list', request=request, format=format),
         'alertas': reverse('api:alerta-list', request=request, format=format),
         'esp32_telemetria': reverse('api:esp32-telemetria', request=request, format=format),
+        'esp32_telemetria_batch': reverse('api:esp32-telemetria-batch', request=request, format=format),
         'swagger': '/swagger/',
         'admin': '/admin/',
         'message': 'API de Monitoreo de Cruces Ferroviarios - Backend operativo'
@@ -206,6 +224,20 @@ def health_check(request, format=None):
             'message': f'Error: {str(e)}'
         }
     
+    # Cola del emisor Socket.IO de este proceso (backpressure)
+    try:
+        from .socketio_utils import emisor
+        metricas_emisor = emisor.metricas()
+        health_status['checks']['socketio_emisor'] = {
+            'status': 'ok' if metricas_emisor['profundidad'] < metricas_emisor['capacidad'] * 0.9 else 'warning',
+            **metricas_emisor
+        }
+    except Exception as e:
+        health_status['checks']['socketio_emisor'] = {
+            'status': 'unknown',
+            'message': f'Error: {str(e)}'
+        }
+    
     # Determinar código HTTP
     http_status = status.HTTP_200_OK
     if health_status['status'] == 'error':
@@ -625,6 +657,16 @@ def notification_settings_view(request):
                 }
             }
         ),
+        202: openapi.Response(
+            description="Telemetría insertada y procesamiento encolado (INGESTA_ASINCRONA)",
+            examples={
+                "application/json": {
+                    "status": "accepted",
+                    "message": "Datos recibidos, procesamiento en cola",
+                    "telemetria_id": 123
+                }
+            }
+        ),
         400: openapi.Response(
             description="Datos inválidos o token incorrecto",
             examples={
@@ -657,6 +699,9 @@ def esp32_telemetria(request):
     - sensor_1/2/3/4: Sensores adicionales (0-1023)
     - signal_strength: Fuerza de señal WiFi (RSSI)
     - temperature: Temperatura del gabinete
+    
+    Con INGESTA_ASINCRONA (por defecto) responde 202 tras insertar y encolar;
+    la detección de eventos y alertas la hace el worker procesar_tareas.
     """
     try:
         # Validar datos con serializer específico para ESP32
@@ -699,9 +744,33 @@ def esp32_telemetria(request):
             'sensor_4': serializer.validated_data.get('sensor_4'),
             'signal_strength': serializer.validated_data.get('signal_strength'),
             'temperature': serializer.validated_data.get('temperature'),
+            'barrier_status': estado_barrera(serializer.validated_data['barrier_voltage']),
         }
+        if serializer.validated_data.get('timestamp'):
+            telemetria_data['timestamp'] = serializer.validated_data['timestamp']
+        
+        if settings.INGESTA_ASINCRONA:
+            # Solo insertar y encolar: detección, alertas y notificaciones
+            # las procesa el worker (manage.py procesar_tareas)
+            with transaction.atomic():
+                telemetria = Telemetria.objects.bulk_create([Telemetria(**telemetria_data)])[0]
+                encolar_tarea('procesar_telemetria', {
+                    'telemetria_ids': [telemetria.id],
+                    'cruce_ids': [telemetria.cruce_id],
+                })
+            
+            return Response({
+                'status': 'accepted',
+                'message': 'Datos recibidos, procesamiento en cola',
+                'telemetria_id': telemetria.id,
+                'cruce': cruce.nombre,
+                'timestamp': telemetria.timestamp.isoformat()
+            }, status=status.HTTP_202_ACCEPTED)
         
         telemetria = Telemetria.objects.create(**telemetria_data)
+        estado_actual.registrar_telemetrias([telemetria])
+        metricas_vivas.registrar_telemetrias([telemetria])
+        evaluar_mantenimiento([telemetria])
         
         # Ejecutar lógica de negocio
         events_created = 0
@@ -709,12 +778,8 @@ def esp32_telemetria(request):
         
         # Detectar eventos de barrera
         try:
-            detect_barrier_event(telemetria)
-            # Contar eventos creados en los últimos segundos
-            events_created = BarrierEvent.objects.filter(
-                cruce=cruce,
-                event_time__gte=timezone.now() - timezone.timedelta(seconds=5)
-            ).count()
+            if detect_barrier_event(telemetria):
+                events_created = 1
         except Exception as e:
             logger.error(f"ESP32 - Error en detección de eventos: {str(e)}")
         
@@ -759,41 +824,230 @@ def esp32_telemetria(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@swagger_auto_schema(
+    method='post',
+    request_body=ESP32TelemetriaBatchSerializer,
+    operation_description="Endpoint público para gateways ESP32 - Enviar un lote de lecturas (uno o varios cruces)",
+    responses={
+        201: openapi.Response(
+            description="Lote procesado",
+            examples={
+                "application/json": {
+                    "status": "success",
+                    "message": "Lote recibido correctamente",
+                    "recibidas": 3,
+                    "insertadas": 2,
+                    "rechazadas": [{"indice": 2, "errores": {"battery_voltage": ["..."]}}],
+                    "events_created": 1,
+                    "alerts_created": 0
+                }
+            }
+        ),
+        202: openapi.Response(
+            description="Lote insertado y procesamiento encolado (INGESTA_ASINCRONA)"
+        ),
+        400: openapi.Response(
+            description="Token inválido, lote mal formado o ninguna lectura válida"
+        )
+    }
+)
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def esp32_telemetria_batch(request):
+    """
+    Endpoint público para gateways ESP32 - Enviar lotes de telemetría.
+    
+    Pensado para gateways que acumulan lecturas durante cortes de comunicación
+    y luego las reenvían todas juntas. Las lecturas válidas se insertan con
+    bulk_create y la detección de eventos/alertas se hace en una sola pasada.
+    
+    URL: POST /api/esp32/telemetria/batch
+    
+    Campos requeridos:
+    - esp32_token: Token de autenticación del ESP32
+    - lecturas: Lista de lecturas con el mismo formato de /api/esp32/telemetria
+      (sin token) y un campo opcional timestamp con la hora de la lectura
+    
+    Las lecturas inválidas o de cruces inexistentes/inactivos no detienen el lote:
+    se informan en 'rechazadas' con su índice.
+    
+    Con INGESTA_ASINCRONA (por defecto) responde 202 y encola una única tarea
+    con todas las lecturas insertadas.
+    """
+    try:
+        serializer = ESP32TelemetriaBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            logger.warning(f"ESP32 batch - Datos inválidos: {serializer.errors}")
+            return Response({
+                'status': 'error',
+                'message': 'Datos inválidos',
+                'details': serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        lecturas = serializer.validated_data['lecturas']
+        
+        # Validar cada lectura por separado
+        validas = []
+        rechazadas = []
+        for indice, lectura in enumerate(lecturas):
+            lectura_serializer = ESP32LecturaSerializer(data=lectura)
+            if lectura_serializer.is_valid():
+                validas.append((indice, lectura_serializer.validated_data))
+            else:
+                rechazadas.append({'indice': indice, 'errores': lectura_serializer.errors})
+        
+        # Validar todos los cruces del lote en una sola query
+        cruce_ids = {datos['cruce_id'] for _, datos in validas}
+        cruces = {
+            cruce.id: cruce
+            for cruce in Cruce.objects.filter(id__in=cruce_ids, estado='ACTIVO')
+        }
+        
+        telemetrias = []
+        for indice, datos in validas:
+            cruce = cruces.get(datos['cruce_id'])
+            if cruce is None:
+                rechazadas.append({
+                    'indice': indice,
+                    'errores': {'cruce_id': ['Cruce no encontrado o inactivo']}
+                })
+                continue
+            
+            telemetria = Telemetria(
+                cruce=cruce,
+                barrier_voltage=datos['barrier_voltage'],
+                battery_voltage=datos['battery_voltage'],
+                barrier_status=estado_barrera(datos['barrier_voltage']),
+                sensor_1=datos.get('sensor_1'),
+                sensor_2=datos.get('sensor_2'),
+                sensor_3=datos.get('sensor_3'),
+                sensor_4=datos.get('sensor_4'),
+                signal_strength=datos.get('signal_strength'),
+                temperature=datos.get('temperature'),
+            )
+            if datos.get('timestamp'):
+                telemetria.timestamp = datos['timestamp']
+            telemetrias.append(telemetria)
+        
+        rechazadas.sort(key=lambda r: r['indice'])
+        
+        if not telemetrias:
+            logger.warning(f"ESP32 batch - Ninguna lectura válida ({len(rechazadas)} rechazadas)")
+            return Response({
+                'status': 'error',
+                'message': 'Ninguna lectura válida en el lote',
+                'recibidas': len(lecturas),
+                'insertadas': 0,
+                'rechazadas': rechazadas
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if settings.INGESTA_ASINCRONA:
+            with transaction.atomic():
+                telemetrias = Telemetria.objects.bulk_create(telemetrias)
+                encolar_tarea('procesar_telemetria', {
+                    'telemetria_ids': [t.id for t in telemetrias],
+                    'cruce_ids': sorted({t.cruce_id for t in telemetrias}),
+                })
+            
+            logger.info(f"ESP32 batch - {len(telemetrias)} lecturas encoladas para {len(cruces)} cruces, "
+                       f"{len(rechazadas)} rechazadas")
+            
+            return Response({
+                'status': 'accepted',
+                'message': 'Lote recibido, procesamiento en cola',
+                'recibidas': len(lecturas),
+                'insertadas': len(telemetrias),
+                'rechazadas': rechazadas
+            }, status=status.HTTP_202_ACCEPTED)
+        
+        with transaction.atomic():
+            telemetrias = Telemetria.objects.bulk_create(telemetrias)
+            estado_actual.registrar_telemetrias(telemetrias)
+            metricas_vivas.registrar_telemetrias(telemetrias)
+            evaluar_mantenimiento(telemetrias)
+            eventos = detect_barrier_events_batch(telemetrias)
+            alertas = check_alerts_batch(telemetrias)
+        
+        # bulk_create no dispara post_save: notificar manualmente para que
+        # los receivers (Socket.IO, emails) se comporten igual que con create()
+        _notificar_lote(telemetrias, eventos, alertas)
+        
+        logger.info(f"ESP32 batch - {len(telemetrias)} lecturas insertadas para {len(cruces)} cruces, "
+                   f"{len(rechazadas)} rechazadas, {len(eventos)} eventos, {len(alertas)} alertas")
+        
+        return Response({
+            'status': 'success',
+            'message': 'Lote recibido correctamente',
+            'recibidas': len(lecturas),
+            'insertadas': len(telemetrias),
+            'rechazadas': rechazadas,
+            'events_created': len(eventos),
+            'alerts_created': len(alertas)
+        }, status=status.HTTP_201_CREATED)
+        
+    except Exception as e:
+        logger.error(f"ESP32 batch - Error interno: {str(e)}")
+        return Response({
+            'status': 'error',
+            'message': 'Error interno del servidor',
+            'details': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 # Lógica de negocio para detección de eventos y alertas
 
+# Voltaje de barrera sobre el cual se considera la barrera abajo
+UMBRAL_BARRERA_DOWN = 2.0
+
+# Ventana mínima entre eventos de barrera del mismo cruce (evitar duplicados)
+VENTANA_DUPLICADOS_BARRERA = timezone.timedelta(seconds=2)
+
+
+def estado_barrera(barrier_voltage):
+    """Estado de la barrera según voltaje: > 2.0V = DOWN, resto = UP"""
+    return 'DOWN' if barrier_voltage > UMBRAL_BARRERA_DOWN else 'UP'
+
+
 def detect_barrier_event(telemetria_instance):
     """
     Detecta cambios de estado de barrera basado en voltaje
     barrier_voltage > 2.0V = DOWN, < 2.0V = UP
+    
+    El último evento de cada cruce se lee de CruceEstadoActual (ver
+    estado_barrera.py), que solo se escribe cuando se crea un evento. Los
+    llamadores deben calcular barrier_status antes de insertar la telemetría;
+    si no viene, se calcula y guarda aquí por compatibilidad.
+    
+    Returns:
+        BarrierEvent creado o None
     """
+    from . import estado_barrera as cache_barrera
+    
     # Determinar estado actual basado en voltaje
-    current_status = 'DOWN' if telemetria_instance.barrier_voltage > 2.0 else 'UP'
+    current_status = estado_barrera(telemetria_instance.barrier_voltage)
     
-    # Actualizar el estado en la telemetría
-    telemetria_instance.barrier_status = current_status
-    telemetria_instance.save()
+    if telemetria_instance.barrier_status != current_status:
+        telemetria_instance.barrier_status = current_status
+        telemetria_instance.save(update_fields=['barrier_status'])
     
-    # Obtener el último evento de barrera para este cruce
-    last_event = BarrierEvent.objects.filter(
-        cruce=telemetria_instance.cruce
-    ).order_by('-event_time').first()
+    estado = cache_barrera.obtener_estado(telemetria_instance.cruce)
     
     # Si no hay eventos previos o el estado cambió, crear nuevo evento
-    if not last_event or last_event.state != current_status:
-        # Verificar que no haya eventos duplicados en menos de 2 segundos
-        recent_events = BarrierEvent.objects.filter(
-            cruce=telemetria_instance.cruce,
-            event_time__gte=timezone.now() - timezone.timedelta(seconds=2)
-        )
-        
-        if not recent_events.exists():
-            BarrierEvent.objects.create(
-                telemetria=telemetria_instance,
-                cruce=telemetria_instance.cruce,
-                state=current_status,
-                event_time=telemetria_instance.timestamp,
-                voltage_at_event=telemetria_instance.barrier_voltage
-            )
+    # (salvo que el último evento sea de hace menos de 2 segundos).
+    # El post_save del evento actualiza CruceEstadoActual.
+    ultimo_evento = estado['ultimo_evento']
+    if estado['ultimo_estado'] == current_status or (
+        ultimo_evento and telemetria_instance.timestamp - ultimo_evento < VENTANA_DUPLICADOS_BARRERA
+    ):
+        return None
+    
+    return BarrierEvent.objects.create(
+        telemetria=telemetria_instance,
+        cruce=telemetria_instance.cruce,
+        state=current_status,
+        event_time=telemetria_instance.timestamp,
+        voltage_at_event=telemetria_instance.barrier_voltage
+    )
 
 
 def check_alerts(telemetria_instance):
@@ -855,6 +1109,206 @@ def check_alerts(telemetria_instance):
     #     )
 
 
+def detect_barrier_events_batch(telemetrias):
+    """
+    Versión por lotes de detect_barrier_event.
+    
+    Recorre las lecturas de cada cruce en orden cronológico y crea los eventos
+    de cambio de estado con un único bulk_create. El último evento de cada cruce
+    se lee de CruceEstadoActual (sin query si viene cargado con las lecturas) y
+    se actualiza en la misma transacción, de modo que la siguiente tarea del
+    lote ya lo ve. La ventana anti-duplicados se mide contra la hora de cada
+    lectura, no contra la hora de recepción.
+    
+    Args:
+        telemetrias: Lista de Telemetria ya guardadas (con barrier_status calculado)
+    
+    Returns:
+        list: Eventos BarrierEvent creados
+    """
+    from . import estado_barrera as cache_barrera
+    
+    por_cruce = {}
+    for telemetria in telemetrias:
+        por_cruce.setdefault(telemetria.cruce_id, []).append(telemetria)
+    
+    # Estado previo de todos los cruces del lote
+    estados = cache_barrera.obtener_estados(lecturas[0].cruce for lecturas in por_cruce.values())
+    
+    eventos = []
+    for cruce_id, lecturas in por_cruce.items():
+        estado = estados[cruce_id]
+        ultimo_estado, ultimo_momento = estado['ultimo_estado'], estado['ultimo_evento']
+        for telemetria in sorted(lecturas, key=lambda t: t.timestamp):
+            current_status = telemetria.barrier_status or estado_barrera(telemetria.barrier_voltage)
+            if ultimo_estado == current_status:
+                continue
+            if ultimo_momento and telemetria.timestamp - ultimo_momento < VENTANA_DUPLICADOS_BARRERA:
+                continue
+            eventos.append(BarrierEvent(
+                telemetria=telemetria,
+                cruce=telemetria.cruce,
+                state=current_status,
+                event_time=telemetria.timestamp,
+                voltage_at_event=telemetria.barrier_voltage
+            ))
+            ultimo_estado = current_status
+            ultimo_momento = telemetria.timestamp
+    
+    if not eventos:
+        return []
+    eventos = BarrierEvent.objects.bulk_create(eventos)
+    cache_barrera.registrar_eventos(eventos)
+    return eventos
+
+
+def check_alerts_batch(telemetrias):
+    """
+    Versión por lotes de check_alerts.
+    
+    Aplica las mismas reglas que check_alerts sobre todas las lecturas y crea
+    las alertas con un único bulk_create. Como las lecturas acaban de insertarse
+    no puede existir una alerta previa ligada a ellas, así que no hace falta
+    el get_or_create de la versión individual. Las alertas activas de
+    CruceEstadoActual se recuentan una vez por cruce.
+    
+    Args:
+        telemetrias: Lista de Telemetria ya guardadas (con cruce cargado)
+    
+    Returns:
+        list: Alertas creadas
+    """
+    alertas = []
+    for telemetria in telemetrias:
+        cruce = telemetria.cruce
+        
+        if telemetria.battery_voltage < 11.0:
+            alertas.append(Alerta(
+                type='LOW_BATTERY',
+                severity='CRITICAL',
+                description=f'Batería baja en cruce {cruce.nombre}. '
+                            f'Voltaje actual: {telemetria.battery_voltage}V',
+                cruce=cruce,
+                telemetria=telemetria,
+                resolved=False
+            ))
+        
+        if telemetria.barrier_voltage < 20.0:
+            alertas.append(Alerta(
+                type='VOLTAGE_CRITICAL',
+                severity='CRITICAL',
+                description=f'Voltaje crítico del PLC en cruce {cruce.nombre}. '
+                            f'Voltaje actual: {telemetria.barrier_voltage}V',
+                cruce=cruce,
+                telemetria=telemetria,
+                resolved=False
+            ))
+        
+        if telemetria.sensor_1 and telemetria.sensor_1 > 500:
+            alertas.append(Alerta(
+                type='GABINETE_ABIERTO',
+                severity='WARNING',
+                description=f'Gabinete abierto en cruce {cruce.nombre}',
+                cruce=cruce,
+                telemetria=telemetria,
+                resolved=False
+            ))
+    
+    if not alertas:
+        return []
+    alertas = Alerta.objects.bulk_create(alertas)
+    estado_actual.registrar_alertas(alertas)
+    return alertas
+
+
+def _notificar_creados(model, instancias):
+    """Enviar post_save(created=True) para instancias creadas con bulk_create"""
+    for instancia in instancias:
+        post_save.send(
+            sender=model, instance=instancia, created=True,
+            update_fields=None, raw=False, using=instancia._state.db
+        )
+
+
+def _notificar_lote(telemetrias, eventos, alertas):
+    """
+    Notificar un lote de ingesta: un delta del dashboard por cruce y después
+    los post_save de cada instancia (Socket.IO, emails)
+    """
+    from . import dashboard_stream
+    
+    try:
+        dashboard_stream.publicar_lote(telemetrias, eventos, alertas)
+    except Exception as e:
+        logger.error(f"Error al publicar delta del dashboard: {str(e)}")
+    _notificar_creados(Telemetria, telemetrias)
+    _notificar_creados(BarrierEvent, eventos)
+    _notificar_creados(Alerta, alertas)
+
+
+# Filtros de listado (compartidos con las exportaciones en segundo plano)
+
+def filtrar_telemetria(params):
+    """Telemetría filtrada por cruce_id, fecha_desde y fecha_hasta"""
+    queryset = Telemetria.objects.all()
+    cruce_id = params.get('cruce_id', None)
+    fecha_desde = params.get('fecha_desde', None)
+    fecha_hasta = params.get('fecha_hasta', None)
+    
+    if cruce_id:
+        queryset = queryset.filter(cruce_id=cruce_id)
+    if fecha_desde:
+        queryset = queryset.filter(timestamp__gte=fecha_desde)
+    if fecha_hasta:
+        queryset = queryset.filter(timestamp__lte=fecha_hasta)
+    return queryset
+
+
+def telemetria_archivada(params, columnas):
+    """
+    Filas archivadas (archivar_telemetria) con los mismos filtros que
+    filtrar_telemetria, para completar las exportaciones
+    """
+    yield from archivo_telemetria.filas_archivadas(
+        columnas,
+        cruce_id=params.get('cruce_id', None),
+        desde=_parsear_momento(params.get('fecha_desde', None)),
+        hasta=_parsear_momento(params.get('fecha_hasta', None)),
+    )
+
+
+def filtrar_alertas(params):
+    """
+    Alertas filtradas por cruce_id, tipo, resuelta, severidad y rango de
+    fecha de creación (fecha_desde, fecha_hasta)
+    
+    Raises:
+        ValueError: Si fecha_desde o fecha_hasta no es una fecha válida
+    """
+    queryset = Alerta.objects.all()
+    cruce_id = params.get('cruce_id', None)
+    tipo = params.get('tipo', None)
+    resuelta = params.get('resuelta', None)
+    severidad = params.get('severidad', None)
+    fecha_desde = _parsear_momento(params.get('fecha_desde', None))
+    fecha_hasta = _parsear_momento(params.get('fecha_hasta', None))
+    
+    if cruce_id:
+        queryset = queryset.filter(cruce_id=cruce_id)
+    if tipo:
+        queryset = queryset.filter(type=tipo)
+    if resuelta is not None:
+        resuelta_bool = resuelta.lower() == 'true'
+        queryset = queryset.filter(resolved=resuelta_bool)
+    if severidad:
+        queryset = queryset.filter(severity=severidad)
+    if fecha_desde:
+        queryset = queryset.filter(created_at__gte=fecha_desde)
+    if fecha_hasta:
+        queryset = queryset.filter(created_at__lte=fecha_hasta)
+    return queryset
+
+
 # ViewSets para los modelos principales
 
 class CruceViewSet(ModelViewSet):
@@ -864,7 +1318,7 @@ class CruceViewSet(ModelViewSet):
     permission_classes = [IsAuthenticated, CanModifyCruces]
 
     def get_queryset(self):
-        queryset = Cruce.objects.all().order_by('nombre')  # Ordenar por nombre para evitar advertencia de paginación
+        queryset = Cruce.objects.con_resumen().order_by('nombre')  # Ordenar por nombre para evitar advertencia de paginación
         estado = self.request.query_params.get('estado', None)
         if estado:
             queryset = queryset.filter(estado=estado)
@@ -877,10 +1331,10 @@ class CruceViewSet(ModelViewSet):
         instance = self.get_object()
         
         # Optimización: Usar select_related y prefetch_related para evitar N+1 queries
-        # Obtener telemetría más reciente
-        telemetria_actual = Telemetria.objects.filter(
-            cruce=instance
-        ).select_related('cruce').order_by('-timestamp').first()
+        # Telemetría más reciente (tabla CruceEstadoActual)
+        telemetria_actual = estado_actual.obtener(instance)
+        if telemetria_actual and not telemetria_actual.tiene_telemetria:
+            telemetria_actual = None
         
         # Obtener últimas 10 telemetrías para historial
         telemetrias_recientes = Telemetria.objects.filter(
@@ -942,7 +1396,7 @@ class CruceViewSet(ModelViewSet):
         # Agregar telemetría actual si existe
         if telemetria_actual:
             cruce_data['telemetria_actual'] = {
-                'id': telemetria_actual.id,
+                'id': telemetria_actual.telemetria_id,
                 'timestamp': telemetria_actual.timestamp.isoformat(),
                 'barrier_voltage': telemetria_actual.barrier_voltage,
                 'battery_voltage': telemetria_actual.battery_voltage,
@@ -1004,105 +1458,57 @@ class CruceViewSet(ModelViewSet):
         Endpoint para dashboard que muestra resumen de todos los cruces
         con su telemetría actual y alertas activas
         """
-        # Optimización: Prefetch telemetría y alertas para evitar N+1 queries
-        from django.db.models import Prefetch, OuterRef, Subquery
-        
-        # Subquery para obtener la telemetría más reciente de cada cruce
-        latest_telemetria = Telemetria.objects.filter(
-            cruce=OuterRef('pk')
-        ).order_by('-timestamp')[:1]
-        
-        # Prefetch alertas activas
-        alertas_prefetch = Prefetch(
-            'alertas',
-            queryset=Alerta.objects.filter(resolved=False).order_by('-created_at'),
-            to_attr='alertas_activas_list'
-        )
-        
-        # Prefetch eventos recientes
-        eventos_prefetch = Prefetch(
-            'barrier_events',
-            queryset=BarrierEvent.objects.order_by('-event_time')[:1],
-            to_attr='ultimo_evento_list'
-        )
+        # Mismo contenido que el snapshot del canal Socket.IO 'dashboard'
+        from .dashboard_stream import construir_dashboard
         
-        cruces = Cruce.objects.prefetch_related(
-            alertas_prefetch,
-            eventos_prefetch
-        ).annotate(
-            latest_telemetria_id=Subquery(latest_telemetria.values('id')[:1])
-        )
-        
-        # Obtener todas las telemetrías más recientes en una sola query
-        telemetria_ids = [c.latest_telemetria_id for c in cruces if c.latest_telemetria_id]
-        telemetrias_dict = {
-            t.id: t for t in Telemetria.objects.filter(id__in=telemetria_ids).select_related('cruce')
-        }
-        
-        dashboard_data = []
-        
-        for cruce in cruces:
-            # Obtener telemetría más reciente del diccionario
-            telemetria_actual = telemetrias_dict.get(cruce.latest_telemetria_id) if cruce.latest_telemetria_id else None
-            
-            # Contar alertas activas (ya prefetched)
-            alertas_activas = len(cruce.alertas_activas_list) if hasattr(cruce, 'alertas_activas_list') else 0
-            
-            # Obtener último evento (ya prefetched)
-            ultimo_evento = cruce.ultimo_evento_list[0] if hasattr(cruce, 'ultimo_evento_list') and cruce.ultimo_evento_list else None
-            
-            cruce_data = {
-                'id': cruce.id,
-                'nombre': cruce.nombre,
-                'ubicacion': cruce.ubicacion,
-                'estado': cruce.estado,
-                'telemetria_actual': None,
-                'alertas_activas': alertas_activas,
-                'ultimo_evento': ultimo_evento.event_time.isoformat() if ultimo_evento else None
-            }
-            
-            # Agregar telemetría actual si existe
-            if telemetria_actual:
-                cruce_data['telemetria_actual'] = {
-                    'barrier_voltage': telemetria_actual.barrier_voltage,
-                    'battery_voltage': telemetria_actual.battery_voltage,
-                    'barrier_status': telemetria_actual.barrier_status,
-                    'sensor_1': telemetria_actual.sensor_1,
-                    'sensor_2': telemetria_actual.sensor_2,
-                    'timestamp': telemetria_actual.timestamp.isoformat()
-                }
-            
-            dashboard_data.append(cruce_data)
-        
-        return Response({
-            'cruces': dashboard_data,
-            'total_cruces': len(dashboard_data),
-            'cruces_activos': len([c for c in dashboard_data if c['estado'] == 'ACTIVO']),
-            'total_alertas_activas': sum(c['alertas_activas'] for c in dashboard_data)
-        })
+        return Response(construir_dashboard())
 
     @action(detail=False, methods=['get'], url_path='mapa')
     def mapa(self, request):
         """
         Endpoint para obtener coordenadas de todos los cruces para el mapa
+        
+        Responde con ETag/Last-Modified; si el mapa no cambió desde la versión
+        que tiene el cliente (If-None-Match / If-Modified-Since) devuelve 304.
+        Siempre son dos queries, sin importar el número de cruces.
         """
         cruces = Cruce.objects.filter(
             coordenadas_lat__isnull=False,
             coordenadas_lng__isnull=False
-        ).values('id', 'nombre', 'ubicacion', 'estado', 'coordenadas_lat', 'coordenadas_lng')
+        )
+        
+        # Versión del mapa: cambia al crear/borrar/editar un cruce o al
+        # actualizarse su estado actual (telemetría, eventos, alertas)
+        version = cruces.aggregate(
+            total=Count('id'),
+            max_id=Max('id'),
+            cruces_modificados=Max('updated_at'),
+            estados_modificados=Max('estado_actual__updated_at')
+        )
+        modificados = [m for m in (version['cruces_modificados'], version['estados_modificados']) if m]
+        last_modified = max(modificados) if modificados else None
+        etag = quote_etag(hashlib.md5(
+            f"{version['total']}-{version['max_id']}-{version['cruces_modificados']}-{version['estados_modificados']}".encode()
+        ).hexdigest())
+        
+        no_modificado = get_conditional_response(
+            request,
+            etag=etag,
+            last_modified=int(last_modified.timestamp()) if last_modified else None
+        )
+        if no_modificado is not None:
+            return no_modificado
+        
+        # Telemetría y alertas activas desde CruceEstadoActual (una sola query)
+        cruces = cruces.values(
+            'id', 'nombre', 'ubicacion', 'estado', 'coordenadas_lat', 'coordenadas_lng',
+            'estado_actual__timestamp', 'estado_actual__battery_voltage',
+            'estado_actual__barrier_status', 'estado_actual__alertas_activas'
+        )
         
         mapa_data = []
         for cruce in cruces:
-            # Obtener telemetría más reciente para mostrar estado
-            telemetria_actual = Telemetria.objects.filter(
-                cruce_id=cruce['id']
-            ).order_by('-timestamp').first()
-            
-            # Contar alertas activas
-            alertas_activas = Alerta.objects.filter(
-                cruce_id=cruce['id'],
-                resolved=False
-            ).count()
+            timestamp = cruce['estado_actual__timestamp']
             
             mapa_data.append({
                 'id': cruce['id'],
@@ -1114,17 +1520,21 @@ class CruceViewSet(ModelViewSet):
                     'lng': float(cruce['coordenadas_lng'])
                 },
                 'telemetria_actual': {
-                    'battery_voltage': telemetria_actual.battery_voltage if telemetria_actual else None,
-                    'barrier_status': telemetria_actual.barrier_status if telemetria_actual else None,
-                    'timestamp': telemetria_actual.timestamp.isoformat() if telemetria_actual else None
-                } if telemetria_actual else None,
-                'alertas_activas': alertas_activas
+                    'battery_voltage': cruce['estado_actual__battery_voltage'],
+                    'barrier_status': cruce['estado_actual__barrier_status'],
+                    'timestamp': timestamp.isoformat()
+                } if timestamp else None,
+                'alertas_activas': cruce['estado_actual__alertas_activas'] or 0
             })
         
-        return Response({
+        response = Response({
             'cruces': mapa_data,
             'total_cruces': len(mapa_data)
         })
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified.timestamp())
+        return response
 
 
 class SensorViewSet(ModelViewSet):
@@ -1170,71 +1580,107 @@ class TelemetriaViewSet(ModelViewSet):
         return [IsAuthenticated(), IsObserverOrAbove()]
 
     def get_queryset(self):
-        queryset = Telemetria.objects.all()
-        cruce_id = self.request.query_params.get('cruce_id', None)
-        fecha_desde = self.request.query_params.get('fecha_desde', None)
-        fecha_hasta = self.request.query_params.get('fecha_hasta', None)
-        
-        if cruce_id:
-            queryset = queryset.filter(cruce_id=cruce_id)
-        if fecha_desde:
-            queryset = queryset.filter(timestamp__gte=fecha_desde)
-        if fecha_hasta:
-            queryset = queryset.filter(timestamp__lte=fecha_hasta)
-        return queryset
+        return filtrar_telemetria(self.request.query_params)
 
     def create(self, request, *args, **kwargs):
         """Crear telemetría con detección automática de eventos y alertas"""
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        telemetria = serializer.save()
+        telemetria = serializer.save(
+            barrier_status=estado_barrera(serializer.validated_data['barrier_voltage'])
+        )
         
         # Ejecutar lógica de negocio
+        estado_actual.registrar_telemetrias([telemetria])
+        metricas_vivas.registrar_telemetrias([telemetria])
+        evaluar_mantenimiento([telemetria])
         detect_barrier_event(telemetria)
         check_alerts(telemetria)
         
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     
-    @action(detail=False, methods=['get'])
+    @action(detail=False, methods=['get'], renderer_classes=RENDERERS_EXPORTACION)
     def exportar(self, request):
-        """Exportar telemetría a CSV"""
-        from django.http import HttpResponse
-        import csv
-        
-        queryset = self.get_queryset()
-        
-        # Limitar a 10000 registros para evitar problemas de memoria
-        if queryset.count() > 10000:
-            queryset = queryset[:10000]
-        
-        # Crear respuesta CSV
-        response = HttpResponse(content_type='text/csv; charset=utf-8')
-        response['Content-Disposition'] = 'attachment; filename="telemetria_export.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow([
-            'ID', 'Cruce', 'Fecha', 'Voltaje Barrera (V)', 'Voltaje Batería (V)',
-            'Sensor 1', 'Sensor 2', 'Sensor 3', 'Sensor 4',
-            'Estado Barrera', 'Señal WiFi (dBm)', 'Temperatura (°C)'
-        ])
-        
-        for telemetria in queryset:
-            writer.writerow([
-                telemetria.id,
-                telemetria.cruce.nombre,
-                telemetria.timestamp.isoformat(),
-                telemetria.barrier_voltage,
-                telemetria.battery_voltage,
-                telemetria.sensor_1 or '',
-                telemetria.sensor_2 or '',
-                telemetria.sensor_3 or '',
-                telemetria.sensor_4 or '',
-                telemetria.barrier_status or '',
-                telemetria.signal_strength or '',
-                telemetria.temperature or ''
-            ])
+        """
+        Exportar telemetría (streaming, sin límite de filas)
         
-        return response
+        Formato con ?format=csv (por defecto), parquet o arrow. Acepta los
+        mismos filtros que el listado (cruce_id, fecha_desde, fecha_hasta).
+        Incluye al final la telemetría archivada del rango.
+        """
+        try:
+            return respuesta_exportacion(
+                request.accepted_renderer.format, 'telemetria_export',
+                self.get_queryset(), COLUMNAS_TELEMETRIA,
+                telemetria_archivada(request.query_params, COLUMNAS_TELEMETRIA)
+            )
+        except FormatoNoDisponible as e:
+            return Response({'error': str(e)}, status=status.HTTP_406_NOT_ACCEPTABLE)
+    
+    @action(detail=False, methods=['get'])
+    def series(self, request):
+        """
+        Serie temporal de un cruce para gráficos
+        
+        Parámetros: cruce_id (obligatorio), fecha_desde y fecha_hasta (por
+        defecto las últimas 24 horas) y resolucion: auto (por defecto), raw,
+        minuto u hora. En auto, hasta 3 horas se devuelven lecturas crudas,
+        hasta 2 días intervalos de un minuto y, más allá, de una hora. raw
+        forzado admite hasta 3 horas y SERIES_MAX_PUNTOS_RAW lecturas (400).
+        """
+        cruce_id = request.query_params.get('cruce_id')
+        if not cruce_id:
+            return Response({'error': 'cruce_id es obligatorio'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            cruce_id = int(cruce_id)
+        except ValueError:
+            return Response({'error': 'cruce_id debe ser un entero'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        resolucion = request.query_params.get('resolucion', 'auto')
+        if resolucion not in ('auto', 'raw', *resumenes.INTERVALOS):
+            return Response(
+                {'error': f'resolucion inválida: {resolucion} (auto, raw, minuto u hora)'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            hasta = _parsear_momento(request.query_params.get('fecha_hasta'), fin_del_dia=True) or timezone.now()
+            desde = _parsear_momento(request.query_params.get('fecha_desde')) or hasta - timedelta(hours=24)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if desde > hasta:
+            return Response({'error': 'fecha_desde debe ser anterior a fecha_hasta'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            resolucion, puntos = resumenes.serie(cruce_id, desde, hasta, resolucion)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'cruce_id': cruce_id,
+            'resolucion': resolucion,
+            'fecha_desde': desde,
+            'fecha_hasta': hasta,
+            'total_puntos': len(puntos),
+            'puntos': puntos,
+        })
+
+
+def _parsear_momento(valor, fin_del_dia=False):
+    """
+    Fecha/hora ISO de un parámetro (una fecha sola es el inicio o el fin del
+    día). None si no se indicó.
+    """
+    if not valor:
+        return None
+    momento = parse_datetime(valor)
+    if momento is None:
+        fecha = parse_date(valor)
+        if fecha is None:
+            raise ValueError(f'Fecha inválida: {valor}')
+        momento = datetime.combine(fecha, datetime.max.time() if fin_del_dia else datetime.min.time())
+    if timezone.is_naive(momento):
+        momento = timezone.make_aware(momento)
+    return momento
 
 
 class BarrierEventViewSet(ModelViewSet):
@@ -1273,55 +1719,28 @@ class AlertaViewSet(ModelViewSet):
     serializer_class = AlertaSerializer
     permission_classes = [IsAuthenticated, CanModifyAlertas]
     
-    @action(detail=False, methods=['get'])
+    @action(detail=False, methods=['get'], renderer_classes=RENDERERS_EXPORTACION)
     def exportar(self, request):
-        """Exportar alertas a CSV"""
-        from django.http import HttpResponse
-        import csv
-        
-        queryset = self.get_queryset()
-        
-        # Crear respuesta CSV
-        response = HttpResponse(content_type='text/csv; charset=utf-8')
-        response['Content-Disposition'] = 'attachment; filename="alertas_export.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow([
-            'ID', 'Tipo', 'Severidad', 'Cruce', 'Descripción',
-            'Resuelta', 'Fecha Creación', 'Fecha Resolución'
-        ])
-        
-        for alerta in queryset:
-            writer.writerow([
-                alerta.id,
-                alerta.get_type_display(),
-                alerta.get_severity_display(),
-                alerta.cruce.nombre,
-                alerta.description,
-                'Sí' if alerta.resolved else 'No',
-                alerta.created_at.isoformat(),
-                alerta.resolved_at.isoformat() if alerta.resolved_at else ''
-            ])
+        """
+        Exportar alertas (streaming, memoria constante)
         
-        return response
+        Formato con ?format=csv (por defecto), parquet o arrow. Acepta los
+        mismos filtros que el listado (cruce_id, tipo, resuelta, severidad,
+        fecha_desde, fecha_hasta).
+        """
+        try:
+            return respuesta_exportacion(
+                request.accepted_renderer.format, 'alertas_export',
+                self.get_queryset(), COLUMNAS_ALERTAS
+            )
+        except FormatoNoDisponible as e:
+            return Response({'error': str(e)}, status=status.HTTP_406_NOT_ACCEPTABLE)
 
     def get_queryset(self):
-        queryset = Alerta.objects.all()
-        cruce_id = self.request.query_params.get('cruce_id', None)
-        tipo = self.request.query_params.get('tipo', None)
-        resuelta = self.request.query_params.get('resuelta', None)
-        severidad = self.request.query_params.get('severidad', None)
-        
-        if cruce_id:
-            queryset = queryset.filter(cruce_id=cruce_id)
-        if tipo:
-            queryset = queryset.filter(type=tipo)
-        if resuelta is not None:
-            resuelta_bool = resuelta.lower() == 'true'
-            queryset = queryset.filter(resolved=resuelta_bool)
-        if severidad:
-            queryset = queryset.filter(severity=severidad)
-        return queryset
+        try:
+            return filtrar_alertas(self.request.query_params)
+        except ValueError as e:
+            raise ValidationError({'error': str(e)})
 
     @action(detail=False, methods=['get'], url_path='dashboard')
     def dashboard(self, request):
@@ -1607,6 +2026,39 @@ class MantenimientoPreventivoViewSet(ModelViewSet):
 			queryset = queryset.filter(activo=activo_bool)
 		
 		return queryset.order_by('-prioridad', 'nombre')
+	
+	@action(detail=False, methods=['get', 'delete'])
+	def estadisticas(self, request):
+		"""
+		Costo y tasa de cumplimiento de la evaluación de cada regla, de la más
+		cara a la más barata (DELETE reinicia los contadores)
+		"""
+		from .mantenimiento_engine import estadisticas_reglas
+		
+		reglas = list(self.get_queryset().values('id', 'nombre', 'activo'))
+		regla_ids = [regla['id'] for regla in reglas]
+		
+		if request.method == 'DELETE':
+			estadisticas_reglas.reiniciar(regla_ids)
+			return Response(status=status.HTTP_204_NO_CONTENT)
+		
+		contadores = estadisticas_reglas.obtener(regla_ids)
+		resultado = []
+		for regla in reglas:
+			c = contadores[regla['id']]
+			evaluaciones = c['evaluaciones']
+			resultado.append({
+				**regla,
+				'evaluaciones': evaluaciones,
+				'cumplidas': c['cumplidas'],
+				'tasa_cumplimiento': round(c['cumplidas'] / evaluaciones * 100, 2) if evaluaciones else None,
+				'con_consultas': c['con_consultas'],
+				'tiempo_total_ms': round(c['microsegundos'] / 1000, 3),
+				'tiempo_promedio_ms': round(c['microsegundos'] / 1000 / evaluaciones, 3) if evaluaciones else None,
+			})
+		resultado.sort(key=lambda fila: fila['tiempo_total_ms'], reverse=True)
+		
+		return Response({'reglas': resultado})
 
 
 class HistorialMantenimientoViewSet(ModelViewSet):
@@ -1674,20 +2126,7 @@ class HistorialMantenimientoViewSet(ModelViewSet):
 			}, status=status.HTTP_400_BAD_REQUEST)
 		
 		# Obtener métricas después del mantenimiento
-		ultima_telemetria = Telemetria.objects.filter(
-			cruce=mantenimiento.cruce
-		).order_by('-timestamp').first()
-		
-		metricas_despues = {}
-		if ultima_telemetria:
-			metricas_despues = {
-				'battery_voltage': ultima_telemetria.battery_voltage,
-				'barrier_voltage': ultima_telemetria.barrier_voltage,
-				'barrier_status': ultima_telemetria.barrier_status,
-				'signal_strength': ultima_telemetria.signal_strength,
-				'temperature': ultima_telemetria.temperature,
-				'timestamp': ultima_telemetria.timestamp.isoformat(),
-			}
+		metricas_despues = estado_actual.metricas_actuales(mantenimiento.cruce)
 		
 		mantenimiento.estado = 'COMPLETADO'
 		mantenimiento.fecha_fin = timezone.now()
@@ -1731,6 +2170,36 @@ class MetricasDesempenoViewSet(ModelViewSet):
 			return [IsAuthenticated(), IsAdmin()]
 		return [IsAuthenticated(), IsObserverOrAbove()]
 	
+	@action(detail=False, methods=['get'], renderer_classes=RENDERERS_EXPORTACION)
+	def exportar(self, request):
+		"""
+		Exportar métricas (streaming)
+		
+		Formato con ?format=csv (por defecto), parquet o arrow. Acepta los
+		mismos filtros que el listado (cruce, fecha_desde, fecha_hasta).
+		"""
+		try:
+			return respuesta_exportacion(
+				request.accepted_renderer.format, 'metricas_export',
+				self.get_queryset(), COLUMNAS_METRICAS
+			)
+		except FormatoNoDisponible as e:
+			return Response({'error': str(e)}, status=status.HTTP_406_NOT_ACCEPTABLE)
+	
+	@action(detail=False, methods=['get'])
+	def hoy(self, request):
+		"""
+		Métricas parciales del día en curso (?cruce= opcional)
+		
+		Se calculan con los acumulados de la ingesta, sin recorrer la
+		telemetría; el último hueco se cuenta hasta ahora.
+		"""
+		try:
+			metricas = metricas_vivas.metricas_hoy(request.query_params.get('cruce'))
+		except ValueError:
+			return Response({'error': 'cruce debe ser un entero'}, status=status.HTTP_400_BAD_REQUEST)
+		return Response(self.get_serializer(metricas, many=True).data)
+	
 	@action(detail=False, methods=['get'])
 	def resumen(self, request):
 		"""Obtener resumen de métricas"""
@@ -1763,3 +2232,65 @@ class MetricasDesempenoViewSet(ModelViewSet):
 				'fecha_hasta': fecha_hasta,
 			}
 		})
+
+
+class TrabajoExportacionViewSet(ModelViewSet):
+	"""
+	Exportaciones en segundo plano.
+	
+	POST crea el trabajo (tipo, formato, filtros) y responde 202; el worker
+	procesar_tareas genera el archivo. El cliente consulta el estado y, cuando
+	está COMPLETADO, descarga con GET .../descargar/ (admite Range para
+	reanudar descargas).
+	"""
+	serializer_class = TrabajoExportacionSerializer
+	permission_classes = [IsAuthenticated, IsObserverOrAbove]
+	http_method_names = ['get', 'post', 'delete', 'head', 'options']
+	
+	def get_queryset(self):
+		"""Cada usuario ve sus exportaciones; el admin, todas"""
+		queryset = TrabajoExportacion.objects.all()
+		profile = getattr(self.request.user, 'profile', None)
+		if not (profile and profile.is_admin()):
+			queryset = queryset.filter(usuario=self.request.user)
+		return queryset
+	
+	def create(self, request, *args, **kwargs):
+		response = super().create(request, *args, **kwargs)
+		response.status_code = status.HTTP_202_ACCEPTED
+		return response
+	
+	def perform_create(self, serializer):
+		with transaction.atomic():
+			trabajo = serializer.save(usuario=self.request.user)
+			encolar_tarea('generar_exportacion', {'trabajo_id': trabajo.id})
+	
+	def perform_destroy(self, instance):
+		"""Eliminar también el archivo generado"""
+		if instance.archivo and os.path.exists(instance.archivo):
+			os.remove(instance.archivo)
+		instance.delete()
+	
+	@action(detail=True, methods=['get'])
+	def descargar(self, request, pk=None):
+		"""Descargar el archivo (200 completo, 206 con Range, 416 fuera de rango)"""
+		trabajo = self.get_object()
+		
+		if trabajo.estado != 'COMPLETADO':
+			return Response({
+				'error': f'La exportación no está lista ({trabajo.get_estado_display()})',
+				'estado': trabajo.estado
+			}, status=status.HTTP_409_CONFLICT)
+		
+		if not os.path.exists(trabajo.archivo):
+			return Response({
+				'error': 'El archivo de la exportación ya no existe'
+			}, status=status.HTTP_410_GONE)
+		
+		if trabajo.archivo.endswith('.gz'):
+			content_type = 'application/gzip'
+		else:
+			content_type = CONTENT_TYPES[trabajo.formato]
+		etag = f'"exportacion-{trabajo.id}-{trabajo.tamano_bytes}-{int(trabajo.completado_at.timestamp())}"'
+		
+		return respuesta_archivo(request, trabajo.archivo, trabajo.nombre_descarga, content_type, etag)
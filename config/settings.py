@@ -283,6 +283,57 @@ if not ESP32_TOKEN:
 	else:
 		raise ValueError('ESP32_TOKEN debe estar configurada en variables de entorno para producción')
 
+# Máximo de lecturas aceptadas por request en /api/esp32/telemetria/batch
+ESP32_BATCH_MAX_LECTURAS = int(os.getenv('ESP32_BATCH_MAX_LECTURAS', '500'))
+
+# Ingesta asíncrona: los endpoints ESP32 solo insertan y encolan, y el
+# comando procesar_tareas ejecuta detección de eventos, alertas y notificaciones
+INGESTA_ASINCRONA = os.getenv('INGESTA_ASINCRONA', 'True').lower() == 'true'
+TAREAS_MAX_INTENTOS = int(os.getenv('TAREAS_MAX_INTENTOS', '5'))
+TAREAS_REINTENTO_BASE_SEGUNDOS = int(os.getenv('TAREAS_REINTENTO_BASE_SEGUNDOS', '5'))
+# Reserva de las tareas largas (exportaciones) que se ejecutan fuera de la
+# transacción del lote: si el worker muere, se reintentan al vencer
+TAREAS_RESERVA_SEGUNDOS = int(os.getenv('TAREAS_RESERVA_SEGUNDOS', '3600'))
+
+# Exportaciones: filas leídas por vuelta del cursor del servidor
+EXPORTACION_CHUNK_SIZE = int(os.getenv('EXPORTACION_CHUNK_SIZE', '2000'))
+# Directorio de los archivos de exportaciones en segundo plano
+EXPORTACIONES_DIR = os.getenv('EXPORTACIONES_DIR', os.path.join(BASE_DIR, 'exportaciones'))
+
+# Segundos entre volcados de los acumuladores de métricas del día en curso
+METRICAS_VIVAS_INTERVALO = float(os.getenv('METRICAS_VIVAS_INTERVALO', '30'))
+# Ids de telemetría anteriores a la marca que resumir_telemetria vuelve a
+# revisar (lecturas de transacciones confirmadas después de la corrida anterior)
+RESUMEN_SOLAPE_IDS = int(os.getenv('RESUMEN_SOLAPE_IDS', '5000'))
+# Lecturas máximas de /api/telemetria/series/ con resolucion=raw
+SERIES_MAX_PUNTOS_RAW = int(os.getenv('SERIES_MAX_PUNTOS_RAW', '10000'))
+
+# Archivo de telemetría cruda (archivar_telemetria): antigüedad mínima y directorio
+TELEMETRIA_RETENCION_DIAS = int(os.getenv('TELEMETRIA_RETENCION_DIAS', '90'))
+ARCHIVO_TELEMETRIA_DIR = os.getenv('ARCHIVO_TELEMETRIA_DIR', os.path.join(BASE_DIR, 'archivo_telemetria'))
+
+# Segundos entre consultas del motor de mantenimiento a la versión de las reglas
+# en la cache (demora máxima para ver en otros procesos una regla modificada)
+REGLAS_MANTENIMIENTO_VERIFICACION = float(os.getenv('REGLAS_MANTENIMIENTO_VERIFICACION', '5'))
+# Evaluación de reglas en la ingesta: segundos mínimos entre evaluaciones de
+# un mismo cruce (0 = cada lectura) y tiempo máximo por lectura en milisegundos
+MANTENIMIENTO_ENFRIAMIENTO = float(os.getenv('MANTENIMIENTO_ENFRIAMIENTO', '60'))
+MANTENIMIENTO_PRESUPUESTO_MS = float(os.getenv('MANTENIMIENTO_PRESUPUESTO_MS', '50'))
+# Segundos entre volcados a la cache de las estadísticas de evaluación por regla
+MANTENIMIENTO_ESTADISTICAS_INTERVALO = float(os.getenv('MANTENIMIENTO_ESTADISTICAS_INTERVALO', '30'))
+
+# Cache de Django (rate limiting, enfriamiento y reglas de mantenimiento,
+# estado enviado al dashboard, etc.). Debe ser compartida entre los workers de
+# gunicorn y procesar_tareas y no costar queries a la BD: por defecto Redis en
+# CACHE_LOCATION. LocMemCache (CACHE_BACKEND=django.core.cache.backends.locmem.LocMemCache)
+# es por proceso: solo para desarrollo y tests con un único proceso.
+CACHES = {
+	'default': {
+		'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.redis.RedisCache'),
+		'LOCATION': os.getenv('CACHE_LOCATION', 'redis://127.0.0.1:6379/1'),
+	}
+}
+
 # Configuración de Socket.IO
 SOCKETIO_CORS_ALLOWED_ORIGINS = CORS_ALLOWED_ORIGINS
 SOCKETIO_CORS_CREDENTIALS = True
@@ -292,6 +343,21 @@ SOCKETIO_MAX_HTTP_BUFFER_SIZE = 1e6  # 1MB
 SOCKETIO_ALLOW_UPGRADES = True
 SOCKETIO_TRANSPORTS = ['websocket', 'polling']
 
+# Client manager para repartir emits entre workers/procesos:
+# 'postgres' (LISTEN/NOTIFY sobre la BD), 'local' (en memoria, tests) o '' (un solo proceso)
+SOCKETIO_CLIENT_MANAGER = os.getenv('SOCKETIO_CLIENT_MANAGER', 'postgres')
+SOCKETIO_CHANNEL = os.getenv('SOCKETIO_CHANNEL', 'socketio')
+
+# Cola del emisor de eventos desde Django (un thread + event loop por proceso)
+# Política cuando la cola está llena: drop_oldest (descarta la más antigua) o drop_newest
+SOCKETIO_EMIT_QUEUE_SIZE = int(os.getenv('SOCKETIO_EMIT_QUEUE_SIZE', '10000'))
+SOCKETIO_EMIT_QUEUE_POLICY = os.getenv('SOCKETIO_EMIT_QUEUE_POLICY', 'drop_oldest')
+
+# Telemetría agrupada: un frame 'telemetria_batch' por sala cada N ms.
+# SOCKETIO_TELEMETRIA_LEGACY=True mantiene además new_telemetria/telemetria por lectura
+SOCKETIO_TELEMETRIA_VENTANA_MS = int(os.getenv('SOCKETIO_TELEMETRIA_VENTANA_MS', '250'))
+SOCKETIO_TELEMETRIA_LEGACY = os.getenv('SOCKETIO_TELEMETRIA_LEGACY', 'False').lower() == 'true'
+
 # Rate limiting para Socket.IO
 # En desarrollo: límites más altos para pruebas
 # En producción: usar variables de entorno con límites más restrictivos
@@ -17,10 +17,7 @@ python manage.py migrate --noinput
 echo "Recolectando archivos estáticos..."
 python manage.py collectstatic --noinput --clear
 
-# Iniciar Uvicorn (para ASGI + Socket.IO)
-echo "Iniciando Uvicorn (ASGI + Socket.IO) en puerto 8500..."
-exec uvicorn config.asgi:application \
-    --host 0.0.0.0 \
-    --port 8500 \
-    --log-level info \
-    --access-log
\ No newline at end of file
+# Uvicorn (ASGI + Socket.IO en el puerto 8500) y los workers de la cola bajo
+# supervisord, que los reinicia si terminan (ver supervisord.conf)
+echo "Iniciando Uvicorn y workers de tareas (supervisord)..."
+exec supervisord -c /app/supervisord.conf
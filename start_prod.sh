@@ -24,7 +24,7 @@ fi
 
 # Matar procesos anteriores
 echo "🔄 Deteniendo servidores anteriores..."
-pkill -f "uvicorn|gunicorn|runserver" 2>/dev/null || true
+pkill -f "uvicorn|gunicorn|runserver|procesar_tareas" 2>/dev/null || true
 sleep 2
 
 # Verificar que no hay procesos en el puerto 8000
@@ -53,6 +53,14 @@ python manage.py collectstatic --noinput --clear
 echo "🔄 Aplicando migraciones..."
 python manage.py migrate --noinput
 
+# Worker de la cola de ingesta (detección de eventos, alertas, notificaciones)
+echo "⚙️  Iniciando worker de tareas..."
+nohup python manage.py procesar_tareas --excluir-tipos generar_exportacion >> logs/tareas.log 2>&1 &
+
+# Worker de exportaciones (aparte, para no demorar la ingesta)
+echo "⚙️  Iniciando worker de exportaciones..."
+nohup python manage.py procesar_tareas --tipos generar_exportacion --lote 1 --intervalo 2 >> logs/exportaciones.log 2>&1 &
+
 # Calcular número de workers
 CPU_CORES=$(nproc)
 WORKERS=$((2 * CPU_CORES + 1))